@@ -11,48 +11,591 @@ ACTIONS = [
     (1, 1),    # Hard Right
 ]
 
+# Tables with more entries than this use the sparse (dict) backend
+DENSE_LIMIT = 4_000_000
+
+class StateEncoder:
+    """Mixed-radix encoding of the discretized (d1..d5, v) state into one int."""
+    def __init__(self, n_sensors=5, bucket=40, max_range=200, max_speed=6):
+        self.n_sensors = n_sensors
+        self.bucket = bucket
+        self.n_buckets = int(max_range / bucket) + 1 # 0..5 for 200 max range
+        self.n_speeds = int(max_speed) + 1           # 0..6
+        self.n_states = self.n_buckets ** n_sensors * self.n_speeds
+
+        # Place value of each sensor digit, speed is the last digit
+        self.multipliers = [self.n_speeds * self.n_buckets ** (n_sensors - 1 - i) for i in range(n_sensors)]
+
+    def encode(self, radars, speed):
+        index = 0
+        for mult, (r_len, _) in zip(self.multipliers, radars):
+            index += min(int(r_len / self.bucket), self.n_buckets - 1) * mult
+        return index + min(int(speed), self.n_speeds - 1)
+
+    def decode(self, index):
+        speed = index % self.n_speeds
+        return tuple((index // mult) % self.n_buckets for mult in self.multipliers) + (speed,)
+
+
+class DenseQTable:
+    """Q-values in a (n_states, n_actions) float32 array.
+
+    seen marks entries that have been written, so mutation only perturbs
+    learned values like the dict table did.
+    """
+    def __init__(self, n_states, n_actions, values=None, seen=None):
+        self.values = np.zeros((n_states, n_actions), dtype=np.float32) if values is None else values
+        self.seen = np.zeros((n_states, n_actions), dtype=bool) if seen is None else seen
+
+    def __len__(self):
+        return int(self.seen.sum())
+
+    def get(self, s, a):
+        return float(self.values[s, a])
+
+    def set(self, s, a, value):
+        self.values[s, a] = value
+        self.seen[s, a] = True
+
+    def best_action(self, s):
+        return int(self.values[s].argmax())
+
+    def copy(self):
+        return DenseQTable(0, 0, self.values.copy(), self.seen.copy())
+
+    def mutate(self, rate, scale):
+        flat = self.values.reshape(-1)
+        keys = np.flatnonzero(self.seen)
+        keys = keys[np.random.random(keys.size) < rate]
+        flat[keys] += np.random.uniform(-scale, scale, keys.size)
+
+
+class SparseQTable:
+    """Dict keyed by (state_index, action), for discretizations too fine to store densely."""
+    def __init__(self, n_actions, q=None):
+        self.n_actions = n_actions
+        self.q = {} if q is None else q
+
+    def __len__(self):
+        return len(self.q)
+
+    def get(self, s, a):
+        return self.q.get((s, a), 0)
+
+    def set(self, s, a, value):
+        self.q[(s, a)] = value
+
+    def best_action(self, s):
+        qs = [self.q.get((s, a), 0) for a in range(self.n_actions)]
+        return int(np.argmax(qs))
+
+    def copy(self):
+        return SparseQTable(self.n_actions, self.q.copy())
+
+    def mutate(self, rate, scale):
+        # Draw how many entries mutate, then which, instead of a roll per key
+        q = self.q
+        for k in random.sample(list(q), np.random.binomial(len(q), rate)):
+            q[k] += random.uniform(-scale, scale)
+
+
+def make_q_table(n_states, n_actions=len(ACTIONS), dense=None):
+    if dense is None:
+        dense = n_states * n_actions <= DENSE_LIMIT
+    if dense:
+        return DenseQTable(n_states, n_actions)
+    return SparseQTable(n_actions)
+
+
+DEFAULT_ENCODER = StateEncoder()
+
 class SarsaAgent:
-    def __init__(self):
-        self.q = {}
+    def __init__(self, encoder=None, dense=None, q=None):
+        self.encoder = encoder or DEFAULT_ENCODER
+        self.dense = dense
+        self.q = make_q_table(self.encoder.n_states, dense=dense) if q is None else q
         self.alpha = 0.1
         self.gamma = 0.95
         self.epsilon = 0.2
 
     def get_state(self, car):
         # State: (Sensor1, Sensor2, Sensor3, Sensor4, Sensor5, Speed)
-        # Discretize sensors: 0-10 buckets
-        
-        state_parts = []
-        for r_len, _ in car.radars:
-            state_parts.append(int(r_len / 40)) # 5 buckets for 200 max range
-            
-        state_parts.append(int(car.speed))
-        
+        # Discretize sensors into 40px buckets, then pack the tuple into
+        # a single table index
+
         # We don't really need absolute X/Y or angle if we have relative sensors!
-        return tuple(state_parts)
+        return self.encoder.encode(car.radars, car.speed)
 
     def choose_action(self, state):
         if random.random() < self.epsilon:
             return random.randint(0, len(ACTIONS) - 1)
 
-        qs = [self.q.get((state, a), 0) for a in range(len(ACTIONS))]
-        return int(np.argmax(qs))
+        return self.q.best_action(state)
 
     def update(self, s, a, r, s2, a2):
-        old = self.q.get((s, a), 0)
-        next_q = self.q.get((s2, a2), 0)
-        self.q[(s, a)] = old + self.alpha * (r + self.gamma * next_q - old)
+        old = self.q.get(s, a)
+        next_q = self.q.get(s2, a2)
+        self.q.set(s, a, old + self.alpha * (r + self.gamma * next_q - old))
 
     def clone_mutate(self):
-        child = SarsaAgent()
-        child.q = self.q.copy()
-        
+        child = SarsaAgent(self.encoder, self.dense, self.q.copy())
+
         # Mutate Q-values
-        for k in child.q:
-            if random.random() < 0.05:
-                child.q[k] += random.uniform(-0.5, 0.5)
-                
+        child.q.mutate(0.05, 0.5)
+
         # Mutate Hyperparameters
         child.epsilon = max(0.01, min(0.5, self.epsilon + random.uniform(-0.05, 0.05)))
-        
+
         return child
+
+
+class SarsaPopulation:
+    """SARSA learners for a whole population, in copy-on-write pages.
+
+    Encoded states are mapped to compact slots the first time any agent
+    visits them, so storage grows with the states actually explored
+    instead of the full encoder range. An agent's table is a row of page
+    ids, one per block of `page` slots, and a page holds the Q-values and
+    seen flags of its block. evolve() only copies page ids, so children
+    share their parent's pages (the elite costs nothing) until an update
+    or a mutation writes to one. Page 0 is the shared all-zero page.
+
+    Action selection, the TD update and generational elitism/mutation each
+    run as one array operation.
+    """
+    TABLES = ('states', 'q', 'seen', 'alpha', 'gamma', 'epsilon') # get_tables() keys
+
+    def __init__(self, size, encoder=None, alpha=0.1, gamma=0.95, epsilon=0.2, capacity=256, seed=None, page=64):
+        self.size = size
+        self.encoder = encoder or DEFAULT_ENCODER
+        self.n_actions = len(ACTIONS)
+        self.rng = np.random.default_rng(seed)
+        self.state_shape = () # A state is one slot index
+
+        self.alpha = np.full(size, alpha)
+        self.gamma = np.full(size, gamma)
+        self.epsilon = np.full(size, epsilon)
+
+        self.page = page
+        capacity = -(-capacity // page) * page
+        self.multipliers = np.array(self.encoder.multipliers)
+        self.slot_of = np.full(self.encoder.n_states, -1, dtype=np.int64)
+        self.slot_states = np.zeros(capacity, dtype=np.int64) # Inverse of slot_of
+        self.n_slots = 0
+
+        self.page_table = np.zeros((size, capacity // page), dtype=np.int64)
+        self.q_pages = np.zeros((64, page, self.n_actions), dtype=np.float32)
+        self.seen_pages = np.zeros((64, page, self.n_actions), dtype=bool)
+        self.refs = np.zeros(64, dtype=np.int64) # Page table entries pointing at each page
+        self.refs[0] = 1 << 62 # The zero page is never written or freed
+        self.n_pages = 1 # Pages ever allocated, free ones are reused first
+        self.free = np.zeros(0, dtype=np.int64)
+
+    @property
+    def pages_in_use(self):
+        return self.n_pages - 1 - self.free.size # Not counting the zero page
+
+    @property
+    def nbytes(self):
+        """Bytes held by the pages in use and the page tables."""
+        page_bytes = (self.q_pages.itemsize + self.seen_pages.itemsize) * self.page * self.n_actions
+        return self.pages_in_use * page_bytes + self.page_table.nbytes
+
+    def encode_states(self, radars, speeds):
+        """Slot index for each row of an (N, N_sensors) radar matrix."""
+        enc = self.encoder
+        buckets = np.minimum((np.asarray(radars) / enc.bucket).astype(np.int64), enc.n_buckets - 1)
+        index = buckets @ self.multipliers + np.minimum(np.asarray(speeds).astype(np.int64), enc.n_speeds - 1)
+        return self.slots_for(index)
+
+    def slots_for(self, index):
+        """Slots for encoder state indices, allocating any not seen before."""
+        slots = self.slot_of[index]
+        new = slots < 0
+        if new.any():
+            fresh = np.unique(index[new])
+            self._reserve(self.n_slots + fresh.size)
+            self.slot_of[fresh] = np.arange(self.n_slots, self.n_slots + fresh.size)
+            self.slot_states[self.n_slots:self.n_slots + fresh.size] = fresh
+            self.n_slots += fresh.size
+            slots = self.slot_of[index]
+        return slots
+
+    def _reserve(self, n_slots):
+        capacity = self.slot_states.size
+        if n_slots <= capacity:
+            return
+        while capacity < n_slots:
+            capacity *= 2
+        slot_states = np.zeros(capacity, dtype=np.int64)
+        slot_states[:self.n_slots] = self.slot_states[:self.n_slots]
+        self.slot_states = slot_states
+        # New blocks start out on the zero page
+        page_table = np.zeros((self.size, capacity // self.page), dtype=np.int64)
+        page_table[:, :self.page_table.shape[1]] = self.page_table
+        self.page_table = page_table
+
+    def _alloc(self, n):
+        """n private pages, contents undefined."""
+        reused = self.free[:n]
+        self.free = self.free[reused.size:]
+        fresh = n - reused.size
+        if self.n_pages + fresh > len(self.refs):
+            capacity = len(self.refs)
+            while capacity < self.n_pages + fresh:
+                capacity *= 2
+            for name in ('q_pages', 'seen_pages', 'refs'):
+                old = getattr(self, name)
+                grown = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+                grown[:len(old)] = old
+                setattr(self, name, grown)
+        pages = np.concatenate([reused, np.arange(self.n_pages, self.n_pages + fresh)])
+        self.n_pages += fresh
+        self.refs[pages] = 1
+        return pages
+
+    def _release(self, pages):
+        """Drop one reference to each page id in `pages`."""
+        counts = np.bincount(pages, minlength=len(self.refs))
+        self.refs -= counts
+        dead = np.flatnonzero((counts > 0) & (self.refs == 0))
+        self.free = np.concatenate([self.free, dead])
+
+    def _own(self, agents, blocks):
+        """Page ids for (agent, block) pairs, copying any that are shared first."""
+        pages = self.page_table[agents, blocks]
+        shared = self.refs[pages] > 1
+        if shared.any():
+            key = agents[shared] * self.page_table.shape[1] + blocks[shared]
+            _, first = np.unique(key, return_index=True)
+            owners = agents[shared][first]
+            owned = blocks[shared][first]
+            old = pages[shared][first]
+            new = self._alloc(old.size)
+            self.q_pages[new] = self.q_pages[old]
+            self.seen_pages[new] = self.seen_pages[old]
+            self._release(old)
+            self.page_table[owners, owned] = new
+            pages = self.page_table[agents, blocks]
+        return pages
+
+    def _dense(self, agents):
+        """(agents, n_slots, actions) copies of Q and seen, from the pages."""
+        blocks = -(-self.n_slots // self.page)
+        pages = self.page_table[agents, :blocks]
+        shape = (pages.shape[0], blocks * self.page, self.n_actions)
+        return (self.q_pages[pages].reshape(shape)[:, :self.n_slots],
+                self.seen_pages[pages].reshape(shape)[:, :self.n_slots])
+
+    def new_episode(self):
+        """Called when the cars reset. One-step SARSA carries nothing over."""
+
+    def get_tables(self, agents=slice(None)):
+        """Compact copy of the given agents' tables, keyed by encoder state index."""
+        q, seen = self._dense(agents)
+        return {
+            'states': self.slot_states[:self.n_slots].copy(),
+            'q': q,
+            'seen': seen,
+            'alpha': self.alpha[agents].copy(),
+            'gamma': self.gamma[agents].copy(),
+            'epsilon': self.epsilon[agents].copy(),
+        }
+
+    def set_tables(self, agents, tables):
+        """Load tables produced by get_tables (possibly from another population)."""
+        agents = np.asarray(agents)
+        slots = self.slots_for(np.asarray(tables['states']))
+        blocks = slots // self.page
+        used = np.unique(blocks)
+        self._own(np.repeat(agents, used.size), np.tile(used, agents.size))
+        pages = self.page_table[agents[:, None], blocks]
+        self.q_pages[pages, slots % self.page] = tables['q']
+        self.seen_pages[pages, slots % self.page] = tables['seen']
+        self.alpha[agents] = tables['alpha']
+        self.gamma[agents] = tables['gamma']
+        self.epsilon[agents] = tables['epsilon']
+
+    def values(self, agents, states):
+        """(N, actions) Q-values of each agent in its state."""
+        return self.q_pages[self.page_table[agents, states // self.page], states % self.page]
+
+    def choose_actions(self, agents, states, draws=None):
+        """Epsilon-greedy actions for the given agents, one state slot each.
+
+        draws is an optional (explore, action) pair of uniform [0, 1) arrays
+        aligned with agents, so callers can control the random stream.
+        """
+        if draws is None:
+            draws = self.rng.random((2, len(agents)))
+        explore_u, action_u = draws
+        greedy = self.values(agents, states).argmax(axis=1)
+        explore = explore_u < self.epsilon[agents]
+        return np.where(explore, (action_u * self.n_actions).astype(np.int64), greedy)
+
+    def update(self, agents, s, a, r, s2, a2):
+        agents = np.asarray(agents)
+        size = self.page * self.n_actions
+        # Flat offsets into the page arrays, cheaper than three-way fancy indexing
+        within = (s % self.page) * self.n_actions + a
+        q = self.q_pages.reshape(-1)
+        old = q.take(self.page_table[agents, s // self.page] * size + within)
+        next_q = q.take(self.page_table[agents, s2 // self.page] * size + (s2 % self.page) * self.n_actions + a2)
+        at = self._own(agents, s // self.page) * size + within # May grow the page arrays
+        self.q_pages.reshape(-1)[at] = old + self.alpha[agents] * (r + self.gamma[agents] * next_q - old)
+        self.seen_pages.reshape(-1)[at] = True
+
+    def evolve(self, fitness, elite=3, mutation_rate=0.05, mutation_scale=0.5):
+        """Next generation by truncation selection from the top `elite` agents.
+
+        Slot 0 is a mutated clone of the best agent that keeps its epsilon,
+        the rest clone a random top agent and drift epsilon. Cloning shares
+        pages; the number of mutated entries is drawn first, then which
+        learned entries they are, so only the pages they land on are copied.
+        """
+        order = np.argsort(-np.asarray(fitness), kind='stable')
+        parents = np.empty(self.size, dtype=np.int64)
+        parents[0] = order[0]
+        parents[1:] = self.rng.choice(order[:elite], self.size - 1)
+
+        # Clone: children point at their parent's pages
+        old_table = self.page_table
+        self.page_table = old_table[parents]
+        self.refs += np.bincount(self.page_table.ravel(), minlength=len(self.refs))
+        self._release(old_table.ravel())
+
+        # Learned entries of each parent (in encoder state order, so the
+        # draws don't depend on the order slots were discovered), repeated
+        # for each of its children
+        kids, entries = [], []
+        for p in np.unique(parents):
+            kids.append(np.flatnonzero(parents == p))
+            _, seen = self._dense(kids[-1][:1])
+            learned = np.flatnonzero(seen[0])
+            key = self.slot_states[learned // self.n_actions] * self.n_actions + learned % self.n_actions
+            entries.append(learned[np.argsort(key, kind='stable')])
+        offsets = np.cumsum([0] + [k.size * e.size for k, e in zip(kids, entries)])
+        picks = sample_distinct(self.rng, offsets[-1], self.rng.binomial(offsets[-1], mutation_rate))
+        group = np.searchsorted(offsets, picks, side='right') - 1
+        agents = np.empty(picks.size, dtype=np.int64)
+        entry = np.empty(picks.size, dtype=np.int64)
+        for g, (k, e) in enumerate(zip(kids, entries)):
+            local = picks[group == g] - offsets[g]
+            agents[group == g] = k[local // max(e.size, 1)]
+            entry[group == g] = e[local % max(e.size, 1)]
+        slots = entry // self.n_actions
+        pages = self._own(agents, slots // self.page)
+        self.q_pages[pages, slots % self.page, entry % self.n_actions] += \
+            self.rng.uniform(-mutation_scale, mutation_scale, picks.size).astype(np.float32)
+
+        # Mutate Hyperparameters
+        epsilon = np.clip(self.epsilon[parents] + self.rng.uniform(-0.05, 0.05, self.size), 0.01, 0.5)
+        epsilon[0] = self.epsilon[parents[0]]
+        self.epsilon = epsilon
+        self.alpha = self.alpha[parents]
+        self.gamma = self.gamma[parents]
+        return parents
+
+
+def sample_distinct(rng, n, k):
+    """k distinct integers from [0, n), sorted, without an O(n) permutation."""
+    picks = np.unique(rng.integers(0, n, k)) if k else np.zeros(0, dtype=np.int64)
+    while picks.size < k:
+        picks = np.unique(np.concatenate([picks, rng.integers(0, n, k - picks.size)]))
+    return picks
+
+
+class TileCoder:
+    """Hashed tile coding of the raw (d1..d5, v) inputs.
+
+    n_tilings overlapping grids, each shifted by a fraction of a tile along
+    every input (asymmetric offsets, so the grids don't line up on the
+    diagonal). Every grid cell a reading falls in is hashed into that
+    tiling's block of 2**bits features, so the weight count stays fixed
+    however fine the tiles are.
+    """
+    def __init__(self, n_tilings=8, tiles=8, bits=9, n_sensors=5, max_range=200, max_speed=6):
+        self.n_tilings = n_tilings
+        self.bits = bits
+        self.n_features = n_tilings << bits
+        dims = n_sensors + 1
+        self.scale = np.array([tiles / max_range] * n_sensors + [tiles / max_speed])
+        self.offsets = (np.arange(n_tilings)[:, None] * (2 * np.arange(dims) + 1) % n_tilings) / n_tilings
+        # Odd multipliers mix the cell coordinates, the golden ratio constant
+        # (Fibonacci hashing) spreads them over the block
+        self.mix = np.random.default_rng(0).integers(1, 1 << 31, (n_tilings, dims)).astype(np.uint64) | np.uint64(1)
+        self.base = (np.arange(n_tilings) << bits).astype(np.int64)
+
+    def encode(self, radars, speeds):
+        """(N, n_tilings) feature indices for N readings."""
+        x = np.column_stack([np.asarray(radars, dtype=float), np.asarray(speeds, dtype=float)]) * self.scale
+        cells = np.floor(x[:, None, :] + self.offsets).astype(np.uint64) # (N, tilings, dims)
+        h = (cells * self.mix).sum(axis=2) * np.uint64(0x9E3779B97F4A7C15)
+        return (h >> np.uint64(64 - self.bits)).astype(np.int64) + self.base
+
+
+class TileCodingPopulation:
+    """Linear SARSA(lambda) learners over tile-coded inputs, for a whole population.
+
+    Q(s, a) is the sum of one weight per tiling, (pop, features, actions)
+    float32. Unlike the tabular learners nothing is discretized away and
+    the table never grows. Eligibility traces are truncated to the last
+    trace_length (state, action) pairs of each agent, as a ring buffer, so
+    an update touches trace_length * n_tilings weights per agent rather than
+    decaying a trace the size of the weights. Mutation perturbs the weight
+    vectors directly.
+
+    A state is the (n_tilings,) feature row from encode_states(); it has the
+    same interface as SarsaPopulation otherwise.
+    """
+    TABLES = ('weights', 'alpha', 'gamma', 'epsilon')
+
+    def __init__(self, size, coder=None, alpha=0.1, gamma=0.95, epsilon=0.2, lam=0.8, trace_length=12, seed=None):
+        self.size = size
+        self.coder = coder or TileCoder()
+        self.n_actions = len(ACTIONS)
+        self.rng = np.random.default_rng(seed)
+        self.state_shape = (self.coder.n_tilings,)
+
+        self.alpha = np.full(size, alpha)
+        self.gamma = np.full(size, gamma)
+        self.epsilon = np.full(size, epsilon)
+        self.lam = lam
+
+        self.w = np.zeros((size, self.coder.n_features, self.n_actions), dtype=np.float32)
+        self.trace_features = np.zeros((size, trace_length) + self.state_shape, dtype=np.int64)
+        self.trace_actions = np.zeros((size, trace_length), dtype=np.int64)
+        self.trace_count = np.zeros(size, dtype=np.int64) # Pairs pushed since new_episode()
+
+    def encode_states(self, radars, speeds):
+        return self.coder.encode(radars, speeds)
+
+    def _rows(self, agents, states):
+        # Row of each (agent, feature) in w viewed as (pop * features, actions)
+        return (np.asarray(agents) * self.coder.n_features)[:, None] + states
+
+    def values(self, agents, states):
+        """(N, actions) Q-values of each agent in its state."""
+        return self.w.reshape(-1, self.n_actions).take(self._rows(agents, states), axis=0).sum(axis=1)
+
+    def new_episode(self):
+        self.trace_count.fill(0)
+
+    def get_tables(self, agents=slice(None)):
+        return {
+            'weights': self.w[agents].copy(),
+            'alpha': self.alpha[agents].copy(),
+            'gamma': self.gamma[agents].copy(),
+            'epsilon': self.epsilon[agents].copy(),
+        }
+
+    def set_tables(self, agents, tables):
+        agents = np.asarray(agents)
+        self.w[agents] = tables['weights']
+        self.alpha[agents] = tables['alpha']
+        self.gamma[agents] = tables['gamma']
+        self.epsilon[agents] = tables['epsilon']
+
+    def choose_actions(self, agents, states, draws=None):
+        if draws is None:
+            draws = self.rng.random((2, len(agents)))
+        explore_u, action_u = draws
+        greedy = self.values(agents, states).argmax(axis=1)
+        explore = explore_u < self.epsilon[agents]
+        return np.where(explore, (action_u * self.n_actions).astype(np.int64), greedy)
+
+    def update(self, agents, s, a, r, s2, a2):
+        agents = np.asarray(agents)
+        if not agents.size:
+            return
+        w = self.w.reshape(-1)
+        q = w.take(self._rows(agents, s) * self.n_actions + a[:, None]).sum(axis=1)
+        next_q = w.take(self._rows(agents, s2) * self.n_actions + a2[:, None]).sum(axis=1)
+        gamma = self.gamma[agents]
+        delta = r + gamma * next_q - q
+
+        # Push (s, a) onto each agent's trace, then credit every pair on it
+        length = self.trace_actions.shape[1]
+        head = self.trace_count[agents] % length
+        self.trace_features[agents, head] = s
+        self.trace_actions[agents, head] = a
+        self.trace_count[agents] += 1
+        age = (head[:, None] - np.arange(length)) % length
+        decay = (gamma * self.lam)[:, None] ** age
+        decay[age >= self.trace_count[agents][:, None]] = 0 # Slots not filled this episode
+        step = ((self.alpha[agents] * delta / self.coder.n_tilings)[:, None] * decay).astype(np.float32)
+
+        # One scatter-add for all agents; a pair on the trace twice gets both credits
+        flat = self._rows(agents, self.trace_features[agents].reshape(agents.size, -1)) * self.n_actions
+        flat += np.repeat(self.trace_actions[agents], self.coder.n_tilings, axis=1)
+        np.add.at(w, flat.ravel(), np.repeat(step, self.coder.n_tilings, axis=1).ravel())
+
+    def evolve(self, fitness, elite=3, mutation_rate=0.05, mutation_scale=0.5):
+        """Next generation by truncation selection, like SarsaPopulation.evolve.
+
+        A mutation_rate share of all weights get uniform noise of
+        mutation_scale / n_tilings, so no Q-value moves by more than
+        mutation_scale.
+        """
+        order = np.argsort(-np.asarray(fitness), kind='stable')
+        parents = np.empty(self.size, dtype=np.int64)
+        parents[0] = order[0]
+        parents[1:] = self.rng.choice(order[:elite], self.size - 1)
+
+        w = self.w[parents]
+        flat = w.reshape(-1)
+        keys = self.rng.integers(0, flat.size, self.rng.binomial(flat.size, mutation_rate))
+        scale = mutation_scale / self.coder.n_tilings
+        flat[keys] += self.rng.uniform(-scale, scale, keys.size).astype(np.float32)
+        self.w = w
+
+        epsilon = np.clip(self.epsilon[parents] + self.rng.uniform(-0.05, 0.05, self.size), 0.01, 0.5)
+        epsilon[0] = self.epsilon[parents[0]]
+        self.epsilon = epsilon
+        self.alpha = self.alpha[parents]
+        self.gamma = self.gamma[parents]
+        self.new_episode()
+        return parents
+
+
+def pack_tables(tables):
+    """Serialize get_tables output into one compact byte buffer.
+
+    Layout: int64 (agents, slots, actions) header, int64 state indices,
+    float32 Q-values, bit-packed seen mask, float64 alpha/gamma/epsilon.
+    """
+    k, n, a = tables['q'].shape
+    parts = [
+        np.array([k, n, a], dtype=np.int64),
+        np.asarray(tables['states'], dtype=np.int64),
+        np.asarray(tables['q'], dtype=np.float32),
+        np.packbits(tables['seen']),
+        np.asarray(tables['alpha'], dtype=np.float64),
+        np.asarray(tables['gamma'], dtype=np.float64),
+        np.asarray(tables['epsilon'], dtype=np.float64),
+    ]
+    return b''.join(np.ascontiguousarray(p).tobytes() for p in parts)
+
+
+def unpack_tables(buf):
+    """Inverse of pack_tables, arrays are read-only views into buf where possible."""
+    k, n, a = (int(v) for v in np.frombuffer(buf, dtype=np.int64, count=3))
+    offset = 24
+
+    def take(dtype, count):
+        nonlocal offset
+        arr = np.frombuffer(buf, dtype=dtype, count=count, offset=offset)
+        offset += arr.nbytes
+        return arr
+
+    states = take(np.int64, n)
+    q = take(np.float32, k * n * a).reshape(k, n, a)
+    seen = np.unpackbits(take(np.uint8, (k * n * a + 7) // 8), count=k * n * a).astype(bool).reshape(k, n, a)
+    return {
+        'states': states,
+        'q': q,
+        'seen': seen,
+        'alpha': take(np.float64, k),
+        'gamma': take(np.float64, k),
+        'epsilon': take(np.float64, k),
+    }
@@ -0,0 +1,538 @@
+"""Asyncio server mode: python-socketio's AsyncServer on ASGI.
+
+    python async_server.py --port 5001
+    uvicorn async_server:app --port 5001     # same app, your own ASGI server
+
+Serves the same page and the same events as web_server.py, but everything
+network-facing runs on one event loop instead of a thread per client:
+
+- Control events (speed, pause, restart, protocol) are put on the session's
+  queue and applied by its physics task between slices of steps, so
+  handlers never touch a simulation that is mid-step.
+- Physics runs in a thread pool executor, at most `quantum` steps per
+  slice, so the loop keeps serving sockets while the simulation steps.
+- Each session has a sender task that encodes the newest snapshot once per
+  tick. Clients sharing a payload get one emit, so the frame is encoded
+  once, and every client acks one frame in ACK_EVERY. Clients that stop
+  acknowledging are skipped and resynced with a keyframe, like Broadcaster.
+
+Sessions work as in web_server.py (?session=<name>&track=&pop=&fitness=&seed=&learner=).
+Recording, replay, checkpoints and profiling are only in web_server.py.
+benchmarks/load_test.py drives hundreds of viewers against this server.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from urllib.parse import parse_qs
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import jinja2
+import socketio
+
+from broadcaster import ClientState, RateMeter, Snapshot
+from protocol import FrameEncoder, TrailBuffer, detail_key, detail_settings, json_frame, lod_frame, meta_frame
+from sessions import GENERATION_PAUSE, gen_log_entry
+from simulation import FITNESS, LEARNERS, Simulation
+from termination import KillRules, StepBudget
+from tracks import load_track, preset_names
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+POP_SIZE = 5
+MAX_POP_SIZE = 200
+DEFAULT_SESSION = 'default'
+FRAME_RATE = 30
+QUANTUM = 50 # Most steps per executor slice
+ACK_EVERY = 5 # Frames per client between frames sent with an ack callback
+MAX_LAG = 2 # Unacknowledged ack frames before a client is skipped
+ACK_TIMEOUT = 5.0
+IDLE_TIMEOUT = 600
+MAX_SESSIONS = 16 # Sessions hosted at once, like SessionPool.max_sessions
+
+EVENTS = {'json': 'update', 'delta': 'frame', 'key': 'frame'}
+
+sio = socketio.AsyncServer(async_mode='asgi')
+executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='physics')
+sessions = {}
+client_sessions = {} # sid -> AsyncSession
+tracks = {}
+building = set() # Session ids whose Simulation is being built, counted against MAX_SESSIONS
+settings = {'seed': None, 'fitness': 'distance', 'learner': 'tabular', 'track': 'stadium', 'unthrottled': False,
+            'early_kill': False, 'adaptive_steps': False, 'generation_pause': GENERATION_PAUSE}
+
+
+def termination():
+    """Fresh kill rules and step budget for a new simulation, per settings."""
+    return {'kill_rules': KillRules() if settings['early_kill'] else None,
+            'step_budget': StepBudget() if settings['adaptive_steps'] else None}
+
+
+class LoopMonitor:
+    """How late the event loop wakes up from a short sleep: its responsiveness."""
+    def __init__(self, interval=0.05, window=200):
+        self.interval = interval
+        self.lags = []
+        self.window = window
+
+    async def run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(time.perf_counter() - start - self.interval)
+            del self.lags[:-self.window]
+
+    def stats(self):
+        if not self.lags:
+            return {}
+        lags = sorted(self.lags)
+        return {
+            'loop_lag_p50_ms': round(lags[len(lags) // 2] * 1000, 2),
+            'loop_lag_p99_ms': round(lags[int(len(lags) * 0.99)] * 1000, 2),
+            'loop_lag_max_ms': round(lags[-1] * 1000, 2),
+        }
+
+monitor = LoopMonitor()
+
+
+class AsyncSession:
+    def __init__(self, session_id, sim, pinned=False):
+        self.id = session_id
+        self.room = f"session:{session_id}"
+        self.sim = sim
+        self.pinned = pinned
+        self.controls = asyncio.Queue()
+        self.clients = {} # sid -> ClientState
+        self.encoder = FrameEncoder()
+        self.latest = None # Newest Snapshot, handed over by the physics task
+        self.trails = None # TrailBuffer, while a client wants lod trails
+        self.sent = None
+        self.last_capture = 0.0
+        self.last_active = time.monotonic()
+
+        self.steps_per_frame = 1
+        self.unthrottled = settings['unthrottled']
+        self.paused = False
+        self.physics = RateMeter()
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.frame_no = 0
+        self.joined = 0
+        self.tasks = []
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._physics_loop()), asyncio.create_task(self._send_loop())]
+
+    def stop(self):
+        for task in self.tasks:
+            task.cancel()
+
+    async def emit(self, event, data, binary=False):
+        await sio.emit(event, data, to=self.room + ':binary' if binary else self.room)
+
+    # --- Physics task ---
+    async def _apply(self, control):
+        kind, value = control
+        if kind == 'speed':
+            if value == 'max':
+                self.unthrottled = True
+            else:
+                self.steps_per_frame = max(1, int(value))
+                self.unthrottled = False
+        elif kind == 'pause':
+            self.paused = not self.paused
+            await self.emit('pause_state', {'paused': self.paused})
+        elif kind == 'restart':
+            sim = self.sim
+            self.sim = await asyncio.get_running_loop().run_in_executor(
+                executor, partial(Simulation, sim.pop_size, max_steps=sim.max_steps, track=sim.track,
+                                  fitness=sim.fitness, learner=sim.learner, params=sim.params, rewards=sim.rewards,
+                                  **termination())) # A fresh seed, as in Session.hard_reset
+            self.latest = None
+            print(f"[{self.id}] Hard reset, seed {self.sim.seed}")
+            await self.emit('hard_reset', {'generation': 1})
+            self.encoder.request_keyframe()
+            await self.emit('meta', meta_frame(self.sim), binary=True)
+
+    def _run_slice(self, n):
+        """Up to n steps, on an executor thread. Returns (steps run, generation stats or False)."""
+        sim = self.sim
+        for i in range(n):
+            if sim.done:
+                return i, sim.next_generation()
+            sim.step()
+            # The end of every slice, and within long slices once per frame
+            now = time.perf_counter()
+            if i == n - 1 or now - self.last_capture >= 1 / FRAME_RATE:
+                snap = Snapshot()
+                snap.capture(sim)
+                sim.batch.crashed.fill(False)
+                if any(c.detail and c.detail['trails'] for c in list(self.clients.values())):
+                    if self.trails is None:
+                        self.trails = TrailBuffer(sim.pop_size)
+                    self.trails.push(snap.batch, snap.generation)
+                else:
+                    self.trails = None
+                self.latest = snap
+                self.last_capture = now
+        return n, False
+
+    async def _physics_loop(self):
+        loop = asyncio.get_running_loop()
+        next_step = time.perf_counter()
+        while True:
+            try:
+                # 1. Controls, only ever applied between slices
+                while not self.controls.empty():
+                    await self._apply(self.controls.get_nowait())
+                if self.paused:
+                    await self._apply(await self.controls.get())
+                    next_step = time.perf_counter()
+                    continue
+
+                # 2. How many steps are due
+                now = time.perf_counter()
+                interval = 1 / (self.steps_per_frame * FRAME_RATE)
+                if self.unthrottled:
+                    n = QUANTUM
+                elif now < next_step:
+                    try:
+                        await self._apply(await asyncio.wait_for(self.controls.get(), next_step - now))
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                else:
+                    if now - next_step > 0.25:
+                        next_step = now # Fell behind, don't try to catch up
+                    n = min(QUANTUM, int((now - next_step) / interval) + 1)
+
+                # 3. Step in the executor, the loop keeps serving clients
+                ran, stats = await loop.run_in_executor(executor, self._run_slice, n)
+                self.physics.add(ran)
+                next_step += ran * interval
+                if stats is not False:
+                    if stats:
+                        print(f"[{self.id}] Gen {stats['generation']} Complete. Best Dist: {stats['distance']:.1f}")
+                        await self.emit('gen_log', gen_log_entry(stats))
+                    await self.emit('reset', {'generation': self.sim.generation})
+                    self.encoder.request_keyframe()
+                    await self.emit('meta', meta_frame(self.sim), binary=True)
+                    next_step = time.perf_counter() + (0 if self.unthrottled else settings['generation_pause'])
+                if self.unthrottled:
+                    await asyncio.sleep(0) # Let the sender and handlers in between slices
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Simulation Error (session {self.id}): {e}")
+                self.paused = True
+
+    # --- Sender task ---
+    async def _send_loop(self):
+        next_tick = time.perf_counter()
+        while True:
+            next_tick += 1 / FRAME_RATE
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                next_tick = time.perf_counter() # Fell behind, don't burst to catch up
+            snap = self.latest
+            if snap is None or snap is self.sent or not self.clients:
+                continue
+            self.sent = snap
+            try:
+                await self._send(snap)
+            except Exception as e:
+                print(f"Broadcast Error: {e}")
+
+    async def _send(self, snap):
+        clients = list(self.clients.values())
+        delta = None
+        if any(c.binary and c.detail is None for c in clients):
+            delta = self.encoder.encode(snap)
+        else:
+            self.encoder.request_keyframe()
+
+        # Clients sharing a payload get one emit (encoded once); a staggered
+        # 1 in ACK_EVERY of them is sent the frame with an ack callback instead
+        groups = {}
+        probes = []
+        detail = {}
+        now = time.perf_counter()
+        self.frame_no += 1
+        for client in clients:
+            if client.lag >= MAX_LAG:
+                if now - client.last_ack < ACK_TIMEOUT:
+                    client.dropped += 1
+                    client.needs_key = True
+                    self.frames_dropped += 1
+                    continue
+                client.acked = client.sent
+            if client.detail is not None:
+                kind = ('lod', detail_key(client.detail))
+                detail[kind] = client.detail
+            elif client.binary:
+                kind = 'key' if client.needs_key and delta[1] != 0 else 'delta'
+                client.needs_key = False
+            else:
+                kind = 'json'
+            self.frames_sent += 1
+            if (self.frame_no + client.offset) % ACK_EVERY == 0:
+                client.sent += 1
+                probes.append((client, kind))
+            else:
+                groups.setdefault(kind, []).append(client.sid)
+
+        payloads = {}
+        for kind in set(groups) | {kind for _, kind in probes}:
+            if kind == 'json':
+                payloads[kind] = json_frame(snap)
+            elif kind == 'key':
+                payloads[kind] = self.encoder.keyframe(snap)
+            elif kind in detail:
+                payloads[kind] = lod_frame(snap, detail[kind], self.trails)
+            else:
+                payloads[kind] = delta
+        emits = [sio.emit(EVENTS.get(kind, 'lod'), payloads[kind], to=sids) for kind, sids in groups.items()]
+        emits += [sio.emit(EVENTS.get(kind, 'lod'), payloads[kind], to=client.sid,
+                           callback=partial(self._ack, client, now))
+                  for client, kind in probes]
+        await asyncio.gather(*emits)
+
+    def _ack(self, client, sent_at, *args):
+        now = time.perf_counter()
+        client.acked = min(client.sent, client.acked + 1)
+        client.rtt = now - sent_at
+        client.last_ack = now
+
+    def stats(self):
+        sim = self.sim
+        return {
+            'session': self.id,
+            'clients': len(self.clients),
+            'track': sim.track.name,
+            'pop_size': sim.pop_size,
+            'fitness': sim.fitness,
+            'learner': sim.learner,
+            'generation': sim.generation,
+            'alive': sim.alive,
+            'steps': sim.steps,
+            'physics_steps_per_sec': round(self.physics.rate, 1),
+            'speed': 'max' if self.unthrottled else self.steps_per_frame,
+            'paused': self.paused,
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+        }
+
+
+async def get_track(name):
+    # Clients get presets and the server's own --track, never files or new random tracks
+    if name != settings['track'] and name not in ['stadium'] + preset_names():
+        raise ValueError(f"Unknown track '{name}', available: {', '.join(['stadium'] + preset_names())}")
+    if name not in tracks:
+        tracks[name] = await asyncio.get_running_loop().run_in_executor(executor, load_track, name)
+    return tracks[name]
+
+async def get_session(session_id, query):
+    session = sessions.get(session_id)
+    if session is not None:
+        return session
+    if len(sessions) + len(building) >= MAX_SESSIONS:
+        raise RuntimeError(f"Session limit reached ({MAX_SESSIONS})") # Before building anything
+    building.add(session_id)
+    try:
+        sim = await new_simulation(query)
+    finally:
+        building.discard(session_id)
+    session = sessions.setdefault(session_id, AsyncSession(session_id, sim, pinned=session_id == DEFAULT_SESSION))
+    if not session.tasks:
+        session.start()
+        print(f"Created session {session_id}")
+    return session
+
+async def new_simulation(query):
+    pop_size = query.get('pop', [None])[0]
+    fitness = query.get('fitness', [None])[0]
+    seed = query.get('seed', [None])[0]
+    learner = query.get('learner', [None])[0]
+    track = await get_track(query.get('track', [settings['track']])[0] or settings['track'])
+    return await asyncio.get_running_loop().run_in_executor(executor, partial(
+        Simulation, min(max(int(pop_size), 1), MAX_POP_SIZE) if pop_size else POP_SIZE,
+        seed=int(seed) if seed else settings['seed'], track=track,
+        fitness=fitness if fitness in FITNESS else settings['fitness'],
+        learner=learner if learner in LEARNERS else settings['learner'], **termination()))
+
+async def evict_idle():
+    while True:
+        await asyncio.sleep(1.0)
+        now = time.monotonic()
+        for session in list(sessions.values()):
+            if not session.pinned and not session.clients and now - session.last_active > IDLE_TIMEOUT:
+                session.stop()
+                del sessions[session.id]
+                print(f"Evicted idle session {session.id}")
+
+
+# --- Socket events ---
+
+@sio.event
+async def connect(sid, environ, auth=None):
+    query = parse_qs(environ.get('QUERY_STRING', ''))
+    session_id = (query.get('session', [DEFAULT_SESSION])[0] or DEFAULT_SESSION)[:64]
+    try:
+        session = await get_session(session_id, query)
+    except (RuntimeError, ValueError, KeyError, OSError) as e:
+        print(f"Refused session {session_id}: {e}")
+        return False
+    client_sessions[sid] = session
+    client = session.clients[sid] = ClientState(sid)
+    client.offset = session.joined # Staggers which frames this client acks
+    session.joined += 1
+    session.last_active = time.monotonic()
+    await sio.enter_room(sid, session.room)
+    await sio.emit('session', session.stats(), to=sid)
+    await sio.emit('track', session.sim.track.describe(), to=sid)
+    await sio.emit('pause_state', {'paused': session.paused}, to=sid)
+    await sio.emit('profiling_state', {'enabled': False}, to=sid)
+    for stats in session.sim.history[-200:]:
+        await sio.emit('gen_log', gen_log_entry(stats), to=sid)
+
+@sio.event
+async def disconnect(sid):
+    session = client_sessions.pop(sid, None)
+    if session is not None:
+        session.clients.pop(sid, None)
+        session.last_active = time.monotonic()
+
+@sio.event
+async def set_protocol(sid, data):
+    session = client_sessions.get(sid)
+    client = session and session.clients.get(sid)
+    if client is None:
+        return
+    client.binary = bool(data.get('binary')) if isinstance(data, dict) else False
+    client.needs_key = True
+    if client.binary:
+        await sio.enter_room(sid, session.room + ':binary')
+        await sio.emit('meta', meta_frame(session.sim), to=sid)
+    else:
+        await sio.leave_room(sid, session.room + ':binary')
+
+@sio.event
+async def set_detail(sid, data):
+    session = client_sessions.get(sid)
+    client = session and session.clients.get(sid)
+    if client is not None:
+        try:
+            client.detail = detail_settings(data)
+        except (TypeError, ValueError):
+            client.detail = None
+        client.needs_key = True
+
+@sio.event
+async def set_speed(sid, data):
+    session = client_sessions.get(sid)
+    if session is None or not isinstance(data, dict) or 'speed' not in data:
+        return
+    speed = data['speed']
+    if speed != 'max':
+        try:
+            speed = max(1, int(speed))
+        except (TypeError, ValueError, OverflowError):
+            return # Ignored like web_server.py does, so it never reaches the physics task
+    await session.controls.put(('speed', speed))
+
+@sio.event
+async def toggle_pause(sid):
+    session = client_sessions.get(sid)
+    if session is not None:
+        await session.controls.put(('pause', None))
+
+@sio.event
+async def restart_sim(sid):
+    session = client_sessions.get(sid)
+    if session is not None:
+        await session.controls.put(('restart', None))
+
+@sio.event
+async def play_replay(sid, data):
+    await sio.emit('replay_state', {'playing': False, 'error': "Replay needs web_server.py --record/--replay"}, to=sid)
+
+@sio.event
+async def latency(sid, data=None):
+    # Echo for load tests: the round trip measures how responsive the loop is
+    return data
+
+
+# --- HTTP ---
+
+def render_index():
+    env = jinja2.Environment(loader=jinja2.FileSystemLoader(os.path.join(ROOT, 'web_viz', 'templates')))
+    return env.get_template('index.html').render(url_for=lambda endpoint, filename: f"/static/{filename}")
+
+INDEX = render_index()
+
+async def send_response(send, status, body, content_type):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', content_type.encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def http_app(scope, receive, send):
+    path = scope['path']
+    if path == '/':
+        await send_response(send, 200, INDEX.encode(), 'text/html; charset=utf-8')
+    elif path == '/stats':
+        query = parse_qs(scope.get('query_string', b'').decode())
+        session = sessions.get(query.get('session', [DEFAULT_SESSION])[0])
+        data = session.stats() if session else {}
+        data.update(monitor.stats())
+        data['sessions'] = [s.stats() for s in list(sessions.values())]
+        data['clients_total'] = len(client_sessions)
+        await send_response(send, 200, json.dumps(data).encode(), 'application/json')
+    else:
+        await send_response(send, 404, b'Not Found', 'text/plain')
+
+async def startup():
+    await get_session(DEFAULT_SESSION, {})
+    asyncio.create_task(monitor.run())
+    asyncio.create_task(evict_idle())
+
+app = socketio.ASGIApp(sio, other_asgi_app=http_app, on_startup=startup,
+                       static_files={'/static': os.path.join(ROOT, 'web_viz', 'static')})
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="RL Racecar asyncio (ASGI) server")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--seed', type=int, default=None, help="Seed for a reproducible run")
+    parser.add_argument('--frame-rate', type=int, default=FRAME_RATE, help="Broadcast frames per second")
+    parser.add_argument('--unthrottled', action='store_true', help="Run physics as fast as possible")
+    parser.add_argument('--track', default='stadium', help="stadium, a preset in tracks/, random:<seed> or a .json file")
+    parser.add_argument('--fitness', choices=FITNESS, default='distance', help="What evolution selects on")
+    parser.add_argument('--learner', choices=LEARNERS, default='tabular', help="Tabular SARSA or tile-coded SARSA(lambda)")
+    parser.add_argument('--early-kill', action='store_true', help="Take out stalled, slow and circling cars early")
+    parser.add_argument('--adaptive-steps', action='store_true', help="Grow the step limit with the best progress")
+    parser.add_argument('--generation-pause', type=float, default=GENERATION_PAUSE,
+                        help="Seconds between generations when paced")
+    parser.add_argument('--workers', type=int, default=2, help="Physics executor threads shared by all sessions")
+    parser.add_argument('--max-sessions', type=int, default=MAX_SESSIONS, help="Sessions hosted at once")
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT,
+                        help="Seconds before a session without clients is evicted")
+    args = parser.parse_args()
+    FRAME_RATE = args.frame_rate
+    MAX_SESSIONS = max(1, args.max_sessions)
+    IDLE_TIMEOUT = args.idle_timeout
+    settings.update(seed=args.seed, fitness=args.fitness, learner=args.learner, track=args.track,
+                    unthrottled=args.unthrottled, early_kill=args.early_kill, adaptive_steps=args.adaptive_steps,
+                    generation_pause=max(0.0, args.generation_pause))
+    executor = ThreadPoolExecutor(max_workers=max(1, args.workers), thread_name_prefix='physics')
+
+    print(f"Starting asyncio server on port {args.port}...")
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning')
@@ -0,0 +1,103 @@
+"""Compiled step kernels (kernels.py) vs the NumPy step: steps/sec,
+bit-identity and compile time.
+
+Steps/sec is measured on warm kernels. Identity compares every car
+array, the fitness history and the Q-tables after a few seeded
+generations on each preset. Compile time is the first step of a fresh
+process with an empty Numba cache, then again with the cache it left.
+
+Run from the repository root (needs Numba for the compiled columns):
+    python benchmarks/bench_kernels.py
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import kernels
+from simulation import Simulation
+from tracks import load_track
+
+POPS = [100, 1000]
+STEPS = 100
+TRACKS = ['stadium', 'hairpin', 'kidney']
+GENERATIONS = 5
+
+FIRST_STEP = """
+import os, time
+os.environ['SDL_VIDEODRIVER'] = 'dummy'
+start = time.perf_counter()
+from simulation import Simulation
+sim = Simulation(10, seed=0, jit=True)
+sim.step()
+print(time.perf_counter() - start)
+"""
+
+
+def steps_per_sec(pop, jit):
+    sim = Simulation(pop, seed=1, jit=jit)
+    for _ in range(3):
+        sim.step()
+    start = time.perf_counter()
+    for _ in range(STEPS):
+        sim.step()
+    return STEPS / (time.perf_counter() - start)
+
+
+def identical(track):
+    sims = []
+    for jit in (False, True):
+        sim = Simulation(50, seed=3, track=track, jit=jit)
+        for _ in range(GENERATIONS):
+            sim.run_generation()
+            sim.next_generation()
+        sim.run_generation() # Compare the cars mid-run too, not just after a reset
+        sims.append(sim)
+    a, b = sims
+    tables_a, tables_b = a.population.get_tables(), b.population.get_tables()
+    return (a.history == b.history and np.array_equal(a.progress, b.progress)
+            and all(np.array_equal(getattr(a.batch, f), getattr(b.batch, f))
+                    for f in ('x', 'y', 'angle', 'speed', 'distance', 'alive', 'radars'))
+            and all(np.array_equal(tables_a[k], tables_b[k]) for k in a.population.TABLES))
+
+
+def first_step_seconds(cache_dir):
+    env = dict(os.environ, NUMBA_CACHE_DIR=cache_dir, PYTHONPATH=os.pathsep.join(sys.path))
+    out = subprocess.run([sys.executable, '-c', FIRST_STEP], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    if not kernels.AVAILABLE:
+        print("Numba is not installed (or RL_RACECAR_JIT=0), NumPy path only")
+    print(f"{'pop':>5} {'numpy steps/s':>14} {'jit steps/s':>12} {'speedup':>8}")
+    for pop in POPS:
+        numpy_rate = steps_per_sec(pop, False)
+        if kernels.AVAILABLE:
+            jit_rate = steps_per_sec(pop, True)
+            print(f"{pop:>5} {numpy_rate:>14,.1f} {jit_rate:>12,.1f} {jit_rate / numpy_rate:>7.1f}x")
+        else:
+            print(f"{pop:>5} {numpy_rate:>14,.1f} {'-':>12} {'-':>8}")
+    if not kernels.AVAILABLE:
+        return
+
+    for name in TRACKS:
+        print(f"{name:<8} bit-identical after {GENERATIONS} generations: {identical(load_track(name))}")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cold = first_step_seconds(cache_dir)
+        warm = first_step_seconds(cache_dir)
+    print(f"Import and first step: {cold:.2f}s compiling, {warm:.2f}s from the disk cache")
+
+
+if __name__ == "__main__":
+    main()
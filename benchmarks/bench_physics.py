@@ -0,0 +1,60 @@
+"""Car physics throughput: per-object Car.step loop vs one CarBatch.step.
+
+Run from the repository root:
+    python benchmarks/bench_physics.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from car import Car, CarBatch
+
+POPULATIONS = [5, 100, 1000, 10000]
+
+
+def time_loop(cars, steering, throttle, min_time=0.5):
+    steps = 0
+    start = time.perf_counter()
+    while True:
+        for car, s, t in zip(cars, steering, throttle):
+            car.step(s, t)
+        steps += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return steps * len(cars) / elapsed
+
+
+def time_batch(batch, steering, throttle, min_time=0.5):
+    steps = 0
+    start = time.perf_counter()
+    while True:
+        batch.step(steering, throttle)
+        steps += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return steps * batch.size / elapsed
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'pop':>7} {'Car loop (car-steps/s)':>24} {'CarBatch (car-steps/s)':>24} {'speedup':>8}")
+    for n in POPULATIONS:
+        # Gentle random controls keep speed inside the clamp range
+        steering = rng.choice([-1, -0.5, 0, 0.5, 1], size=n)
+        throttle = rng.choice([0, 1], size=n)
+
+        cars = [Car((0, 0, 0)) for _ in range(n)]
+        loop_rate = time_loop(cars, steering.tolist(), throttle.tolist())
+
+        batch = CarBatch(n)
+        batch_rate = time_batch(batch, steering, throttle)
+
+        print(f"{n:>7} {loop_rate:>24,.0f} {batch_rate:>24,.0f} {batch_rate / loop_rate:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Learner cost per simulation step: per-agent SarsaAgent calls vs one
+vectorized SarsaPopulation call, plus generation turnover (evolve).
+
+Run from the repository root:
+    python benchmarks/bench_population.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import SarsaAgent, SarsaPopulation
+from track import SENSOR_ANGLES
+
+POPULATIONS = [5, 100, 1000, 10000]
+STEPS = 50
+# Observations come from a fixed pool of distinct states, roughly what a
+# young population has explored, so the tensor size stays comparable
+STATE_POOL = 256
+
+
+class Reading:
+    def __init__(self, radars, speed):
+        self.radars = radars
+        self.speed = speed
+
+
+def random_observations(rng, pool, n):
+    pick = rng.integers(0, len(pool[0]), n)
+    return pool[0][pick], pool[1][pick]
+
+
+def time_agents(n, observations, rewards):
+    agents = [SarsaAgent() for _ in range(n)] if n <= 1000 else None
+    if agents is None:
+        return float('nan') # Dense per-agent tables for 10k agents need ~16 GB
+    prev = [None] * n
+    start = time.perf_counter()
+    for (radars, speeds), reward in zip(observations, rewards):
+        rows = radars.tolist()
+        for i, agent in enumerate(agents):
+            state = agent.get_state(Reading(list(zip(rows[i], SENSOR_ANGLES)), speeds[i]))
+            action = agent.choose_action(state)
+            if prev[i] is not None:
+                agent.update(prev[i][0], prev[i][1], reward[i], state, action)
+            prev[i] = (state, action)
+    return (time.perf_counter() - start) / len(observations)
+
+
+def time_population(n, observations, rewards):
+    population = SarsaPopulation(n, seed=0)
+    agents = np.arange(n)
+    prev_states = prev_actions = None
+    start = time.perf_counter()
+    for (radars, speeds), reward in zip(observations, rewards):
+        states = population.encode_states(radars, speeds)
+        actions = population.choose_actions(agents, states)
+        if prev_states is not None:
+            population.update(agents, prev_states, prev_actions, reward, states, actions)
+        prev_states, prev_actions = states, actions
+    step = (time.perf_counter() - start) / len(observations)
+
+    start = time.perf_counter()
+    population.evolve(np.random.default_rng(0).random(n))
+    return step, time.perf_counter() - start, population.nbytes / n
+
+
+def main():
+    rng = np.random.default_rng(0)
+    pool = (rng.choice(np.arange(5, 205, 5), size=(STATE_POOL, len(SENSOR_ANGLES))).astype(float),
+            rng.integers(0, 7, STATE_POOL).astype(float))
+    print(f"{'pop':>7} {'SarsaAgent loop/step':>21} {'SarsaPopulation/step':>21} {'evolve':>10} {'Q bytes/agent':>14}")
+    for n in POPULATIONS:
+        observations = [random_observations(rng, pool, n) for _ in range(STEPS)]
+        rewards = [rng.normal(0, 5, n) for _ in range(STEPS)]
+        loop = time_agents(n, observations, rewards)
+        step, evolve, per_agent = time_population(n, observations, rewards)
+        loop_text = "skipped" if np.isnan(loop) else f"{loop * 1e3:.3f} ms"
+        print(f"{n:>7} {loop_text:>21} {step * 1e3:>18.3f} ms {evolve * 1e3:>7.1f} ms {per_agent:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""'update' payload cost: bytes/frame and encode time for the JSON path vs
+the binary delta-encoded FrameEncoder, on frames from a live Simulation.
+The lod columns are the 'medium' and 'low' level-of-detail frames.
+
+Run from the repository root:
+    python benchmarks/bench_protocol.py
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from protocol import FrameEncoder, TrailBuffer, detail_settings, json_frame, lod_frame
+from simulation import Simulation
+
+POPULATIONS = [5, 100, 1000]
+FRAMES = 60
+STEPS_PER_FRAME = 1
+
+
+def main():
+    print(f"{'cars':>5} {'JSON bytes':>11} {'JSON encode':>12} {'binary bytes':>13} {'keyframe':>9} {'binary encode':>14} {'ratio':>6}"
+          f" {'lod medium':>11} {'lod low':>8}")
+    medium = detail_settings({'level': 'medium'})
+    low = detail_settings({'level': 'low'})
+    for n in POPULATIONS:
+        sim = Simulation(n, seed=0)
+        encoder = FrameEncoder()
+        json_bytes = json_time = bin_bytes = bin_time = 0
+        keyframe = 0
+        trails = TrailBuffer(n)
+        lod_bytes = {'medium': 0, 'low': 0}
+        for frame in range(FRAMES):
+            for _ in range(STEPS_PER_FRAME):
+                if sim.done:
+                    sim.next_generation()
+                sim.step()
+
+            start = time.perf_counter()
+            # Same separators python-socketio uses on the wire
+            payload = json.dumps(json_frame(sim), separators=(',', ':'))
+            json_time += time.perf_counter() - start
+            json_bytes += len(payload)
+
+            start = time.perf_counter()
+            data = encoder.encode(sim)
+            bin_time += time.perf_counter() - start
+            bin_bytes += len(data)
+            if frame == 0:
+                keyframe = len(data)
+
+            trails.push(sim.batch, sim.generation)
+            for level, settings in (('medium', medium), ('low', low)):
+                lod_bytes[level] += len(json.dumps(lod_frame(sim, settings, trails), separators=(',', ':')))
+            sim.batch.crashed.fill(False)
+
+        print(f"{n:>5} {json_bytes / FRAMES:>11,.0f} {json_time / FRAMES * 1e3:>9.3f} ms "
+              f"{bin_bytes / FRAMES:>13,.0f} {keyframe:>9,} {bin_time / FRAMES * 1e3:>11.3f} ms "
+              f"{json_bytes / bin_bytes:>5.1f}x {lod_bytes['medium'] / FRAMES:>11,.0f} {lod_bytes['low'] / FRAMES:>8,.0f}")
+
+
+if __name__ == "__main__":
+    main()
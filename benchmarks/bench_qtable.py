@@ -0,0 +1,138 @@
+"""Q-table backends: memory per agent, lookup latency and clone cost for
+the original dict agent vs the dense and sparse SarsaAgent tables.
+
+Each agent is first trained on the same stream of transitions drawn from
+real sensor readings so the tables hold a realistic number of entries.
+
+Run from the repository root:
+    python benchmarks/bench_qtable.py
+"""
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import ACTIONS, DenseQTable, SarsaAgent
+from car import CarBatch
+from track import Track, SENSOR_ANGLES
+
+N_TRANSITIONS = 20000
+
+
+class DictAgent:
+    # The original implementation, keyed by ((d1..d5, v), a)
+    def __init__(self):
+        self.q = {}
+        self.alpha = 0.1
+        self.gamma = 0.95
+        self.epsilon = 0.2
+
+    def get_state(self, car):
+        return tuple(int(r_len / 40) for r_len, _ in car.radars) + (int(car.speed),)
+
+    def choose_action(self, state):
+        qs = [self.q.get((state, a), 0) for a in range(len(ACTIONS))]
+        return int(np.argmax(qs))
+
+    def update(self, s, a, r, s2, a2):
+        old = self.q.get((s, a), 0)
+        next_q = self.q.get((s2, a2), 0)
+        self.q[(s, a)] = old + self.alpha * (r + self.gamma * next_q - old)
+
+    def clone_mutate(self):
+        child = DictAgent()
+        child.q = self.q.copy()
+        for k in child.q:
+            if random.random() < 0.05:
+                child.q[k] += random.uniform(-0.5, 0.5)
+        return child
+
+
+class Reading:
+    def __init__(self, radars, speed):
+        self.radars = radars
+        self.speed = speed
+
+
+def sensor_stream(n, seed=0):
+    # Random cars scattered on the track give realistic sensor tuples
+    rng = np.random.default_rng(seed)
+    track = Track()
+    batch = CarBatch(n)
+    batch.x[:] = rng.uniform(0, track.width, n)
+    batch.y[:] = rng.uniform(0, track.height, n)
+    batch.angle[:] = rng.uniform(-np.pi, np.pi, n)
+    batch.alive[:] = track.on_track_batch(batch.x, batch.y)
+    batch.speed[:] = rng.integers(0, 7, n)
+    radars = batch.sense(track, SENSOR_ANGLES)
+    live = np.flatnonzero(batch.alive)
+    return [Reading(list(zip(radars[i].tolist(), SENSOR_ANGLES)), batch.speed[i]) for i in live]
+
+
+def dict_bytes(q):
+    size = sys.getsizeof(q)
+    for (state, a), v in q.items():
+        size += sys.getsizeof((state, a)) + sys.getsizeof(state) + sys.getsizeof(v)
+    return size
+
+
+def table_bytes(agent):
+    if isinstance(agent.q, dict):
+        return dict_bytes(agent.q)
+    if isinstance(agent.q, DenseQTable):
+        return agent.q.values.nbytes + agent.q.seen.nbytes
+    return dict_bytes(agent.q.q)
+
+
+def train(agent, readings, actions, rewards):
+    states = [agent.get_state(r) for r in readings]
+    for i in range(1, len(states)):
+        agent.update(states[i - 1], actions[i - 1], rewards[i], states[i], actions[i])
+    return states
+
+
+def per_call_us(fn, args, repeats=3):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for a in args:
+            fn(*a)
+        best = min(best, (time.perf_counter() - start) / len(args))
+    return best * 1e6
+
+
+def main():
+    random.seed(0)
+    np.random.seed(0)
+    readings = sensor_stream(N_TRANSITIONS)
+    rng = np.random.default_rng(1)
+    actions = rng.integers(0, len(ACTIONS), len(readings)).tolist()
+    rewards = rng.normal(0, 5, len(readings)).tolist()
+
+    backends = [
+        ("dict (original)", DictAgent()),
+        ("dense", SarsaAgent(dense=True)),
+        ("sparse", SarsaAgent(dense=False)),
+    ]
+
+    print(f"transitions: {len(readings)}")
+    print(f"{'backend':<16} {'entries':>8} {'memory/agent':>14} {'choose_action':>14} {'update':>10} {'clone_mutate':>13}")
+    for name, agent in backends:
+        agent.epsilon = 0 # Time the greedy lookup
+        states = train(agent, readings, actions, rewards)
+
+        lookup = per_call_us(agent.choose_action, [(s,) for s in states])
+        update = per_call_us(agent.update, [(states[i - 1], actions[i - 1], rewards[i], states[i], actions[i])
+                                            for i in range(1, len(states))])
+        clone = per_call_us(agent.clone_mutate, [()] * 20)
+
+        print(f"{name:<16} {len(agent.q):>8} {table_bytes(agent) / 1024:>11,.0f} KB "
+              f"{lookup:>11.2f} us {update:>7.2f} us {clone / 1000:>10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Steps saved by early termination (termination.KillRules + StepBudget).
+
+Trains the same seeded population with and without the rules and compares
+simulation steps and car-steps per generation, wall time and the best
+distance of the last generations (to check the kills don't cost fitness).
+
+Run from the repository root:
+    python benchmarks/bench_termination.py
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulation import Simulation
+from termination import KillRules, StepBudget
+from tracks import load_track
+
+TRACKS = ['stadium', 'hairpin', 'kidney']
+POP = 20
+GENERATIONS = 30
+SEED = 0
+
+
+def train(track, **options):
+    sim = Simulation(POP, seed=SEED, track=track, **options)
+    history = []
+    start = time.perf_counter()
+    for _ in range(GENERATIONS):
+        sim.run_generation()
+        stats = sim.next_generation()
+        if stats:
+            history.append(stats)
+    elapsed = time.perf_counter() - start
+    return {
+        'steps': np.mean([h['steps'] for h in history]),
+        'car_steps': sim.car_steps / GENERATIONS,
+        'killed': sum(h.get('killed_stall', 0) + h.get('killed_slow', 0) + h.get('killed_revisit', 0) for h in history),
+        'best': np.mean([h['distance'] for h in history[-10:]]),
+        'limit': sim.step_limit,
+        'seconds': elapsed,
+    }
+
+
+def main():
+    print(f"pop {POP}, {GENERATIONS} generations, seed {SEED}")
+    print(f"{'track':<9} {'rules':<5} {'steps/gen':>10} {'car-steps/gen':>14} {'saved':>7} {'killed':>7} "
+          f"{'step limit':>11} {'best (last 10)':>15} {'time':>7}")
+    for name in TRACKS:
+        track = load_track(name)
+        off = train(track)
+        on = train(track, kill_rules=KillRules(), step_budget=StepBudget())
+        for label, r in (('off', off), ('on', on)):
+            saved = 1 - r['car_steps'] / off['car_steps']
+            print(f"{name:<9} {label:<5} {r['steps']:>10,.0f} {r['car_steps']:>14,.0f} {saved:>6.1%} {r['killed']:>7} "
+                  f"{r['limit']:>11} {r['best']:>15,.0f} {r['seconds']:>6.1f}s")
+
+
+if __name__ == "__main__":
+    main()
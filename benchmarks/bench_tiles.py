@@ -0,0 +1,92 @@
+"""Tile-coded SARSA(lambda) vs the tabular learners: updates/sec and
+memory per agent.
+
+The dict table is the original per-agent learner (one Python update per
+agent per step). SarsaPopulation and TileCodingPopulation update the whole
+population in one call. All three learn from the same real sensor readings;
+memory is measured after training, when the tabular tables have grown.
+
+Run from the repository root:
+    python benchmarks/bench_tiles.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import ACTIONS, SarsaPopulation, TileCodingPopulation
+from bench_qtable import DictAgent, dict_bytes, sensor_stream
+
+POP = 1000
+STEPS = 200
+DICT_AGENTS = 20 # The dict loop is timed on a few agents and scaled per update
+
+
+def observations(readings, rng):
+    radars = np.array([[r for r, _ in reading.radars] for reading in readings])
+    speeds = np.array([float(reading.speed) for reading in readings])
+    picks = [rng.integers(0, len(readings), POP) for _ in range(STEPS)]
+    return [(radars[p], speeds[p]) for p in picks]
+
+
+def time_dict(readings, rng):
+    agents = [DictAgent() for _ in range(DICT_AGENTS)]
+    picks = rng.integers(0, len(readings), (DICT_AGENTS, STEPS))
+    rewards = rng.normal(0, 5, (DICT_AGENTS, STEPS)).tolist()
+    start = time.perf_counter()
+    for agent, pick, reward in zip(agents, picks.tolist(), rewards):
+        prev = None
+        for i, k in enumerate(pick):
+            state = agent.get_state(readings[k])
+            action = agent.choose_action(state)
+            if prev is not None:
+                agent.update(prev[0], prev[1], reward[i], state, action)
+            prev = (state, action)
+    rate = DICT_AGENTS * (STEPS - 1) / (time.perf_counter() - start)
+    return rate, np.mean([dict_bytes(agent.q) for agent in agents])
+
+
+def time_population(population, steps, rng):
+    agents = np.arange(POP)
+    rewards = rng.normal(0, 5, (STEPS, POP))
+    prev = None
+    start = time.perf_counter()
+    for (radars, speeds), reward in zip(steps, rewards):
+        states = population.encode_states(radars, speeds)
+        actions = population.choose_actions(agents, states)
+        if prev is not None:
+            population.update(agents, prev[0], prev[1], reward, states, actions)
+        prev = (states, actions)
+    rate = POP * (STEPS - 1) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    population.evolve(rng.random(POP))
+    return rate, time.perf_counter() - start
+
+
+def main():
+    rng = np.random.default_rng(0)
+    readings = sensor_stream(5000)
+    steps = observations(readings, rng)
+
+    print(f"pop {POP}, {STEPS} steps, {len(ACTIONS)} actions")
+    print(f"{'learner':<22} {'updates/s':>12} {'memory/agent':>14} {'evolve':>10}")
+    rate, size = time_dict(readings, rng)
+    print(f"{'dict (per agent)':<22} {rate:>12,.0f} {size / 1024:>11,.1f} KB {'-':>10}")
+
+    tabular = SarsaPopulation(POP, seed=0)
+    rate, evolve = time_population(tabular, steps, rng)
+    size = tabular.nbytes / POP
+    print(f"{'SarsaPopulation':<22} {rate:>12,.0f} {size / 1024:>11,.1f} KB {evolve * 1e3:>7.1f} ms")
+
+    tiles = TileCodingPopulation(POP, seed=0)
+    rate, evolve = time_population(tiles, steps, rng)
+    size = (tiles.w.nbytes + tiles.trace_features.nbytes + tiles.trace_actions.nbytes) / POP
+    print(f"{'TileCodingPopulation':<22} {rate:>12,.0f} {size / 1024:>11,.1f} KB {evolve * 1e3:>7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
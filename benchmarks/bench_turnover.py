@@ -0,0 +1,80 @@
+"""Generation turnover: evolve() latency and memory for the copy-on-write
+paged SarsaPopulation vs the dense (pop, slots, actions) tensor it replaced.
+
+The dense reference below is the previous evolve: clone every child's
+table with one fancy-index copy, then roll a random number per learned
+entry. Both populations learn the same transitions first, so they hold
+the same tables when evolve() is timed.
+
+Run from the repository root:
+    python benchmarks/bench_turnover.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import SarsaPopulation
+
+# (population, distinct states visited, learned entries per agent)
+CASES = [(100, 2000, 500), (1000, 2000, 500), (1000, 20000, 2000), (200, 50000, 10000)]
+ROUNDS = 3
+
+
+def dense_evolve(q, seen, fitness, rng, elite=3, mutation_rate=0.05, mutation_scale=0.5):
+    order = np.argsort(-fitness, kind='stable')
+    parents = np.empty(len(q), dtype=np.int64)
+    parents[0] = order[0]
+    parents[1:] = rng.choice(order[:elite], len(q) - 1)
+    q = q[parents]
+    seen = seen[parents]
+    keys = np.flatnonzero(seen)
+    keys = keys[rng.random(keys.size) < mutation_rate]
+    q.reshape(-1)[keys] += rng.uniform(-mutation_scale, mutation_scale, keys.size)
+    return q, seen
+
+
+def learned_population(n, n_states, per_agent, rng):
+    population = SarsaPopulation(n, seed=0)
+    population.slots_for(np.arange(n_states))
+    agents = np.repeat(np.arange(n), per_agent)
+    slots = rng.integers(0, n_states, agents.size)
+    actions = rng.integers(0, population.n_actions, agents.size)
+    # Written through update() so pages are allocated the way training does it
+    for chunk in np.array_split(np.arange(agents.size), per_agent):
+        a, s, act = agents[chunk], slots[chunk], actions[chunk]
+        population.update(a, s, act, rng.normal(0, 5, a.size), s, act)
+    return population
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(f"{'pop':>5} {'states':>7} {'learned':>8} {'dense evolve':>13} {'paged evolve':>13} {'speedup':>8} "
+          f"{'dense MB':>9} {'paged MB':>9}")
+    for n, n_states, per_agent in CASES:
+        population = learned_population(n, n_states, per_agent, rng)
+        tables = population.get_tables()
+        q, seen = tables['q'], tables['seen']
+        dense_mb = (q.nbytes + seen.nbytes) / 2 ** 20
+
+        dense = paged = float('inf')
+        for _ in range(ROUNDS):
+            fitness = rng.random(n)
+            start = time.perf_counter()
+            dense_evolve(q, seen, fitness, rng)
+            dense = min(dense, time.perf_counter() - start)
+
+            start = time.perf_counter()
+            population.evolve(fitness)
+            paged = min(paged, time.perf_counter() - start)
+        paged_mb = population.nbytes / 2 ** 20
+
+        print(f"{n:>5} {n_states:>7} {per_agent:>8} {dense * 1e3:>10.1f} ms {paged * 1e3:>10.1f} ms "
+              f"{dense / paged:>7.1f}x {dense_mb:>9.1f} {paged_mb:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
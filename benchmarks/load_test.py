@@ -0,0 +1,134 @@
+"""Load test: many Socket.IO viewers against a running server.
+
+Each viewer is a python-socketio AsyncClient on one event loop (needs
+aiohttp: pip install aiohttp). Viewers ack every frame like the page does
+and ping the server's 'latency' echo once a second.
+
+    python async_server.py --port 5055 &
+    python benchmarks/load_test.py --url http://localhost:5055 --clients 300 --duration 20
+
+Reports frames/sec per viewer, the gaps between frames, the echo round trip
+and the server's own event loop lag from /stats. The latency echo only
+exists in async_server.py; against web_server.py only frame stats are shown.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import urllib.request
+
+import numpy as np
+import socketio
+
+
+class Viewer:
+    def __init__(self, url, binary, query):
+        self.url = url
+        self.binary = binary
+        self.query = query
+        self.client = socketio.AsyncClient(reconnection=False)
+        self.arrivals = []
+        self.rtts = []
+        self.connected = False
+        self.client.on('update', self.on_frame)
+        self.client.on('frame', self.on_frame)
+
+    async def on_frame(self, data):
+        self.arrivals.append(time.perf_counter())
+        return True # The ack
+
+    async def run(self, duration):
+        try:
+            await self.client.connect(f"{self.url}?{self.query}" if self.query else self.url,
+                                      transports=['websocket'], wait_timeout=30)
+        except Exception as e:
+            print(f"connect failed: {e}", file=sys.stderr)
+            return
+        self.connected = True
+        if self.binary:
+            await self.client.emit('set_protocol', {'binary': True})
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            await asyncio.sleep(1.0)
+            start = time.perf_counter()
+            try:
+                await self.client.call('latency', {}, timeout=5)
+                self.rtts.append(time.perf_counter() - start)
+            except Exception:
+                pass # No echo (web_server.py) or it timed out
+        await self.client.disconnect()
+
+
+def percentiles(values, qs=(50, 99)):
+    if not len(values):
+        return ['-'] * len(qs)
+    return [f"{v * 1000:.1f}" for v in np.percentile(values, qs)]
+
+
+async def main_async(args):
+    viewers = [Viewer(args.url, args.binary, args.query) for _ in range(args.clients)]
+    tasks = []
+    for i, viewer in enumerate(viewers):
+        tasks.append(asyncio.create_task(viewer.run(args.duration)))
+        if i % args.ramp_batch == args.ramp_batch - 1:
+            await asyncio.sleep(0.2) # Ramp up instead of one connect storm
+    await asyncio.gather(*tasks)
+    return viewers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.IO load test for the race server")
+    parser.add_argument('--url', default='http://localhost:5001')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=20, help="Seconds each viewer stays connected")
+    parser.add_argument('--binary', action='store_true', help="Viewers use the binary frame protocol")
+    parser.add_argument('--query', default='', help="Connect query, e.g. session=load&pop=50")
+    parser.add_argument('--ramp-batch', type=int, default=25, help="Viewers connected per 0.2 s")
+    parser.add_argument('--output', metavar='FILE', help="Write the summary as JSON")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    viewers = asyncio.run(main_async(args))
+    elapsed = time.perf_counter() - started
+
+    connected = [v for v in viewers if v.connected]
+    # Skip the first second of frames, while the ramp is still connecting
+    rates, gaps, rtts = [], [], []
+    for v in connected:
+        arrivals = np.array(v.arrivals)
+        arrivals = arrivals[arrivals > arrivals[0] + 1.0] if arrivals.size else arrivals
+        if arrivals.size > 1:
+            rates.append((arrivals.size - 1) / (arrivals[-1] - arrivals[0]))
+            gaps.extend(np.diff(arrivals))
+        rtts.extend(v.rtts)
+
+    try:
+        with urllib.request.urlopen(args.url.rstrip('/') + '/stats', timeout=5) as response:
+            server = json.load(response)
+    except Exception:
+        server = {}
+
+    summary = {
+        'clients': args.clients,
+        'connected': len(connected),
+        'elapsed_s': round(elapsed, 1),
+        'fps_mean': round(float(np.mean(rates)), 2) if rates else 0,
+        'fps_min': round(float(np.min(rates)), 2) if rates else 0,
+        'gap_p50_ms': percentiles(gaps)[0],
+        'gap_p99_ms': percentiles(gaps)[1],
+        'rtt_p50_ms': percentiles(rtts)[0],
+        'rtt_p99_ms': percentiles(rtts)[1],
+        'rtt_max_ms': f"{max(rtts) * 1000:.1f}" if rtts else '-',
+        'server': {k: v for k, v in server.items() if k.startswith('loop_lag') or k in
+                   ('frames_sent', 'frames_dropped', 'physics_steps_per_sec', 'clients_total')},
+    }
+    for key, value in summary.items():
+        print(f"{key:<12} {value}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
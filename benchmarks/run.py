@@ -0,0 +1,347 @@
+"""Benchmark suite with regression tracking.
+
+Runs fixed-seed benchmarks of the simulator, learner and server payloads,
+writes the results as JSON and compares them against a stored baseline:
+
+    python benchmarks/run.py                        # run and compare with benchmarks/baseline.json
+    python benchmarks/run.py --output results.json  # also keep the results
+    python benchmarks/run.py --only radar car       # a subset, by name prefix
+    python benchmarks/run.py --tolerance 0.3 --tolerance generation=0.5
+    python benchmarks/run.py --update-baseline      # accept the current numbers
+
+Every metric says whether higher or lower is better. A metric regresses
+when it is worse than the baseline by more than its tolerance (a fraction,
+0.25 by default). The exit status is 1 if anything regressed, so this can
+gate CI. Rates and times depend on the machine, so a baseline only means
+something on the box it was recorded on.
+
+Run from the repository root; no display or browser is needed.
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import ACTIONS, SarsaAgent, SarsaPopulation, StateEncoder, TileCodingPopulation
+from car import Car, CarBatch
+from protocol import FrameEncoder, detail_settings, json_frame, lod_frame
+from simulation import Simulation
+from track import Track, SENSOR_ANGLES
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_TOLERANCE = 0.25
+GENERATION_POPS = [5, 50, 500]
+SPARSE_SIZES = [1000, 10000, 100000]
+DENSE_BUCKETS = [40, 25] # StateEncoder bucket widths, smaller is a bigger table
+
+
+class Runner:
+    """Times callables and collects metrics."""
+    def __init__(self, min_time=0.3, repeats=3):
+        self.min_time = min_time
+        self.repeats = repeats
+        self.metrics = {}
+
+    def rate(self, fn, ops_per_call=1):
+        """Best of `repeats` runs of ops/sec, each calling fn for at least min_time."""
+        best = 0.0
+        for _ in range(self.repeats):
+            calls = 0
+            start = time.perf_counter()
+            while True:
+                fn()
+                calls += 1
+                elapsed = time.perf_counter() - start
+                if elapsed >= self.min_time:
+                    break
+            best = max(best, calls * ops_per_call / elapsed)
+        return best
+
+    def seconds(self, fn):
+        """Best of `repeats` wall times of one fn call."""
+        best = float('inf')
+        for _ in range(self.repeats):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    def add(self, name, value, unit, better):
+        self.metrics[name] = {'value': float(value), 'unit': unit, 'better': better}
+
+
+def on_track_poses(track, n, rng):
+    poses = []
+    while len(poses) < n:
+        x = rng.uniform(0, track.width)
+        y = rng.uniform(0, track.height)
+        if track.on_track(x, y):
+            poses.append((x, y, rng.uniform(-math.pi, math.pi)))
+    return poses
+
+
+# --- Benchmarks ---
+
+def bench_radar(runner):
+    track = Track()
+    poses = on_track_poses(track, 2000, np.random.default_rng(0))
+
+    def single():
+        for x, y, a in poses:
+            track.get_radar(x, y, a)
+    runner.add('radar.get_radar', runner.rate(single, len(poses)), 'rays/s', 'higher')
+
+    xs, ys, angles = (np.array(c) for c in zip(*poses[:1000]))
+    runner.add('radar.get_radars_batch_1000', runner.rate(
+        lambda: track.get_radars_batch(xs, ys, angles, SENSOR_ANGLES), len(xs) * len(SENSOR_ANGLES)), 'rays/s', 'higher')
+
+
+def bench_car(runner):
+    rng = np.random.default_rng(0)
+    steering = rng.choice([-1, -0.5, 0, 0.5, 1], size=100).tolist()
+    throttle = rng.choice([0, 1], size=100).tolist()
+    cars = [Car((0, 0, 0)) for _ in range(100)]
+
+    def loop():
+        for car, s, t in zip(cars, steering, throttle):
+            car.step(s, t)
+    runner.add('car.step', runner.rate(loop, len(cars)), 'steps/s', 'higher')
+
+    batch = CarBatch(1000)
+    steering = rng.choice([-1, -0.5, 0, 0.5, 1], size=1000)
+    throttle = rng.choice([0, 1], size=1000)
+    runner.add('car.batch_step_1000', runner.rate(lambda: batch.step(steering, throttle), batch.size),
+               'car-steps/s', 'higher')
+
+
+def bench_agent(runner):
+    random.seed(0)
+    np.random.seed(0)
+    rng = np.random.default_rng(0)
+    agent = SarsaAgent()
+    # A few thousand distinct states, roughly what a trained agent visits
+    states = rng.integers(0, agent.encoder.n_states, 4096).tolist()
+    actions = rng.integers(0, len(ACTIONS), len(states)).tolist()
+    rewards = rng.normal(0, 5, len(states)).tolist()
+
+    def update():
+        for i in range(1, len(states)):
+            agent.update(states[i - 1], actions[i - 1], rewards[i], states[i], actions[i])
+    runner.add('agent.update', runner.rate(update, len(states) - 1), 'ops/s', 'higher')
+
+    def choose():
+        for s in states:
+            agent.choose_action(s)
+    runner.add('agent.choose_action', runner.rate(choose, len(states)), 'ops/s', 'higher')
+
+    # The vectorized learner the simulation actually uses, one step of 1000 cars
+    population = SarsaPopulation(1000, seed=0)
+    agents = np.arange(1000)
+    radars = rng.choice(np.arange(5, 205, 5), size=(1000, len(SENSOR_ANGLES))).astype(float)
+    speeds = rng.integers(0, 7, 1000).astype(float)
+    s = population.encode_states(radars, speeds)
+    a = population.choose_actions(agents, s)
+    r = rng.normal(0, 5, 1000)
+
+    def population_step():
+        s2 = population.encode_states(radars, speeds)
+        a2 = population.choose_actions(agents, s2)
+        population.update(agents, s, a, r, s2, a2)
+    runner.add('agent.population_step_1000', 1e3 / runner.rate(population_step), 'ms', 'lower')
+
+    # Same step for the tile-coded SARSA(lambda) learner, traces full
+    tiles = TileCodingPopulation(1000, seed=0)
+    ts = tiles.encode_states(radars, speeds)
+    ta = tiles.choose_actions(agents, ts)
+    for _ in range(tiles.trace_actions.shape[1]):
+        tiles.update(agents, ts, ta, r, ts, ta)
+
+    def tiles_step():
+        s2 = tiles.encode_states(radars, speeds)
+        a2 = tiles.choose_actions(agents, s2)
+        tiles.update(agents, ts, ta, r, s2, a2)
+    runner.add('agent.tiles_step_1000', 1e3 / runner.rate(tiles_step), 'ms', 'lower')
+
+
+def bench_clone_mutate(runner):
+    random.seed(0)
+    np.random.seed(0)
+    for bucket in DENSE_BUCKETS:
+        agent = SarsaAgent(StateEncoder(bucket=bucket), dense=True)
+        rng = np.random.default_rng(0)
+        for s in rng.integers(0, agent.encoder.n_states, 20000).tolist():
+            agent.q.set(s, s % len(ACTIONS), 1.0)
+        size = agent.encoder.n_states * len(ACTIONS)
+        runner.add(f'clone_mutate.dense_{size}', 1e3 / runner.rate(agent.clone_mutate), 'ms', 'lower')
+
+    for n in SPARSE_SIZES:
+        agent = SarsaAgent(dense=False)
+        rng = np.random.default_rng(0)
+        for s in rng.choice(agent.encoder.n_states * len(ACTIONS), n, replace=False).tolist():
+            agent.q.set(s // len(ACTIONS), s % len(ACTIONS), 1.0)
+        runner.add(f'clone_mutate.sparse_{n}', 1e3 / runner.rate(agent.clone_mutate), 'ms', 'lower')
+
+    # Generation turnover of a whole population: page sharing plus bulk mutation
+    population = SarsaPopulation(1000, seed=0)
+    population.slots_for(np.arange(2000))
+    agents = np.arange(1000)
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        s = rng.integers(0, 2000, 1000)
+        a = rng.integers(0, len(ACTIONS), 1000)
+        population.update(agents, s, a, rng.normal(0, 5, 1000), s, a)
+    fitness = rng.random(1000)
+    runner.add('clone_mutate.population_1000', 1e3 / runner.rate(lambda: population.evolve(fitness)), 'ms', 'lower')
+
+
+def bench_generation(runner):
+    for pop in GENERATION_POPS:
+        def generation():
+            # Same seed every repeat, so every repeat runs the same generations
+            sim = Simulation(pop, seed=0)
+            for _ in range(3):
+                sim.run_generation()
+                sim.next_generation()
+        runner.add(f'generation.pop_{pop}', runner.seconds(generation) / 3 * 1e3, 'ms', 'lower')
+
+
+def bench_payload(runner):
+    sim = Simulation(100, seed=0)
+    for _ in range(20):
+        sim.step()
+    encoder = FrameEncoder()
+    runner.add('payload.json_encode_100', 1e6 / runner.rate(
+        lambda: json.dumps(json_frame(sim), separators=(',', ':'))), 'us', 'lower')
+    runner.add('payload.binary_encode_100', 1e6 / runner.rate(lambda: encoder.encode(sim)), 'us', 'lower')
+    runner.add('payload.binary_keyframe_100', 1e6 / runner.rate(lambda: encoder.keyframe(sim)), 'us', 'lower')
+    # Level-of-detail frames are meant for big populations
+    big = Simulation(1000, seed=0)
+    for _ in range(20):
+        big.step()
+    medium = detail_settings({'level': 'medium'})
+    runner.add('payload.lod_medium_1000', 1e6 / runner.rate(
+        lambda: json.dumps(lod_frame(big, medium), separators=(',', ':'))), 'us', 'lower')
+
+
+BENCHMARKS = [
+    ('radar', bench_radar),
+    ('car', bench_car),
+    ('agent', bench_agent),
+    ('clone_mutate', bench_clone_mutate),
+    ('generation', bench_generation),
+    ('payload', bench_payload),
+]
+
+
+# --- Results ---
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'system': platform.system(),
+        'cpus': os.cpu_count(),
+    }
+
+def parse_tolerances(values):
+    """['0.3', 'generation=0.5'] -> (0.3, {'generation': 0.5})"""
+    default = DEFAULT_TOLERANCE
+    per_metric = {}
+    for value in values or []:
+        if '=' in value:
+            name, value = value.split('=', 1)
+            per_metric[name] = float(value)
+        else:
+            default = float(value)
+    return default, per_metric
+
+def tolerance_for(name, default, per_metric):
+    # Longest matching prefix wins, so 'generation' covers 'generation.pop_5'
+    matches = [prefix for prefix in per_metric if name == prefix or name.startswith(prefix + '.')]
+    return per_metric[max(matches, key=len)] if matches else default
+
+def compare(metrics, baseline, default, per_metric):
+    """Rows of (name, value, base, change, status); change > 0 is an improvement."""
+    rows = []
+    for name, metric in metrics.items():
+        base = baseline.get(name)
+        if base is None:
+            rows.append((name, metric, None, None, 'new'))
+            continue
+        if metric['better'] == 'higher':
+            change = metric['value'] / base['value'] - 1
+        else:
+            change = base['value'] / metric['value'] - 1
+        status = 'REGRESSED' if change < -tolerance_for(name, default, per_metric) else 'ok'
+        rows.append((name, metric, base, change, status))
+    return rows
+
+def print_rows(rows):
+    print(f"{'metric':<34} {'value':>14} {'baseline':>14} {'unit':<11} {'change':>8}  status")
+    for name, metric, base, change, status in rows:
+        base_text = '-' if base is None else f"{base['value']:,.3f}"
+        change_text = '-' if change is None else f"{change:+.1%}"
+        print(f"{name:<34} {metric['value']:>14,.3f} {base_text:>14} {metric['unit']:<11} {change_text:>8}  {status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and compare against a baseline")
+    parser.add_argument('--only', nargs='+', metavar='NAME', help="Benchmarks to run: " + ", ".join(n for n, _ in BENCHMARKS))
+    parser.add_argument('--output', metavar='FILE', help="Write the results as JSON")
+    parser.add_argument('--baseline', default=BASELINE, help="Baseline JSON to compare against")
+    parser.add_argument('--tolerance', action='append', metavar='[METRIC=]FRACTION',
+                        help=f"Allowed slowdown, default {DEFAULT_TOLERANCE}; repeat with METRIC=F per metric prefix")
+    parser.add_argument('--update-baseline', action='store_true', help="Store these results as the baseline")
+    parser.add_argument('--quick', action='store_true', help="Shorter timings, noisier numbers")
+    args = parser.parse_args()
+    default, per_metric = parse_tolerances(args.tolerance)
+
+    runner = Runner(min_time=0.05, repeats=1) if args.quick else Runner()
+    for name, bench in BENCHMARKS:
+        if args.only and not any(name.startswith(o) for o in args.only):
+            continue
+        start = time.perf_counter()
+        bench(runner)
+        print(f"{name:<14} {time.perf_counter() - start:6.1f} s", file=sys.stderr)
+
+    results = {'environment': environment(), 'metrics': runner.metrics}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['metrics']
+    rows = compare(runner.metrics, baseline, default, per_metric)
+    print_rows(rows)
+
+    if args.update_baseline:
+        # Keep baseline entries for benchmarks that were not run this time
+        baseline.update(runner.metrics)
+        with open(args.baseline, 'w') as f:
+            json.dump({'environment': environment(), 'metrics': dict(sorted(baseline.items()))}, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    regressed = [row[0] for row in rows if row[4] == 'REGRESSED']
+    if regressed:
+        print(f"{len(regressed)} regression(s): {', '.join(regressed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
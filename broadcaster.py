@@ -0,0 +1,276 @@
+"""Fixed-rate frame broadcaster, decoupled from the physics thread.
+
+The physics thread calls publish() whenever due() says a frame is wanted.
+That copies the visible simulation state into one of two preallocated
+snapshot buffers and never blocks on the network. A separate thread wakes
+`rate` times a second and sends the newest snapshot to every client.
+
+Every frame is acknowledged by the client. A client with max_lag frames
+still unacknowledged is skipped, and those frames count as dropped. Binary
+clients that skipped a frame get a keyframe next so their delta state
+resyncs. Clients on a lower level of detail get lod frames, one encoding
+per distinct detail setting.
+"""
+import threading
+import time
+from functools import partial
+
+import numpy as np
+
+from profiler import lap_fn
+from protocol import FrameEncoder, TrailBuffer, detail_key, json_frame, lod_frame
+
+class _BatchSnapshot:
+    def __init__(self):
+        self.x = self.y = self.angle = self.distance = np.zeros(0)
+        self.alive = self.crashed = np.zeros(0, dtype=bool)
+        self.radars = np.zeros((0, 0))
+
+    def copy_from(self, batch):
+        for name in ('x', 'y', 'angle', 'distance', 'alive', 'crashed', 'radars'):
+            src = getattr(batch, name, None)
+            if src is None:
+                src = np.zeros(len(batch.x)) # Replays don't record distance
+            dst = getattr(self, name)
+            if dst.shape == src.shape:
+                np.copyto(dst, src)
+            else:
+                setattr(self, name, src.copy())
+
+
+class Snapshot:
+    """The fields of a Simulation that frame encoders read."""
+    def __init__(self):
+        self.batch = _BatchSnapshot()
+        self.pop_size = 0
+        self.alive = 0
+        self.steps = 0
+        self.generation = 0
+
+    def capture(self, sim):
+        self.batch.copy_from(sim.batch)
+        self.pop_size = sim.pop_size
+        self.alive = sim.alive
+        self.steps = sim.steps
+        self.generation = sim.generation
+
+
+class RateMeter:
+    """Events per second over a sliding window of about one second."""
+    def __init__(self, window=1.0):
+        self.window = window
+        self.count = 0
+        self.total = 0
+        self.start = time.perf_counter()
+        self.rate = 0.0
+
+    def add(self, n=1):
+        self.count += n
+        self.total += n
+        now = time.perf_counter()
+        if now - self.start >= self.window:
+            self.rate = self.count / (now - self.start)
+            self.count = 0
+            self.start = now
+
+
+class ClientState:
+    def __init__(self, sid, binary=False):
+        self.sid = sid
+        self.binary = binary
+        self.sent = 0
+        self.acked = 0
+        self.dropped = 0
+        self.needs_key = True
+        self.rtt = 0.0
+        self.last_ack = time.perf_counter()
+        self.detail = None # lod settings (protocol.detail_settings), None for full detail
+
+    @property
+    def lag(self):
+        return self.sent - self.acked
+
+
+class Broadcaster:
+    def __init__(self, socketio, rate=30, max_lag=3, ack_timeout=5.0):
+        self.socketio = socketio
+        self.rate = rate
+        self.max_lag = max_lag
+        self.ack_timeout = ack_timeout
+        self.encoder = FrameEncoder()
+        self.trails = None # TrailBuffer, while a client wants lod trails
+        self.clients = {}
+        self.profiler = None # Optional profiler.Profiler, times encoding and emits
+
+        # Double buffer: physics writes one snapshot while the sender reads the other
+        self._buffers = [Snapshot(), Snapshot()]
+        self._latest = None
+        self._reading = None
+        self._writing = None
+        self._fresh = False
+        self._lock = threading.Lock()
+        self._last_publish = 0.0
+        self._thread = None
+        self.running = False
+
+        self.physics = RateMeter()
+        self.frames_published = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.frames_stale = 0
+
+    # --- Clients ---
+    def add_client(self, sid):
+        self.clients[sid] = ClientState(sid)
+
+    def remove_client(self, sid):
+        self.clients.pop(sid, None)
+
+    def set_binary(self, sid, binary):
+        client = self.clients.setdefault(sid, ClientState(sid))
+        client.binary = binary
+        client.needs_key = True
+
+    def set_detail(self, sid, settings):
+        client = self.clients.setdefault(sid, ClientState(sid))
+        client.detail = settings
+        client.needs_key = True
+
+    def request_keyframe(self):
+        self.encoder.request_keyframe()
+
+    # --- Physics thread side ---
+    def count_steps(self, n=1):
+        self.physics.add(n)
+
+    def due(self):
+        return time.perf_counter() - self._last_publish >= 1 / self.rate
+
+    def publish(self, sim):
+        with self._lock:
+            # Never the buffer being sent, and preferably not the newest one
+            # so the sender can still pick that up while we write
+            free = [b for b in self._buffers if b is not self._reading]
+            target = next((b for b in free if b is not self._latest), free[0])
+            self._writing = target
+        target.capture(sim)
+        if any(c.detail and c.detail['trails'] for c in list(self.clients.values())):
+            if self.trails is None:
+                self.trails = TrailBuffer(sim.pop_size)
+            self.trails.push(target.batch, target.generation)
+        else:
+            self.trails = None
+        with self._lock:
+            self._writing = None
+            self._latest = target
+            self._fresh = True
+        self._last_publish = time.perf_counter()
+        self.frames_published += 1
+
+    # --- Sender thread side ---
+    def start(self):
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        next_tick = time.perf_counter()
+        while self.running:
+            next_tick += 1 / self.rate
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.perf_counter() # Fell behind, don't burst to catch up
+
+            with self._lock:
+                if not self._fresh or self._latest is self._writing:
+                    self.frames_stale += 1
+                    continue
+                snap = self._reading = self._latest
+                self._fresh = False
+            try:
+                self._send(snap)
+            except Exception as e:
+                print(f"Broadcast Error: {e}")
+            finally:
+                with self._lock:
+                    self._reading = None
+
+    def _send(self, snap):
+        lap = lap_fn(self.profiler)
+        clients = list(self.clients.values())
+        json_payload = None
+        delta = None
+        keyframe = None
+        lod_payloads = {}
+        if any(c.binary and c.detail is None for c in clients):
+            delta = self.encoder.encode(snap)
+        else:
+            self.encoder.request_keyframe()
+        lap('encode')
+
+        now = time.perf_counter()
+        for client in clients:
+            if client.lag >= self.max_lag:
+                if now - client.last_ack < self.ack_timeout:
+                    # Behind: drop this frame for this client only
+                    client.dropped += 1
+                    client.needs_key = True
+                    self.frames_dropped += 1
+                    continue
+                # Acks stopped coming (old page or lost callbacks), start over
+                client.acked = client.sent
+
+            if client.detail is not None:
+                key = detail_key(client.detail)
+                if key not in lod_payloads:
+                    lod_payloads[key] = lod_frame(snap, client.detail, self.trails)
+                data = lod_payloads[key]
+                event = 'lod'
+            elif client.binary:
+                data = delta
+                if client.needs_key and delta[1] != 0:
+                    if keyframe is None:
+                        keyframe = self.encoder.keyframe(snap)
+                    data = keyframe
+                client.needs_key = False
+                event = 'frame'
+            else:
+                if json_payload is None:
+                    json_payload = json_frame(snap)
+                data = json_payload
+                event = 'update'
+
+            client.sent += 1
+            self.socketio.emit(event, data, to=client.sid, callback=partial(self._ack, client, now))
+            self.frames_sent += 1
+        lap('emit')
+
+    def _ack(self, client, sent_at, *args):
+        now = time.perf_counter()
+        client.acked = min(client.sent, client.acked + 1)
+        client.rtt = now - sent_at
+        client.last_ack = now
+
+    def metrics(self):
+        return {
+            'physics_steps_per_sec': round(self.physics.rate, 1),
+            'physics_steps': self.physics.total,
+            'broadcast_rate': self.rate,
+            'frames_published': self.frames_published,
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'frames_stale': self.frames_stale,
+            'clients': [{
+                'sid': c.sid,
+                'protocol': 'lod' if c.detail else 'binary' if c.binary else 'json',
+                'lag': c.lag,
+                'rtt_ms': round(c.rtt * 1000, 1),
+                'sent': c.sent,
+                'dropped': c.dropped,
+            } for c in list(self.clients.values())],
+        }
@@ -1,44 +1,126 @@
 import numpy as np
 import pygame
 import math
+from collections import deque
+
+START_X = 450 # Well ahead of finish line
+START_Y = 150 # On the top straight
+MAX_SPEED = 6
+
+class CarBatch:
+    """Struct-of-arrays state for a whole population of cars.
+
+    step() advances every live car in one vectorized call. Car objects
+    returned by views() read and write the same arrays.
+    """
+    def __init__(self, size, start=(START_X, START_Y, 0)):
+        self.size = size
+        self.start = start # x, y, angle every car is reset to
+        self.x = np.zeros(size)
+        self.y = np.zeros(size)
+        self.angle = np.zeros(size)
+        self.speed = np.zeros(size)
+        self.distance = np.zeros(size)
+        self.alive = np.zeros(size, dtype=bool)
+        self.crashed = np.zeros(size, dtype=bool) # Crashed since the last frame was sent
+        self.radars = np.zeros((size, 0)) # (N_cars, N_sensors) distances
+        self.reset()
+
+    def reset(self):
+        start_x, start_y, start_angle = self.start
+        self.x.fill(start_x)
+        self.y.fill(start_y)
+        self.angle.fill(start_angle) # Facing Right (Clockwise) on the stadium
+        self.speed.fill(0)
+        self.distance.fill(0)
+        self.alive.fill(True)
+        self.crashed.fill(False)
+        self.radars = np.zeros((self.size, 0))
+
+    def sense(self, track, offsets, max_range=None):
+        """Refresh the radar matrix for every live car in one batched pass."""
+        live = np.flatnonzero(self.alive)
+        if self.radars.shape[1] != len(offsets):
+            self.radars = np.zeros((self.size, len(offsets)))
+        kwargs = {} if max_range is None else {'max_range': max_range}
+        self.radars[live] = track.get_radars_batch(self.x[live], self.y[live], self.angle[live], offsets, **kwargs)
+        return self.radars
+
+    def step(self, steering, throttle):
+        # Same kinematics as Car.step, dead cars are left untouched
+        live = self.alive
+        np.copyto(self.angle, self.angle + steering * 0.1, where=live)
+        np.copyto(self.speed, np.clip(self.speed + throttle * 0.25, 0, MAX_SPEED), where=live)
+
+        self.x += np.where(live, self.speed * np.cos(self.angle), 0)
+        self.y += np.where(live, self.speed * np.sin(self.angle), 0)
+        self.distance += np.where(live, np.abs(self.speed), 0)
+
+    def views(self, color=(0, 0, 0)):
+        return [Car(color, self, i) for i in range(self.size)]
+
+
+def _batch_field(name):
+    def fget(self):
+        return getattr(self.batch, name)[self.index].item()
+
+    def fset(self, value):
+        getattr(self.batch, name)[self.index] = value
+
+    return property(fget, fset)
+
 
 class Car:
-    def __init__(self, color):
+    # Kinematic state lives in a CarBatch, a standalone Car owns a batch of one
+    x = _batch_field('x')
+    y = _batch_field('y')
+    angle = _batch_field('angle')
+    speed = _batch_field('speed')
+    distance = _batch_field('distance')
+    alive = _batch_field('alive')
+
+    def __init__(self, color, batch=None, index=0):
         self.color = color
         self.radars = [] # List of (length, angle_offset)
-        self.trail = []  # List of (x, y)
-        self.reset()
+        self.trail = deque(maxlen=40)  # Last (x, y) positions, oldest dropped
+        if batch is None:
+            self.batch = CarBatch(1)
+            self.index = 0
+            self.reset()
+        else:
+            self.batch = batch
+            self.index = index
         
         # Car Sprite (Simple Triangle)
         self.width = 10
         self.length = 20
 
     def reset(self):
-        self.x = 450 # Well ahead of finish line
-        self.y = 150 # On the top straight
+        self.x = START_X
+        self.y = START_Y
         self.angle = 0 # Facing Right (Clockwise)
         self.speed = 0
         self.alive = True
         self.distance = 0
-        self.trail = []
+        self.trail.clear()
         self.radars = []
 
     def step(self, steering, throttle):
-        self.angle += steering * 0.1
-        self.speed = max(0, min(6, self.speed + throttle * 0.25))
+        angle = self.angle + steering * 0.1
+        speed = max(0, min(MAX_SPEED, self.speed + throttle * 0.25))
 
-        dx = self.speed * np.cos(self.angle)
-        dy = self.speed * np.sin(self.angle)
+        dx = speed * np.cos(angle)
+        dy = speed * np.sin(angle)
 
+        self.angle = angle
+        self.speed = speed
         self.x += dx
         self.y += dy
-        self.distance += abs(self.speed)
+        self.distance += abs(speed)
         
         # Update trail
         if len(self.trail) == 0 or math.hypot(self.trail[-1][0] - self.x, self.trail[-1][1] - self.y) > 5:
             self.trail.append((self.x, self.y))
-            if len(self.trail) > 40:
-                self.trail.pop(0)
 
     def draw(self, screen):
         # 1. Draw Sensors (Solid Triangle/Fan Look)
@@ -83,7 +165,7 @@ class Car:
 
         # 2. Draw Trail
         if len(self.trail) > 1:
-            pygame.draw.lines(screen, self.color, False, self.trail, 2)
+            pygame.draw.lines(screen, self.color, False, list(self.trail), 2)
 
         # 3. Draw Car (Triangle)
         # Calculate vertices
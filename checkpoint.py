@@ -0,0 +1,205 @@
+"""Checkpoints of the full evolutionary state.
+
+A checkpoint is taken between generations, when every car is back at the
+start, so only the learners and counters need saving:
+
+    <path>/LATEST                    name of the newest complete checkpoint
+    <path>/gen_000120/meta.json      seed, generation, counters, history, RNG state
+    <path>/gen_000120/states.npy     int64 (slots,) encoder state of each slot
+                      q.npy          float32 (pop, slots, actions)
+                      seen.npy       bool (pop, slots, actions)
+                      alpha.npy, gamma.npy, epsilon.npy   float64 (pop,)
+
+A 'tiles' learner saves weights.npy, float32 (pop, features, actions), in
+place of states/q/seen (see the population's TABLES).
+
+Arrays are plain .npy files, so loading memory-maps them and copies
+straight into the population tensors. A checkpoint directory is written
+under a temporary name and renamed, then LATEST is replaced, so a crash
+mid-write never leaves a half checkpoint behind LATEST.
+
+A hard reset archives the wiped run: its final state and its checkpoints
+move to <path>/reset_<time>/ (a checkpoint path of its own), so the new
+run starts from an empty <path> and never overwrites or prunes them.
+
+    writer = CheckpointWriter('runs/ckpt')
+    writer.submit(sim)          # cheap copy here, disk writes on a thread
+    writer.submit(sim, archive=True)  # before a hard reset
+    sim = load_checkpoint('runs/ckpt')
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from simulation import Simulation
+from tracks import load_track
+
+FORMAT_VERSION = 1
+
+def snapshot(sim):
+    """Copy everything a checkpoint needs, so the sim can keep stepping."""
+    meta = {
+        'version': FORMAT_VERSION,
+        'seed': sim.seed,
+        'pop_size': sim.pop_size,
+        'max_steps': sim.max_steps,
+        'track': sim.track.source,
+        'fitness': sim.fitness,
+        'learner': sim.learner,
+        'params': sim.params,
+        'rewards': sim.rewards,
+        'generation': sim.generation,
+        'car_steps': sim.car_steps,
+        'history': list(sim.history),
+        'best_progress': sim.step_budget.best_progress if sim.step_budget is not None else None,
+        'rng': sim.population.rng.bit_generator.state,
+    }
+    return meta, sim.population.get_tables()
+
+def write_checkpoint(path, meta, tables, keep=3):
+    name = f"gen_{meta['generation']:06d}"
+    final = os.path.join(path, name)
+    tmp = f"{final}.{os.getpid()}.tmp"
+    os.makedirs(path, exist_ok=True)
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for key in tables:
+        np.save(os.path.join(tmp, key + '.npy'), tables[key])
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(tmp, final)
+
+    latest = os.path.join(path, 'LATEST')
+    with open(f"{latest}.{os.getpid()}.tmp", 'w') as f:
+        f.write(name)
+    os.replace(f"{latest}.{os.getpid()}.tmp", latest)
+
+    # Drop the oldest checkpoints
+    names = sorted(n for n in os.listdir(path) if n.startswith('gen_') and '.' not in n)
+    for old in names[:-keep] if keep else []:
+        if old != name:
+            shutil.rmtree(os.path.join(path, old), ignore_errors=True)
+    return final
+
+def archive_run(path, meta, tables):
+    """Move the run in `path` to path/reset_<time>, with `meta`/`tables` as its newest checkpoint."""
+    stamp = time.strftime('%Y%m%d_%H%M%S')
+    dest = os.path.join(path, f"reset_{stamp}")
+    n = 1
+    while os.path.exists(dest):
+        n += 1
+        dest = os.path.join(path, f"reset_{stamp}_{n}")
+    final = write_checkpoint(dest, meta, tables, keep=0)
+    # The live run has no checkpoint until the new run writes one
+    try:
+        os.remove(os.path.join(path, 'LATEST'))
+    except FileNotFoundError:
+        pass
+    for name in os.listdir(path):
+        if name.startswith('gen_') and '.' not in name:
+            if os.path.exists(os.path.join(dest, name)):
+                shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+            else:
+                os.replace(os.path.join(path, name), os.path.join(dest, name))
+    return final
+
+def save_checkpoint(path, sim, keep=3):
+    meta, tables = snapshot(sim)
+    return write_checkpoint(path, meta, tables, keep)
+
+def load_checkpoint(path, track=None, kill_rules=None, step_budget=None):
+    """Rebuild the Simulation saved in `path` (a checkpoint dir or its parent).
+
+    Runs on the track it was saved on unless another `track` is given.
+    kill_rules and step_budget are run options, not saved state, but a
+    step_budget picks up the saved best progress (from the history if the
+    run had none), so the step limit carries on where it was.
+    """
+    if os.path.exists(os.path.join(path, 'LATEST')):
+        with open(os.path.join(path, 'LATEST')) as f:
+            path = os.path.join(path, f.read().strip())
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {meta.get('version')} in {path}")
+    if track is None:
+        track = load_track(meta.get('track', 'stadium'))
+    sim = Simulation(meta['pop_size'], seed=meta['seed'], max_steps=meta['max_steps'], track=track,
+                     fitness=meta.get('fitness', 'distance'), learner=meta.get('learner', 'tabular'),
+                     kill_rules=kill_rules, step_budget=step_budget, params=meta.get('params'),
+                     rewards=meta.get('rewards'))
+    tables = {key: np.load(os.path.join(path, key + '.npy'), mmap_mode='r') for key in sim.population.TABLES}
+    sim.generation = meta['generation']
+    sim.car_steps = meta['car_steps']
+    sim.history = meta['history']
+    population = sim.population
+    population.set_tables(np.arange(sim.pop_size), tables)
+    population.rng.bit_generator.state = meta['rng']
+    if step_budget is not None:
+        best = meta.get('best_progress')
+        if best is None:
+            best = max((stats.get('progress', 0.0) for stats in sim.history), default=0.0)
+        step_budget.best_progress = max(step_budget.best_progress, best)
+        sim.step_limit = step_budget.limit(sim)
+    return sim
+
+
+class CheckpointWriter:
+    """Writes checkpoints on a background thread.
+
+    submit() only copies the tables. If a write is still running when the
+    next checkpoint comes in, the pending one is replaced by the newer one.
+    Archives (archive_run) are never replaced and are written in order.
+    """
+    def __init__(self, path, keep=3):
+        self.path = path
+        self.keep = keep
+        self.written = 0
+        self.skipped = 0
+        self.last_path = None
+        self._pending = deque() # (meta, tables, archive) jobs
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, sim, archive=False):
+        meta, tables = snapshot(sim)
+        with self._lock:
+            if self._pending and not self._pending[-1][2]:
+                self._pending.pop() # Superseded: an archive or a newer checkpoint of the same run
+                self.skipped += 1
+            self._pending.append((meta, tables, archive))
+            self._idle.clear()
+        self._wake.set()
+
+    def flush(self, timeout=None):
+        """Wait until every submitted checkpoint is on disk."""
+        return self._idle.wait(timeout)
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        self._idle.set()
+                        break
+                    meta, tables, archive = self._pending.popleft()
+                try:
+                    if archive:
+                        self.last_path = archive_run(self.path, meta, tables)
+                    else:
+                        self.last_path = write_checkpoint(self.path, meta, tables, keep=self.keep)
+                    self.written += 1
+                except Exception as e:
+                    print(f"Checkpoint Error: {e}")
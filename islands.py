@@ -0,0 +1,173 @@
+"""Island-model evolution across worker processes.
+
+Each island is an independent Simulation (own seed, own SARSA+GA loop) in
+its own process. Every --interval generations the islands send their elite
+Q-tables to the coordinator as compact pack_tables buffers. The coordinator
+routes them along the migration topology. Each island keeps the best
+--migrants incoming agents in place of its worst ones before evolving.
+
+    python islands.py --islands 4 --pop 50 --generations 100 --interval 5 --topology ring
+    python islands.py --islands 4 --scaling   # efficiency for 1, 2, 4 islands
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from agent import pack_tables, unpack_tables
+from simulation import FITNESS, Simulation
+from tracks import load_track
+
+TOPOLOGIES = ('ring', 'full')
+
+def island_seed(seed, island):
+    return int(np.random.SeedSequence([seed, island]).generate_state(1)[0])
+
+def migration_sources(island, n_islands, topology):
+    """Islands whose elites flow into `island`."""
+    if n_islands == 1:
+        return []
+    if topology == 'ring':
+        return [(island - 1) % n_islands]
+    return [i for i in range(n_islands) if i != island]
+
+
+def island_worker(island, conn, config):
+    sim = Simulation(config['pop'], seed=island_seed(config['seed'], island),
+                     max_steps=config['max_steps'], track=load_track(config['track']), fitness=config['fitness'])
+    start = time.perf_counter()
+
+    for gen_index in range(config['generations']):
+        sim.run_generation()
+        fitness = sim.fitness_scores().copy()
+        best = float(fitness.max())
+
+        if config['interval'] and (gen_index + 1) % config['interval'] == 0:
+            elite = np.argsort(-fitness, kind='stable')[:config['migrants']]
+            conn.send(('migrate', best, pack_tables(sim.population.get_tables(elite)), fitness[elite].copy()))
+
+            # Keep the best incoming agents in place of our worst ones, with
+            # their fitness so evolve() can select them
+            incoming = conn.recv()
+            if incoming:
+                tables = [unpack_tables(buf) for buf, _ in incoming]
+                scores = np.concatenate([score for _, score in incoming])
+                keep = np.argsort(-scores, kind='stable')[:min(config['migrants'], sim.pop_size - 1)]
+                worst = np.argsort(fitness, kind='stable')[:keep.size]
+                owners = np.concatenate([np.full(len(score), i) for i, (_, score) in enumerate(incoming)])
+                offsets = np.concatenate([np.arange(len(score)) for _, score in incoming])
+                for slot, pick in zip(worst, keep):
+                    t = tables[owners[pick]]
+                    j = offsets[pick]
+                    sim.population.set_tables([slot], {
+                        'states': t['states'],
+                        'q': t['q'][j:j + 1],
+                        'seen': t['seen'][j:j + 1],
+                        'alpha': t['alpha'][j:j + 1],
+                        'gamma': t['gamma'][j:j + 1],
+                        'epsilon': t['epsilon'][j:j + 1],
+                    })
+                    fitness[slot] = scores[pick]
+        else:
+            conn.send(('gen', best))
+
+        sim.next_generation(fitness)
+
+    conn.send(('done', sim.car_steps, time.perf_counter() - start))
+    conn.close()
+
+
+def run_islands(n_islands, pop=50, generations=100, interval=5, topology='ring', migrants=2,
+                max_steps=1500, seed=0, track='stadium', fitness='distance', verbose=True):
+    config = {'pop': pop, 'generations': generations, 'interval': interval, 'migrants': migrants,
+              'max_steps': max_steps, 'seed': seed, 'track': track, 'fitness': fitness}
+    conns = []
+    procs = []
+    for island in range(n_islands):
+        parent, child = multiprocessing.Pipe()
+        proc = multiprocessing.Process(target=island_worker, args=(island, child, config), daemon=True)
+        proc.start()
+        conns.append(parent)
+        procs.append(proc)
+
+    start = time.perf_counter()
+    island_best = np.zeros(n_islands)
+    migrated_bytes = 0
+    try:
+        for gen_index in range(generations):
+            msgs = [conn.recv() for conn in conns]
+            for island, msg in enumerate(msgs):
+                island_best[island] = max(island_best[island], msg[1])
+
+            if msgs[0][0] == 'migrate':
+                for island, conn in enumerate(conns):
+                    incoming = [(msgs[src][2], msgs[src][3]) for src in migration_sources(island, n_islands, topology)]
+                    migrated_bytes += sum(len(buf) for buf, _ in incoming)
+                    conn.send(incoming)
+
+            if verbose and (gen_index + 1) % max(1, interval or 10) == 0:
+                per_island = " ".join(f"{b:7.1f}" for b in island_best)
+                print(f"Gen {gen_index + 1}: global best {island_best.max():.1f} | islands {per_island}")
+
+        done = [conn.recv() for conn in conns]
+    finally:
+        for proc in procs:
+            proc.join(timeout=5)
+    elapsed = time.perf_counter() - start
+
+    car_steps = sum(d[1] for d in done)
+    return {
+        'islands': n_islands,
+        'island_best': island_best.tolist(),
+        'global_best': float(island_best.max()),
+        'env_steps_per_sec': car_steps / elapsed,
+        'island_steps_per_sec': [d[1] / d[2] for d in done],
+        'migrated_bytes': migrated_bytes,
+        'elapsed': elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Island-model RL Racecar evolution")
+    parser.add_argument('--islands', type=int, default=4)
+    parser.add_argument('--pop', type=int, default=50, help="Population size per island")
+    parser.add_argument('--generations', type=int, default=100)
+    parser.add_argument('--interval', type=int, default=5, help="Generations between migrations, 0 disables")
+    parser.add_argument('--topology', choices=TOPOLOGIES, default='ring')
+    parser.add_argument('--migrants', type=int, default=2, help="Elites sent (and received) per migration")
+    parser.add_argument('--max-steps', type=int, default=1500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--track', default='stadium', help="stadium, a preset in tracks/, random:<seed> or a .json file")
+    parser.add_argument('--fitness', choices=FITNESS, default='distance', help="What evolution selects on")
+    parser.add_argument('--scaling', action='store_true', help="Measure scaling efficiency for 1, 2, 4 ... islands")
+    args = parser.parse_args()
+
+    kwargs = dict(pop=args.pop, generations=args.generations, interval=args.interval, topology=args.topology,
+                  migrants=args.migrants, max_steps=args.max_steps, seed=args.seed, track=args.track,
+                  fitness=args.fitness)
+
+    if not args.scaling:
+        result = run_islands(args.islands, **kwargs)
+        print(f"Global best: {result['global_best']:.1f}")
+        for island, (best, rate) in enumerate(zip(result['island_best'], result['island_steps_per_sec'])):
+            print(f"  island {island}: best {best:.1f}, {rate:,.0f} env-steps/sec")
+        print(f"{result['env_steps_per_sec']:,.0f} env-steps/sec total, "
+              f"{result['migrated_bytes'] / 1024:,.0f} KB migrated ({result['elapsed']:.1f}s)")
+        return
+
+    counts = sorted({1, args.islands} | {2 ** k for k in range(args.islands.bit_length()) if 2 ** k <= args.islands})
+    base = None
+    print(f"{'islands':>7} {'env-steps/s':>13} {'efficiency':>11} {'global best':>12}")
+    for n in counts:
+        result = run_islands(n, verbose=False, **kwargs)
+        rate = result['env_steps_per_sec']
+        base = base or rate
+        print(f"{n:>7} {rate:>13,.0f} {rate / (n * base):>10.0%} {result['global_best']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
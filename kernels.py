@@ -0,0 +1,162 @@
+"""Compiled per-step kernels: radar, car physics, reward and crash checks.
+
+With Numba installed, Simulation runs the geometry half of each step as
+two compiled loops over the live cars instead of a few dozen small NumPy
+operations: sense() marches every radar ray against the track mask, and
+advance() moves the cars, looks up offset and lap progress, scores the
+reward and takes out crashed and finished cars. Without Numba (or with
+RL_RACECAR_JIT=0) the NumPy code in track.py, car.py and simulation.py
+runs instead.
+
+The kernels do the same floating-point operations in the same order as
+the NumPy path, so a seeded run gives bit-identical results either way
+(benchmarks/bench_kernels.py checks it). Compiled code is cached on disk
+(__pycache__ next to this file, or NUMBA_CACHE_DIR), so only the first
+start after an install or a change here pays the compile time.
+"""
+import math
+import os
+
+import numpy as np
+
+from track import FINISH_STADIUM, RADAR_RANGE, RADAR_STEP
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+AVAILABLE = numba is not None and os.environ.get('RL_RACECAR_JIT', '1') != '0'
+
+
+def _jit(fn):
+    if numba is None:
+        return fn # Plain Python, same results, only for checking on machines without Numba
+    return numba.njit(cache=True, nogil=True)(fn)
+
+
+@_jit
+def _on_track(mask, x, y):
+    height, width = mask.shape
+    if x >= 0 and y >= 0 and x < width and y < height:
+        return mask[int(y), int(x)]
+    return False
+
+
+@_jit
+def _sense(live, xs, ys, angles, offsets, mask, max_range, step, out):
+    # Same samples as Track.get_radars_batch: the ray position accumulates
+    # one step at a time, like its cumsum
+    n_samples = -(-max_range // step)
+    for k in range(live.size):
+        i = live[k]
+        for j in range(offsets.size):
+            ray = angles[i] + offsets[j]
+            dx = math.cos(ray) * step
+            dy = math.sin(ray) * step
+            px = xs[i]
+            py = ys[i]
+            length = float(max_range)
+            for s in range(n_samples):
+                px += dx
+                py += dy
+                if not _on_track(mask, px, py):
+                    length = float((s + 1) * step)
+                    break
+            out[i, j] = length
+
+
+@_jit
+def _advance(live, actions, steer, throttle, max_speed, x, y, angle, speed, distance, alive, crashed,
+             progress, lap_pos, min_sensor, mask, lookup, far, finish_kind, finish, weights):
+    n = live.size
+    reward = np.empty(n)
+    hit = np.zeros(n, dtype=np.bool_)
+    finished = np.zeros(n, dtype=np.bool_)
+    height, width = mask.shape
+    for k in range(n):
+        i = live[k]
+        a = actions[k]
+        prev_x = x[i]
+        prev_y = y[i]
+
+        # CarBatch.step
+        angle[i] = angle[i] + steer[a] * 0.1
+        v = speed[i] + throttle[a] * 0.25
+        if v < 0:
+            v = 0.0
+        elif v > max_speed:
+            v = max_speed
+        speed[i] = v
+        x[i] += v * math.cos(angle[i])
+        y[i] += v * math.sin(angle[i])
+        distance[i] += abs(v)
+        cx = x[i]
+        cy = y[i]
+
+        # Track.lookup
+        offset = far
+        lap = 0.0
+        if cx >= 0 and cy >= 0 and cx < width and cy < height:
+            offset = float(lookup[int(cy), int(cx), 0])
+            lap = float(lookup[int(cy), int(cx), 1])
+
+        r = v * weights[0]
+        r -= offset * weights[1]
+        if min_sensor[k] < 15:
+            r -= weights[2]
+
+        if not _on_track(mask, cx, cy):
+            hit[k] = True
+            r -= weights[3]
+        else:
+            if finish_kind == FINISH_STADIUM:
+                crossed = finish[1] < cy and cy < finish[2] and prev_x < finish[0] and finish[0] <= cx
+            else:
+                fx, fy, tx, ty = finish[0], finish[1], finish[2], finish[3]
+                before = (prev_x - fx) * tx + (prev_y - fy) * ty
+                after = (cx - fx) * tx + (cy - fy) * ty
+                lateral = abs((cy - fy) * tx - (cx - fx) * ty)
+                crossed = before < 0 and after >= 0 and lateral <= finish[4]
+            if crossed:
+                finished[k] = True
+                r += weights[4]
+                distance[i] += 2000
+
+            # Progress since the last step, wrapped so crossing the line counts
+            delta = (lap - lap_pos[i] + 0.5) % 1.0 - 0.5
+            progress[i] += delta
+            lap_pos[i] = lap
+
+        if hit[k] or finished[k]:
+            alive[i] = False
+        if hit[k]:
+            crashed[i] = True
+        reward[k] = r
+    return reward, hit, finished
+
+
+def sense(batch, track, offsets, live, max_range=RADAR_RANGE, step=RADAR_STEP):
+    """CarBatch.sense for the live cars. Returns their (N_live, N_sensors) rows."""
+    offsets = np.asarray(offsets, dtype=float)
+    if batch.radars.shape[1] != offsets.size:
+        batch.radars = np.zeros((batch.size, offsets.size))
+    _sense(live, batch.x, batch.y, batch.angle, offsets, track.mask, max_range, step, batch.radars)
+    return batch.radars[live]
+
+
+def advance(sim, live, actions, min_sensor, steer, throttle, max_speed):
+    """Physics, reward and crash/finish checks of Simulation.step for the live cars.
+
+    Returns (reward, hit, finished) aligned with live.
+    """
+    batch = sim.batch
+    track = sim.track
+    kind, finish = track.finish_line()
+    lookup, far = track.lookup_table()
+    weights = sim.rewards
+    return _advance(live, actions, steer, throttle, float(max_speed), batch.x, batch.y, batch.angle, batch.speed,
+                    batch.distance, batch.alive, batch.crashed, sim.progress, sim.lap_pos, min_sensor, track.mask,
+                    lookup, far, kind, finish,
+                    np.array([weights['speed'], weights['offset'], weights['near_wall'], weights['crash'],
+                              weights['finish']], dtype=float))
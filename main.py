@@ -1,5 +1,168 @@
+"""Headless training runner.
+
+Runs the same Simulation as the web server with no sleeps or Socket.IO
+emits. With --workers > 1 each generation's population is split into
+shards evaluated in a multiprocessing pool. Evolution happens in the parent
+process, so for a fixed --seed the results match a single process run (and
+the web loop) exactly.
+
+    python main.py --pop 200 --generations 50 --workers 4 --seed 1
+"""
+import argparse
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from checkpoint import CheckpointWriter, load_checkpoint
+from replay import Recorder
+from simulation import FITNESS, LEARNERS, Simulation
+from termination import KillRules, StepBudget
+from tracks import load_track
+
+# Built once per worker process by _init_worker
+_worker_track = None
+
+def _init_worker(track_source):
+    global _worker_track
+    _worker_track = load_track(track_source)
+
+def evaluate_shard(job):
+    """Run one generation for a slice of the population in a worker."""
+    seed, generation, step_limit, fitness, learner, kill_rules, rewards, agent_ids, total_size, tables = job
+    shard = Simulation(len(agent_ids), seed=seed, max_steps=step_limit, track=_worker_track,
+                       agent_ids=agent_ids, total_size=total_size, fitness=fitness, learner=learner,
+                       kill_rules=kill_rules, rewards=rewards)
+    shard.generation = generation
+    shard.population.set_tables(np.arange(len(agent_ids)), tables)
+    shard.run_generation()
+    return (shard.batch.distance, shard.progress, shard.population.get_tables(), shard.car_steps, shard.steps,
+            shard.kill_rules)
+
+
+class HeadlessRunner:
+    def __init__(self, pop_size=5, seed=None, max_steps=1500, workers=1, sim=None, track='stadium',
+                 fitness='distance', learner='tabular', kill_rules=None, step_budget=None, params=None, rewards=None):
+        self.sim = sim or Simulation(pop_size, seed=seed, max_steps=max_steps, track=load_track(track),
+                                     fitness=fitness, learner=learner, kill_rules=kill_rules,
+                                     step_budget=step_budget, params=params, rewards=rewards)
+        pop_size = self.sim.pop_size
+        self.workers = max(1, min(workers, pop_size))
+        self.pool = None
+        if self.workers > 1:
+            self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self.sim.track.source,))
+        self.shards = np.array_split(np.arange(pop_size), self.workers)
+        self.in_generation = False # Set while a generation runs, when the sim is no checkpoint
+
+    def close(self):
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+
+    def run_generation(self):
+        self.in_generation = True
+        stats = self._run_generation()
+        self.in_generation = False
+        return stats
+
+    def _run_generation(self):
+        sim = self.sim
+        if self.pool is None:
+            sim.run_generation()
+            return sim.next_generation()
+
+        jobs = [(sim.seed, sim.generation, sim.step_limit, sim.fitness, sim.learner, sim.kill_rules, sim.rewards, ids,
+                 sim.pop_size, sim.population.get_tables(ids)) for ids in self.shards]
+        steps = 0
+        for ids, (distance, progress, tables, car_steps, shard_steps, kills) in zip(self.shards,
+                                                                                    self.pool.map(evaluate_shard, jobs)):
+            sim.batch.distance[ids] = distance
+            sim.progress[ids] = progress
+            sim.population.set_tables(ids, tables)
+            sim.car_steps += car_steps
+            steps = max(steps, shard_steps)
+            if kills is not None:
+                sim.kill_rules.killed_by[ids] = kills.killed_by
+                sim.kill_rules.kill_step[ids] = kills.kill_step
+        sim.steps = steps
+        return sim.next_generation()
+
+    def run(self, generations, log_every=10, checkpoints=None, checkpoint_every=10):
+        start = time.perf_counter()
+        history = []
+        for _ in range(generations):
+            stats = self.run_generation()
+            if stats:
+                history.append(stats)
+                if stats['generation'] % log_every == 0:
+                    print(f"Gen {stats['generation']} Complete. Best Dist: {stats['distance']:.1f}")
+            if checkpoints and self.sim.generation % checkpoint_every == 0:
+                checkpoints.submit(self.sim)
+        elapsed = time.perf_counter() - start
+        return history, elapsed
+
+
 def main():
-    print("Hello from rl-racecar!")
+    parser = argparse.ArgumentParser(description="Headless RL Racecar training")
+    parser.add_argument('--pop', type=int, default=5, help="Population size")
+    parser.add_argument('--generations', type=int, default=100)
+    parser.add_argument('--max-steps', type=int, default=1500)
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes for evaluation")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--log-every', type=int, default=10)
+    parser.add_argument('--track', default='stadium', help="stadium, a preset in tracks/, random:<seed> or a .json file")
+    parser.add_argument('--fitness', choices=FITNESS, default='distance', help="What evolution selects on")
+    parser.add_argument('--learner', choices=LEARNERS, default='tabular', help="Tabular SARSA or tile-coded SARSA(lambda)")
+    parser.add_argument('--early-kill', action='store_true', help="Take out stalled, slow and circling cars early")
+    parser.add_argument('--adaptive-steps', action='store_true',
+                        help="Grow the step limit with the best progress instead of always running --max-steps")
+    parser.add_argument('--record', metavar='DIR', help="Record every generation to DIR (single worker only)")
+    parser.add_argument('--checkpoint', metavar='DIR', help="Save the population to DIR periodically")
+    parser.add_argument('--checkpoint-every', type=int, default=10, help="Generations between checkpoints")
+    parser.add_argument('--resume', action='store_true', help="Continue from the latest checkpoint in --checkpoint")
+    args = parser.parse_args()
+    if args.record and args.workers > 1:
+        parser.error("--record needs --workers 1")
+    if args.resume and not args.checkpoint:
+        parser.error("--resume needs --checkpoint DIR")
+
+    kill_rules = KillRules() if args.early_kill else None
+    step_budget = StepBudget() if args.adaptive_steps else None
+    sim = None
+    if args.resume and os.path.exists(os.path.join(args.checkpoint, 'LATEST')):
+        sim = load_checkpoint(args.checkpoint, kill_rules=kill_rules, step_budget=step_budget)
+        print(f"Resumed generation {sim.generation} from {args.checkpoint}")
+    runner = HeadlessRunner(args.pop, seed=args.seed, max_steps=args.max_steps, workers=args.workers, sim=sim,
+                            track=args.track, fitness=args.fitness, learner=args.learner,
+                            kill_rules=kill_rules, step_budget=step_budget)
+    if args.record:
+        runner.sim.recorder = Recorder(args.record, runner.sim)
+    checkpoints = CheckpointWriter(args.checkpoint) if args.checkpoint else None
+    print(f"Training pop={runner.sim.pop_size} workers={runner.workers} seed={runner.sim.seed} "
+          f"track={runner.sim.track.name} learner={runner.sim.learner}")
+    try:
+        history, elapsed = runner.run(args.generations, args.log_every, checkpoints, max(1, args.checkpoint_every))
+    finally:
+        runner.close()
+        if checkpoints:
+            # Only between generations: an interrupted one is half run
+            if runner.in_generation:
+                print(f"Stopped during generation {runner.sim.generation}, not checkpointed")
+            else:
+                checkpoints.submit(runner.sim)
+            checkpoints.flush()
+
+    best = max((h['distance'] for h in history), default=0.0)
+    print(f"Best Dist: {best:.1f}")
+    if history:
+        saved = sum(h.get('car_steps_saved', 0) for h in history) / len(history)
+        print(f"{np.mean([h['steps'] for h in history]):.0f} steps/generation (max {runner.sim.max_steps}), "
+              f"{saved:,.0f} car-steps/generation cut by early kills")
+    print(f"{args.generations / elapsed:.2f} generations/sec, "
+          f"{runner.sim.car_steps / elapsed:,.0f} env-steps/sec ({elapsed:.1f}s)")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+"""Phase timers and an on-demand sampling profiler for the simulation loop.
+
+Timers are laps: begin() marks the start of a step and every lap(name)
+records the time since the previous mark under `name`. Code that may run
+without a profiler asks for laps via lap_fn(profiler), which returns a
+no-op when profiling is off, so the disabled cost is one call per phase.
+
+Each phase keeps its last `window` durations in a ring buffer for rolling
+percentiles, plus running totals for the Prometheus summary.
+"""
+import collections
+import sys
+import threading
+import time
+
+import numpy as np
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+def _noop(name):
+    pass
+
+def lap_fn(profiler):
+    """Start timing laps: profiler.lap when profiling is on, otherwise a no-op."""
+    if profiler is not None and profiler.enabled:
+        profiler.begin()
+        return profiler.lap
+    return _noop
+
+
+class RollingWindow:
+    def __init__(self, size):
+        self.values = np.zeros(size)
+        self.n = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.values[self.n % len(self.values)] = value
+        self.n += 1
+        self.total += value
+
+    def recent(self):
+        return self.values[:min(self.n, len(self.values))]
+
+
+class Profiler:
+    def __init__(self, window=1024, enabled=False):
+        self.window = window
+        self.enabled = enabled
+        self.phases = {}
+        self.counters = collections.Counter()
+        self.ticks = 0 # Loop iterations, what sample() counts frames in
+        self._marks = threading.local() # Each thread laps on its own clock
+
+    def begin(self):
+        self._marks.last = time.perf_counter()
+
+    def lap(self, name):
+        now = time.perf_counter()
+        last = getattr(self._marks, 'last', now)
+        self._marks.last = now
+        self.record(name, now - last)
+
+    def record(self, name, seconds):
+        window = self.phases.get(name)
+        if window is None:
+            window = self.phases[name] = RollingWindow(self.window)
+        window.add(seconds)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def tick(self):
+        self.ticks += 1
+
+    def reset(self):
+        self.phases = {}
+        self.counters = collections.Counter()
+
+    def summary(self):
+        """Rolling stats per phase, in milliseconds."""
+        out = {}
+        for name, window in list(self.phases.items()):
+            recent = window.recent()
+            if not recent.size:
+                continue
+            p50, p90, p99 = np.quantile(recent, QUANTILES) * 1000
+            out[name] = {
+                'count': window.n,
+                'mean_ms': round(float(recent.mean()) * 1000, 4),
+                'p50_ms': round(float(p50), 4),
+                'p90_ms': round(float(p90), 4),
+                'p99_ms': round(float(p99), 4),
+                'max_ms': round(float(recent.max()) * 1000, 4),
+                'total_s': round(window.total, 3),
+            }
+        return out
+
+    def prometheus(self, gauges=None, prefix='racecar'):
+        """Phases as Prometheus summaries, counters and extra gauges in text format."""
+        lines = [f"# HELP {prefix}_phase_seconds Time spent per phase of the simulation loop",
+                 f"# TYPE {prefix}_phase_seconds summary"]
+        for name, window in sorted(self.phases.items()):
+            recent = window.recent()
+            if recent.size:
+                for q, value in zip(QUANTILES, np.quantile(recent, QUANTILES)):
+                    lines.append(f'{prefix}_phase_seconds{{phase="{name}",quantile="{q}"}} {value:.9f}')
+            lines.append(f'{prefix}_phase_seconds_sum{{phase="{name}"}} {window.total:.6f}')
+            lines.append(f'{prefix}_phase_seconds_count{{phase="{name}"}} {window.n}')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        lines.append(f"# TYPE {prefix}_profiling_enabled gauge")
+        lines.append(f"{prefix}_profiling_enabled {int(self.enabled)}")
+        return "\n".join(lines) + "\n"
+
+    def sample(self, thread_ids, frames=300, interval=0.001, timeout=60):
+        """Sample the stacks of `thread_ids` (one id or a list) until `frames` more ticks.
+
+        Returns collapsed stacks ("outer;inner;leaf count" per line, most
+        frequent first), the format flame graph tools read.
+        """
+        if isinstance(thread_ids, int):
+            thread_ids = [thread_ids]
+        stacks = collections.Counter()
+        target = self.ticks + frames
+        deadline = time.perf_counter() + timeout
+        while self.ticks < target and time.perf_counter() < deadline:
+            current = sys._current_frames()
+            frames_now = [current[t] for t in thread_ids if t in current]
+            if not frames_now:
+                break
+            for frame in frames_now:
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stacks[";".join(reversed(stack))] += 1
+            time.sleep(interval)
+        return "\n".join(f"{stack} {n}" for stack, n in stacks.most_common()) + "\n"
@@ -0,0 +1,260 @@
+"""Frame encodings for the 'update' stream.
+
+json_frame builds the original per-car dict payload. FrameEncoder builds
+the opt-in binary format that web_viz/static/js/main.js decodes with typed
+arrays. Static fields (colors, sensor angles) are not part of a frame; they
+go out once per generation in the 'meta' event.
+
+Binary frame layout (little endian):
+
+    header, 16 bytes
+        uint8  version
+        uint8  kind            0 = keyframe, 1 = delta
+        uint16 n_records
+        uint32 seq
+        uint32 steps
+        uint16 alive
+        uint8  n_sensors
+        uint8  reserved
+    keyframe, one record per car
+        uint16 id[n], uint16 x[n], uint16 y[n], uint16 angle[n]
+        uint8  flags[n], uint8 sensors[n * n_sensors]
+    delta, only cars whose quantized state changed
+        uint16 id[n], int8 dx[n], int8 dy[n], int8 dangle[n]
+        uint8  flags[n], uint8 sensors[n * n_sensors]
+
+Positions are in 1/POS_SCALE px, angles in 1/ANGLE_UNITS of a turn,
+sensors in whole px (capped at 255). flags bit 0 is alive, bit 1 crashed.
+Deltas are taken against the previously sent quantized values, so the
+decoder never drifts. A frame whose deltas do not fit in int8 is sent as
+a keyframe instead.
+
+Clients that ask for a lower level of detail ('set_detail') get lod_frame
+'lod' events instead: columns for the cars worth drawing only, sensors and
+trails for the top-K (or selected) cars only, so the payload scales with
+what is visible rather than with the population.
+"""
+import struct
+
+import numpy as np
+
+from track import SENSOR_ANGLES
+
+VERSION = 1
+KEYFRAME = 0
+DELTA = 1
+POS_SCALE = 4
+ANGLE_UNITS = 4096
+HEADER = struct.Struct('<BBHIIHBx')
+
+TRAIL_LENGTH = 40 # Positions kept per car for lod trails
+MAX_SELECTED = 64
+# top_k: cars ranked by distance that get sensors and trails
+# decimate: grid cell in px, one car drawn per cell (0 = off)
+DETAIL_LEVELS = {
+    'medium': {'top_k': 20, 'decimate': 0, 'trails': True},
+    'low': {'top_k': 5, 'decimate': 12, 'trails': False},
+}
+
+COLORS = [
+    "#FF0055", "#00FFFF", "#FFFF00", "#39FF14", "#FF00FF", "#FF8000",
+    "#8000FF", "#0080FF", "#FFFFFF", "#64FF64", "#FF6464", "#6464FF"
+]
+
+def car_color(i):
+    return COLORS[i % len(COLORS)]
+
+def meta_frame(sim):
+    """Per-generation static fields for binary clients."""
+    return {
+        'generation': sim.generation,
+        'colors': [car_color(i) for i in range(sim.pop_size)],
+        'sensor_angles': SENSOR_ANGLES,
+        'pos_scale': POS_SCALE,
+        'angle_units': ANGLE_UNITS,
+    }
+
+def json_frame(sim):
+    """The original 'update' payload: a dict per car with rounded floats."""
+    batch = sim.batch
+    xs = batch.x.round(1).tolist()
+    ys = batch.y.round(1).tolist()
+    angles = batch.angle.round(2).tolist()
+    radars = batch.radars.tolist()
+    sim_data = []
+    for i in range(sim.pop_size):
+        sim_data.append({
+            'id': i,
+            'x': xs[i],
+            'y': ys[i],
+            'angle': angles[i],
+            'alive': int(batch.alive[i]),
+            'crashed': bool(batch.crashed[i]),
+            'sensors': list(zip(radars[i], SENSOR_ANGLES)), # Send sensor data for visualizer!
+            'color': car_color(i)
+        })
+    return {'cars': sim_data, 'alive': sim.alive, 'steps': sim.steps}
+
+
+def detail_settings(data):
+    """A client's 'set_detail' message as lod settings, None for full detail."""
+    if not isinstance(data, dict) or data.get('level', 'full') == 'full':
+        return None
+    settings = dict(DETAIL_LEVELS.get(data.get('level'), DETAIL_LEVELS['medium']))
+    if 'top_k' in data:
+        settings['top_k'] = min(max(int(data['top_k']), 0), 1000)
+    if 'decimate' in data:
+        settings['decimate'] = min(max(int(data['decimate']), 0), 200)
+    if 'trails' in data:
+        settings['trails'] = bool(data['trails'])
+    settings['selected'] = tuple(sorted({i for i in map(int, data.get('selected') or ()) if i >= 0}))[:MAX_SELECTED]
+    return settings
+
+def detail_key(settings):
+    """Clients with equal keys can share one encoded lod frame."""
+    return (settings['top_k'], settings['decimate'], settings['trails'], settings['selected'])
+
+def lod_frame(sim, settings, trails=None):
+    """Columns for the cars worth drawing at this level of detail.
+
+    Dead cars are left out after their crash frame. With decimate, only the
+    best-ranked car of each grid cell is kept (plus top-K, selected and
+    crashing cars). Sensors and trails come only for top-K and selected cars.
+    """
+    batch = sim.batch
+    visible = np.flatnonzero(batch.alive | batch.crashed)
+    ranked = visible[np.argsort(-batch.distance[visible], kind='stable')]
+    featured = ranked[:settings['top_k']]
+    selected = np.array(settings['selected'], dtype=int)
+    selected = selected[selected < sim.pop_size]
+    featured = np.union1d(featured, selected[batch.alive[selected]])
+
+    ids = visible
+    decimate = settings['decimate']
+    if decimate and ranked.size:
+        cells = (batch.x[ranked] // decimate).astype(np.int64) * 65536 + (batch.y[ranked] // decimate).astype(np.int64)
+        _, first = np.unique(cells, return_index=True)
+        ids = np.union1d(ranked[first], featured)
+        ids = np.union1d(ids, np.flatnonzero(batch.crashed))
+
+    sensors = np.clip(np.rint(batch.radars[featured]), 0, 255).astype(int).tolist() if batch.radars.shape[1] else []
+    frame = {
+        'ids': ids.tolist(),
+        'x': batch.x[ids].round(1).tolist(),
+        'y': batch.y[ids].round(1).tolist(),
+        'angle': batch.angle[ids].round(2).tolist(),
+        'live': batch.alive[ids].astype(int).tolist(),
+        'crashed': np.flatnonzero(batch.crashed).tolist(),
+        'sensors': {str(i): r for i, r in zip(featured.tolist(), sensors)},
+        'sensor_angles': SENSOR_ANGLES,
+        'palette': COLORS,
+        'pop_size': sim.pop_size,
+        'alive': sim.alive,
+        'steps': sim.steps,
+    }
+    if trails is not None and settings['trails']:
+        frame['trails'] = {str(i): path.ravel().tolist() for i, path in zip(featured.tolist(), trails.recent(featured))}
+    return frame
+
+
+class TrailBuffer:
+    """The last `length` positions of every car, in a ring buffer.
+
+    push() is called once per published frame, so trails cost O(cars) per
+    frame with no per-car lists.
+    """
+    def __init__(self, size, length=TRAIL_LENGTH):
+        self.points = np.zeros((length, size, 2), dtype=np.float32)
+        self.head = 0
+        self.count = 0
+        self.generation = None
+
+    def push(self, batch, generation):
+        if generation != self.generation or len(batch.x) != self.points.shape[1]:
+            self.__init__(len(batch.x), len(self.points))
+            self.generation = generation
+        # Dead cars stay where they crashed, so their trail just stops
+        point = self.points[self.head]
+        point[:, 0] = batch.x
+        point[:, 1] = batch.y
+        self.head = (self.head + 1) % len(self.points)
+        self.count = min(self.count + 1, len(self.points))
+
+    def recent(self, ids):
+        """(len(ids), count, 2) positions per car, oldest first, 1 decimal."""
+        order = (self.head - self.count + np.arange(self.count)) % len(self.points)
+        return self.points[order][:, ids].transpose(1, 0, 2).astype(float).round(1)
+
+
+class FrameEncoder:
+    """Quantizing, delta-encoding binary frame builder for one stream."""
+    def __init__(self, keyframe_interval=30):
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self.prev = None
+        self.since_key = 0
+        self.force_key = True
+
+    def request_keyframe(self):
+        """Force the next frame to be a keyframe (new client, new generation)."""
+        self.force_key = True
+
+    def quantize(self, batch):
+        qx = np.clip(np.rint(batch.x * POS_SCALE), 0, 65535).astype(np.int32)
+        qy = np.clip(np.rint(batch.y * POS_SCALE), 0, 65535).astype(np.int32)
+        qa = np.rint(batch.angle * (ANGLE_UNITS / (2 * np.pi))).astype(np.int64) % ANGLE_UNITS
+        flags = batch.alive.astype(np.uint8) | (batch.crashed.astype(np.uint8) << 1)
+        sensors = np.clip(np.rint(batch.radars), 0, 255).astype(np.uint8)
+        return qx, qy, qa.astype(np.int32), flags, sensors
+
+    def encode(self, sim):
+        state = self.quantize(sim.batch)
+        qx, qy, qa, flags, sensors = state
+        n_sensors = sensors.shape[1]
+        self.seq += 1
+
+        frame = None
+        force_key, self.force_key = self.force_key, False
+        if not force_key and self.since_key < self.keyframe_interval and self.prev[4].shape == sensors.shape:
+            frame = self._delta(state, self.prev)
+        if frame is None:
+            ids, body = self._key(state)
+            kind = KEYFRAME
+            self.since_key = 0
+        else:
+            ids, body = frame
+            kind = DELTA
+            self.since_key += 1
+
+        self.prev = state
+        header = HEADER.pack(VERSION, kind, ids.size, self.seq, sim.steps, sim.alive, n_sensors)
+        return header + b''.join(part.tobytes() for part in body)
+
+    def keyframe(self, sim):
+        """Keyframe of the last encoded frame, for a client that missed deltas.
+
+        Leaves the delta stream untouched, so later deltas apply on top of it.
+        """
+        ids, body = self._key(self.prev)
+        header = HEADER.pack(VERSION, KEYFRAME, ids.size, self.seq, sim.steps, sim.alive, self.prev[4].shape[1])
+        return header + b''.join(part.tobytes() for part in body)
+
+    def _key(self, state):
+        qx, qy, qa, flags, sensors = state
+        ids = np.arange(qx.size)
+        return ids, [ids.astype('<u2'), qx.astype('<u2'), qy.astype('<u2'), qa.astype('<u2'), flags, sensors]
+
+    def _delta(self, state, prev):
+        qx, qy, qa, flags, sensors = state
+        px, py, pa, pflags, psensors = prev
+        changed = (qx != px) | (qy != py) | (qa != pa) | (flags != pflags) | (sensors != psensors).any(axis=1)
+        ids = np.flatnonzero(changed)
+
+        dx = qx[ids] - px[ids]
+        dy = qy[ids] - py[ids]
+        # Shortest way round the circle
+        da = (qa[ids] - pa[ids] + ANGLE_UNITS // 2) % ANGLE_UNITS - ANGLE_UNITS // 2
+        if ids.size and max(np.abs(dx).max(), np.abs(dy).max(), np.abs(da).max()) > 127:
+            return None
+        return ids, [ids.astype('<u2'), dx.astype(np.int8), dy.astype(np.int8), da.astype(np.int8),
+                     flags[ids], sensors[ids]]
@@ -0,0 +1,158 @@
+"""Recording and playback of generations.
+
+A Recorder attached to a Simulation (sim.recorder) copies the visible car
+state and the chosen actions into preallocated per-step buffers. When the
+generation ends it writes them as one .npy file per column:
+
+    <path>/meta.json                 seed, pop_size, sensor_angles
+    <path>/gen_000007/meta.json      generation, steps, best distance
+    <path>/gen_000007/x.npy          float32 (steps, pop)
+                      y.npy, angle.npy
+                      alive.npy      bool (steps, pop)
+                      crashed.npy    bool (steps, pop), crashed on that step
+                      sensors.npy    uint8 (steps, pop, sensors), whole px
+                      actions.npy    int8 (steps, pop), -1 for dead cars
+
+A generation is found by its directory name and its columns are
+memory-mapped, so seeking to any generation or step is O(1).
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+
+from track import SENSOR_ANGLES
+
+COLUMNS = ('x', 'y', 'angle', 'alive', 'crashed', 'sensors', 'actions')
+
+def generation_dir(path, generation):
+    return os.path.join(path, f"gen_{generation:06d}")
+
+
+class Recorder:
+    def __init__(self, path, sim, capacity=256):
+        self.path = path
+        self.pop_size = sim.pop_size
+        self.n_sensors = len(SENSOR_ANGLES)
+        self.n = 0
+        self._allocate(capacity)
+
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump({'seed': sim.seed, 'pop_size': sim.pop_size, 'sensor_angles': SENSOR_ANGLES}, f)
+
+    def _allocate(self, capacity):
+        pop = self.pop_size
+        self.x = np.zeros((capacity, pop), dtype=np.float32)
+        self.y = np.zeros((capacity, pop), dtype=np.float32)
+        self.angle = np.zeros((capacity, pop), dtype=np.float32)
+        self.alive = np.zeros((capacity, pop), dtype=bool)
+        self.crashed = np.zeros((capacity, pop), dtype=bool)
+        self.sensors = np.zeros((capacity, pop, self.n_sensors), dtype=np.uint8)
+        self.actions = np.zeros((capacity, pop), dtype=np.int8)
+
+    def _grow(self):
+        old = {name: getattr(self, name) for name in COLUMNS}
+        self._allocate(2 * len(self.x))
+        for name, values in old.items():
+            getattr(self, name)[:len(values)] = values
+
+    def record(self, sim, live, actions):
+        """Append the state after one Simulation.step."""
+        if self.n == len(self.x):
+            self._grow()
+        i = self.n
+        batch = sim.batch
+        was_alive = self.alive[i - 1] if i else True
+        self.x[i] = batch.x
+        self.y[i] = batch.y
+        self.angle[i] = batch.angle
+        self.alive[i] = batch.alive
+        # batch.crashed is sticky until a frame is sent, keep only new crashes
+        np.logical_and(batch.crashed, was_alive, out=self.crashed[i])
+        if batch.radars.shape[1] == self.n_sensors:
+            np.clip(batch.radars, 0, 255, out=self.sensors[i], casting='unsafe')
+        self.actions[i] = -1
+        self.actions[i, live] = actions
+        self.n += 1
+
+    def end_generation(self, sim):
+        """Write the buffered generation and start a new one."""
+        n = self.n
+        self.n = 0
+        if n == 0:
+            return
+        final = generation_dir(self.path, sim.generation)
+        tmp = f"{final}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        for name in COLUMNS:
+            np.save(os.path.join(tmp, name + '.npy'), getattr(self, name)[:n])
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump({'generation': sim.generation, 'steps': n,
+                       'distance': float(sim.batch.distance.max())}, f)
+        # A hard reset starts numbering again, newer runs replace older ones
+        shutil.rmtree(final, ignore_errors=True)
+        os.replace(tmp, final)
+
+    def discard(self):
+        """Drop the generation in progress (hard reset)."""
+        self.n = 0
+
+
+class _FrameBatch:
+    def __init__(self, gen, step, since):
+        self.x = gen.x[step]
+        self.y = gen.y[step]
+        self.angle = gen.angle[step]
+        self.alive = gen.alive[step]
+        self.crashed = gen.crashed[since + 1:step + 1].any(axis=0)
+        self.radars = gen.sensors[step]
+
+
+class ReplayFrame:
+    """One recorded step, shaped like a Simulation for the frame encoders."""
+    def __init__(self, gen, step, since=None):
+        self.batch = _FrameBatch(gen, step, step - 1 if since is None else since)
+        self.pop_size = gen.pop_size
+        self.alive = int(self.batch.alive.sum())
+        self.steps = step + 1
+        self.generation = gen.generation
+
+
+class ReplayGeneration:
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        self.generation = meta['generation']
+        self.steps = meta['steps']
+        self.distance = meta['distance']
+        for name in COLUMNS:
+            setattr(self, name, np.load(os.path.join(path, name + '.npy'), mmap_mode='r'))
+        self.pop_size = self.x.shape[1]
+
+    def __len__(self):
+        return self.steps
+
+    def frame(self, step, since=None):
+        """State after `step`; crashes since step `since` are flagged."""
+        return ReplayFrame(self, step, since)
+
+
+class Replay:
+    """A directory written by Recorder."""
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+
+    def generations(self):
+        return sorted(int(name[4:]) for name in os.listdir(self.path)
+                      if name.startswith('gen_') and '.' not in name)
+
+    def load(self, generation):
+        path = generation_dir(self.path, generation)
+        if not os.path.isdir(path):
+            raise KeyError(f"Generation {generation} was not recorded")
+        return ReplayGeneration(path)
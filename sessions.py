@@ -0,0 +1,416 @@
+"""Session-scoped simulations for the web server, run on a shared worker pool.
+
+A Session is one Simulation with its own clients, settings (speed, pause),
+frame stream and replay state. Clients of a session share a Socket.IO room,
+so one session's controls never reach another.
+
+Sessions don't own threads. A SessionPool runs every session on a fixed
+number of worker threads: each worker takes the next session in
+round-robin order that is owed steps and runs at most `quantum` of them,
+so a session at max speed can't starve the paced ones. A token bucket caps
+the steps per second of all sessions together, and sessions without
+clients are evicted after `idle_timeout` seconds.
+
+    pool = SessionPool(workers=2, max_steps_per_sec=20000)
+    pool.add(Session('default', socketio, sim))
+    pool.start()
+"""
+import threading
+import time
+import traceback
+
+from broadcaster import Broadcaster
+from protocol import meta_frame
+from replay import Replay
+from simulation import Simulation
+from termination import StepBudget
+
+GENERATION_PAUSE = 0.5 # Seconds between generations when paced, so the reset is visible
+
+
+class Session:
+    def __init__(self, session_id, socketio, sim, frame_rate=30, profiler=None, pinned=False):
+        self.id = session_id
+        self.room = f"session:{session_id}"
+        self.socketio = socketio
+        self.sim = sim
+        self.profiler = profiler
+        self.pinned = pinned # Never evicted (the server's default session)
+        self.broadcaster = Broadcaster(socketio, rate=frame_rate)
+        self.broadcaster.profiler = profiler
+        sim.profiler = profiler
+
+        self.steps_per_frame = 1 # Speed: physics steps per broadcast frame
+        self.unthrottled = False # Run physics as fast as the pool allows
+        self.generation_pause = GENERATION_PAUSE # A deadline for the next step, not a sleep
+        self.paused = False
+        self.reset_signal = False
+
+        # Recording, playback of recorded generations and checkpoints
+        self.replay_dir = None
+        self.playback = None # ReplayGeneration being streamed instead of the live sim
+        self.playback_step = 0
+        self.last_published = -1
+        self.checkpoints = None
+        self.checkpoint_every = 10
+
+        self.clients = set()
+        self.last_active = time.monotonic()
+        self.next_step = time.perf_counter()
+        self.steps_run = 0
+        self.busy = False # Being run by a pool worker
+
+    # --- Clients ---
+    def add_client(self, sid):
+        self.clients.add(sid)
+        self.broadcaster.add_client(sid)
+        self.last_active = time.monotonic()
+
+    def remove_client(self, sid):
+        self.clients.discard(sid)
+        self.broadcaster.remove_client(sid)
+        self.last_active = time.monotonic()
+
+    def emit(self, event, data, binary=False):
+        self.socketio.emit(event, data, to=self.room + ':binary' if binary else self.room)
+
+    def send_meta(self, frame=None):
+        self.broadcaster.request_keyframe()
+        self.emit('meta', meta_frame(frame or self.sim), binary=True)
+
+    # --- Controls ---
+    def set_speed(self, speed):
+        if speed == 'max':
+            self.unthrottled = True
+        else:
+            self.steps_per_frame = max(1, int(speed))
+            self.unthrottled = False
+        self.next_step = time.perf_counter()
+
+    def toggle_pause(self):
+        self.paused = not self.paused
+        self.next_step = time.perf_counter()
+        self.emit('pause_state', {'paused': self.paused})
+
+    def play_replay(self, generation):
+        """Stream a recorded generation instead of the live sim. Returns an error or None."""
+        if not self.replay_dir:
+            return "Start the server with --record or --replay"
+        try:
+            gen = Replay(self.replay_dir).load(int(generation))
+        except (KeyError, ValueError, TypeError, OSError) as e:
+            return str(e)
+        self.playback_step = 0
+        self.playback = gen
+        print(f"[{self.id}] Replaying generation {gen.generation} ({len(gen)} steps)")
+        self.emit('reset', {'generation': gen.generation})
+        self.emit('replay_state', {'playing': True, 'generation': gen.generation, 'steps': len(gen)})
+        self.send_meta(gen.frame(0))
+        return None
+
+    def stop_replay(self):
+        if self.playback is None:
+            return
+        self.playback = None
+        self.emit('reset', {'generation': self.sim.generation})
+        self.emit('replay_state', {'playing': False, 'generation': self.sim.generation})
+        self.send_meta()
+
+    def hard_reset(self):
+        # Wipe the brains, but keep a copy on disk, out of the new run's way
+        sim = self.sim
+        if self.checkpoints:
+            self.checkpoints.submit(sim, archive=True)
+        if sim.recorder:
+            sim.recorder.discard()
+        budget = sim.step_budget and StepBudget(sim.step_budget.min_steps, sim.step_budget.factor)
+        # Same settings, but a fresh seed: with the old one the new run would replay the wiped one
+        self.sim = Simulation(sim.pop_size, max_steps=sim.max_steps, track=sim.track, fitness=sim.fitness,
+                              learner=sim.learner, kill_rules=sim.kill_rules, step_budget=budget,
+                              params=sim.params, rewards=sim.rewards)
+        self.sim.recorder = sim.recorder
+        self.sim.profiler = self.profiler
+        print(f"[{self.id}] Hard reset, seed {self.sim.seed}")
+        self.emit('hard_reset', {'generation': 1})
+        self.send_meta()
+
+    def reset_generation(self):
+        sim = self.sim
+        stats = sim.next_generation()
+        if stats:
+            print(f"[{self.id}] Gen {stats['generation']} Complete. Best Dist: {stats['distance']:.1f}")
+            self.emit('gen_log', gen_log_entry(stats))
+        if self.checkpoints and sim.generation % self.checkpoint_every == 0:
+            self.checkpoints.submit(sim)
+        self.emit('reset', {'generation': sim.generation})
+        self.send_meta()
+
+    # --- Pacing ---
+    def step_interval(self):
+        return 1 / (self.steps_per_frame * self.broadcaster.rate)
+
+    def owed(self, now):
+        """Steps this session wants to run at `now`."""
+        if self.reset_signal:
+            return 1
+        if self.paused:
+            return 0
+        if self.unthrottled:
+            return 1 << 30
+        if now < self.next_step:
+            return 0
+        if now - self.next_step > 0.25:
+            self.next_step = now # Fell behind, don't try to catch up
+        return int((now - self.next_step) / self.step_interval()) + 1
+
+    def wait_time(self, now):
+        """Seconds until this session is owed a step."""
+        if self.reset_signal:
+            return 0.0
+        if self.paused:
+            return float('inf')
+        return max(0.0, self.next_step - now)
+
+    def run(self, budget):
+        """Run up to `budget` steps (one pool slice). Returns the steps run."""
+        ran = 0
+        while ran < budget:
+            if self.reset_signal:
+                self.reset_signal = False
+                self.hard_reset()
+                self.next_step = time.perf_counter() + self.generation_pause
+                break
+            if self.playback is not None:
+                # --- Replay (recorded steps, no physics) ---
+                gen = self.playback
+                if self.playback_step == 0:
+                    self.last_published = -1
+                if self.playback_step >= len(gen):
+                    self.stop_replay()
+                    break
+                if self.broadcaster.due():
+                    self.broadcaster.publish(gen.frame(self.playback_step, since=self.last_published))
+                    self.last_published = self.playback_step
+                self.playback_step += 1
+            else:
+                sim = self.sim
+                if sim.done:
+                    started = time.perf_counter()
+                    self.reset_generation()
+                    self._record('reset_generation', started)
+                    self.next_step = time.perf_counter() + (0 if self.unthrottled else self.generation_pause)
+                    break
+
+                # --- Physics, then hand the latest state to the broadcaster ---
+                sim.step()
+                self.broadcaster.count_steps()
+                self.last_published = -1
+                if self.broadcaster.due():
+                    started = time.perf_counter()
+                    self.broadcaster.publish(sim)
+                    sim.batch.crashed.fill(False)
+                    self._record('publish', started)
+            ran += 1
+            if not self.unthrottled:
+                self.next_step += self.step_interval()
+            if self.profiler is not None:
+                self.profiler.tick()
+        self.steps_run += ran
+        return ran
+
+    def _record(self, phase, started):
+        if self.profiler is not None and self.profiler.enabled:
+            self.profiler.record(phase, time.perf_counter() - started)
+
+    def stats(self):
+        sim = self.sim
+        return {
+            'session': self.id,
+            'clients': len(self.clients),
+            'track': sim.track.name,
+            'pop_size': sim.pop_size,
+            'fitness': sim.fitness,
+            'learner': sim.learner,
+            'step_limit': sim.step_limit,
+            'generation': sim.generation,
+            'alive': sim.alive,
+            'steps': sim.steps,
+            'steps_run': self.steps_run,
+            'speed': 'max' if self.unthrottled else self.steps_per_frame,
+            'paused': self.paused,
+        }
+
+
+def gen_log_entry(stats):
+    return {
+        'generation': stats['generation'],
+        'distance': round(stats['distance'], 1),
+        'epsilon': round(stats['epsilon'], 3)
+    }
+
+
+class SessionPool:
+    def __init__(self, workers=2, max_steps_per_sec=None, quantum=50, idle_timeout=600, max_sessions=16):
+        self.workers = workers
+        self.max_steps_per_sec = max_steps_per_sec
+        self.quantum = quantum
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self.threads = []
+        self.running = False
+        self.evicted = 0
+        self.throttled = 0 # Slices shortened or delayed by the steps/sec cap
+
+        self._order = [] # Round-robin order of session ids
+        self._next = 0
+        self._cond = threading.Condition()
+        self._tokens = 0.0
+        self._refilled = time.perf_counter()
+        self._last_evict = time.monotonic()
+
+    # --- Sessions ---
+    def get(self, session_id):
+        return self.sessions.get(session_id)
+
+    def full(self):
+        return len(self.sessions) >= self.max_sessions
+
+    def add(self, session):
+        with self._cond:
+            if self.full() and session.id not in self.sessions:
+                raise RuntimeError(f"Session limit reached ({self.max_sessions})")
+            old = self.sessions.get(session.id)
+            if old is not None:
+                old.broadcaster.stop()
+            else:
+                self._order.append(session.id)
+            self.sessions[session.id] = session
+            if self.running:
+                session.broadcaster.start()
+            self._cond.notify_all()
+        return session
+
+    def remove(self, session_id):
+        with self._cond:
+            session = self.sessions.pop(session_id, None)
+            if session is None:
+                return None
+            self._order.remove(session_id)
+            while session.busy:
+                self._cond.wait() # Let the worker finish its slice
+        session.broadcaster.stop()
+        if session.checkpoints:
+            session.checkpoints.submit(session.sim)
+        return session
+
+    def notify(self):
+        """Wake the workers, e.g. after a session was unpaused."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def evict_idle(self, now=None):
+        now = time.monotonic() if now is None else now
+        idle = [s.id for s in list(self.sessions.values())
+                if not s.pinned and not s.clients and now - s.last_active > self.idle_timeout]
+        for session_id in idle:
+            if self.remove(session_id) is not None:
+                self.evicted += 1
+                print(f"Evicted idle session {session_id}")
+        return idle
+
+    # --- Workers ---
+    def start(self):
+        self.running = True
+        for session in self.sessions.values():
+            session.broadcaster.start()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"session-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+        for session in self.sessions.values():
+            session.broadcaster.stop()
+
+    def thread_ids(self):
+        return [t.ident for t in self.threads if t.is_alive()]
+
+    def _refill(self, now):
+        if self.max_steps_per_sec is None:
+            return
+        # At most a tenth of a second of steps can build up
+        self._tokens = min(self.max_steps_per_sec * 0.1,
+                           self._tokens + (now - self._refilled) * self.max_steps_per_sec)
+        self._refilled = now
+
+    def _take(self):
+        """Pick the next session owed steps. Called with the lock held."""
+        now = time.perf_counter()
+        self._refill(now)
+        wait = 0.05
+        n = len(self._order)
+        for i in range(n):
+            session = self.sessions[self._order[(self._next + i) % n]]
+            if session.busy:
+                continue
+            owed = session.owed(now)
+            if owed <= 0:
+                wait = min(wait, session.wait_time(now))
+                continue
+            budget = min(owed, self.quantum)
+            if self.max_steps_per_sec is not None:
+                if self._tokens < 1:
+                    self.throttled += 1
+                    return None, (1 - self._tokens) / self.max_steps_per_sec
+                if budget > self._tokens:
+                    self.throttled += 1
+                    budget = int(self._tokens)
+                self._tokens -= budget
+            self._next = (self._next + i + 1) % n
+            session.busy = True
+            return (session, budget), 0
+        return None, wait
+
+    def _work(self):
+        while True:
+            with self._cond:
+                if not self.running:
+                    return
+                job, wait = self._take()
+                if job is None:
+                    self._cond.wait(max(wait, 0.0005))
+                    continue
+            session, budget = job
+            ran = 0
+            try:
+                ran = session.run(budget)
+            except Exception as e:
+                print(f"Simulation Error (session {session.id}): {e}")
+                traceback.print_exc()
+                session.paused = True
+            finally:
+                with self._cond:
+                    session.busy = False
+                    if self.max_steps_per_sec is not None:
+                        self._tokens += budget - ran # Refund what the slice didn't use
+                    self._cond.notify_all()
+
+            if time.monotonic() - self._last_evict > 1.0:
+                self._last_evict = time.monotonic()
+                self.evict_idle()
+
+    def metrics(self):
+        sessions = list(self.sessions.values())
+        return {
+            'workers': self.workers,
+            'max_steps_per_sec': self.max_steps_per_sec,
+            'quantum': self.quantum,
+            'sessions': len(sessions),
+            'evicted': self.evicted,
+            'throttled': self.throttled,
+            'physics_steps_per_sec': round(sum(s.broadcaster.physics.rate for s in sessions), 1),
+        }
@@ -0,0 +1,260 @@
+import numpy as np
+
+import kernels
+from agent import ACTIONS, SarsaPopulation, TileCodingPopulation
+from car import CarBatch, MAX_SPEED
+from profiler import lap_fn
+from track import Track, SENSOR_ANGLES
+
+STEERING = np.array([a[0] for a in ACTIONS], dtype=float)
+THROTTLE = np.array([a[1] for a in ACTIONS], dtype=float)
+FITNESS = ('distance', 'progress')
+LEARNERS = {'tabular': SarsaPopulation, 'tiles': TileCodingPopulation}
+# Learner and evolution settings, and reward weights (override with params=/rewards=)
+PARAMS = {'alpha': 0.1, 'gamma': 0.95, 'epsilon': 0.2, 'elite': 3, 'mutation_rate': 0.05, 'mutation_scale': 0.5}
+REWARDS = {'speed': 0.5, 'offset': 0.1, 'near_wall': 2.0, 'crash': 50, 'finish': 1000}
+
+class Simulation:
+    """A population of cars and SARSA learners on one track.
+
+    This is the training loop shared by the web server and the headless
+    runners. Random draws for a step come from a generator keyed by
+    (seed, generation, step) and indexed by agent id. A run is therefore
+    reproducible for a fixed seed, even when the population is split into
+    shards (agent_ids/total_size) evaluated in other processes.
+
+    fitness picks what evolution selects on: 'distance' is the odometer
+    (the original), 'progress' is signed laps along the centerline times
+    the lap length, so circling in place scores nothing.
+
+    learner picks the agents: 'tabular' SARSA on bucketed sensors (the
+    original) or 'tiles', linear SARSA(lambda) on tile-coded raw inputs.
+
+    kill_rules (termination.KillRules) takes stalled cars out early and
+    step_budget (termination.StepBudget) shortens generations while the
+    population is still bad; max_steps stays the upper limit.
+
+    params and rewards override entries of PARAMS (the learners' starting
+    alpha/gamma/epsilon, elite size and mutation) and REWARDS.
+
+    jit runs sensing, physics and reward as compiled kernels (kernels.py),
+    by default when Numba is installed. Results are the same either way.
+    """
+    def __init__(self, pop_size=5, seed=None, max_steps=1500, track=None, agent_ids=None, total_size=None,
+                 fitness='distance', learner='tabular', kill_rules=None, step_budget=None, params=None, rewards=None,
+                 jit=None):
+        if fitness not in FITNESS:
+            raise ValueError(f"fitness must be one of {FITNESS}, got {fitness!r}")
+        if learner not in LEARNERS:
+            raise ValueError(f"learner must be one of {tuple(LEARNERS)}, got {learner!r}")
+        for given, defaults in ((params, PARAMS), (rewards, REWARDS)):
+            unknown = set(given or ()) - set(defaults)
+            if unknown:
+                raise ValueError(f"Unknown settings {sorted(unknown)}, expected some of {tuple(defaults)}")
+        if seed is None:
+            seed = int(np.random.SeedSequence().generate_state(1)[0])
+        self.seed = seed
+        self.pop_size = pop_size
+        self.max_steps = max_steps
+        self.step_limit = max_steps # This generation's, see step_budget
+        self.fitness = fitness
+        self.learner = learner
+        self.params = dict(PARAMS, **(params or {}))
+        self.rewards = dict(REWARDS, **(rewards or {}))
+        self.jit = kernels.AVAILABLE if jit is None else jit
+        self.track = track or Track()
+        self.agent_ids = np.arange(pop_size) if agent_ids is None else np.asarray(agent_ids)
+        self.total_size = pop_size if total_size is None else total_size
+
+        self.batch = CarBatch(pop_size, start=self.track.start)
+        self.population = LEARNERS[learner](pop_size, alpha=self.params['alpha'], gamma=self.params['gamma'],
+                                            epsilon=self.params['epsilon'], seed=[seed, 0])
+        self.generation = 1
+        self.steps = 0
+        self.alive = pop_size
+        self.car_steps = 0 # Live car-steps simulated, across generations
+        self.recorder = None # Optional replay.Recorder
+        self.profiler = None # Optional profiler.Profiler, times each phase of step()
+        self.history = [] # next_generation() log entries
+        self.kill_rules = kill_rules
+        self.step_budget = step_budget
+        if kill_rules is not None:
+            kill_rules.reset(pop_size)
+
+        self.prev_states = np.full((pop_size,) + self.population.state_shape, -1)
+        self.learning = np.zeros(pop_size, dtype=bool) # Has a previous (state, action) this generation
+        self.prev_actions = np.zeros(pop_size, dtype=np.int64)
+
+        # Laps along the centerline (signed) and the last lap position
+        self.progress = np.zeros(pop_size)
+        self.start_lap_pos = float(self.track.get_progress(*self.track.start[:2]))
+        self.lap_pos = np.full(pop_size, self.start_lap_pos)
+        if step_budget is not None:
+            self.step_limit = step_budget.limit(self)
+
+    @property
+    def done(self):
+        return self.alive == 0 or self.steps >= self.step_limit
+
+    def _draws(self, live):
+        rng = np.random.default_rng([self.seed, self.generation, self.steps])
+        draws = rng.random((2, self.total_size))
+        return draws[:, self.agent_ids[live]]
+
+    def step(self):
+        batch = self.batch
+        track = self.track
+        population = self.population
+        lap = lap_fn(self.profiler)
+
+        self.steps += 1
+        live = np.flatnonzero(batch.alive)
+        self.car_steps += live.size
+
+        # 1. Sensors (all live cars and angles in one pass)
+        if self.jit:
+            radars = kernels.sense(batch, track, SENSOR_ANGLES, live)
+        else:
+            radars = batch.sense(track, SENSOR_ANGLES)[live]
+        lap('sensors')
+
+        # 2. Agent Action
+        states = population.encode_states(radars, batch.speed[live])
+        actions = population.choose_actions(live, states, self._draws(live))
+        lap('choose_action')
+
+        min_sensor = radars.min(axis=1) if radars.shape[1] else np.full(live.size, 200)
+        if self.jit:
+            # 3. Physics and rewards in one compiled pass, timed as physics
+            reward, hit, finished = kernels.advance(self, live, actions, min_sensor, STEERING, THROTTLE, MAX_SPEED)
+            lap('physics')
+        else:
+            steering = np.zeros(self.pop_size)
+            throttle = np.zeros(self.pop_size)
+            steering[live] = STEERING[actions]
+            throttle[live] = THROTTLE[actions]
+            prev_x = batch.x[live]
+            prev_y = batch.y[live]
+            batch.step(steering, throttle)
+            x = batch.x[live]
+            y = batch.y[live]
+            lap('physics')
+
+            # 3. Rewards
+            weights = self.rewards
+            reward = batch.speed[live] * weights['speed']
+            offset, lap_pos = track.lookup(x, y)
+            reward -= offset * weights['offset']
+
+            reward[min_sensor < 15] -= weights['near_wall']
+
+            # No barrier on this track, only leaving the mask crashes
+            hit = ~track.on_track_batch(x, y)
+            reward[hit] -= weights['crash']
+            finished = ~hit & track.crossed_finish_batch(prev_x, x, y, prev_y)
+            reward[finished] += weights['finish']
+            batch.distance[live[finished]] += 2000
+
+            # Progress since the last step, wrapped so crossing the line counts
+            moved = live[~hit]
+            delta = (lap_pos[~hit] - self.lap_pos[moved] + 0.5) % 1.0 - 0.5
+            self.progress[moved] += delta
+            self.lap_pos[moved] = lap_pos[~hit]
+
+            batch.alive[live[hit | finished]] = False
+            batch.crashed[live[hit]] = True
+            lap('reward')
+        self.alive -= int(hit.sum() + finished.sum())
+
+        # 4. LEARN (Critical Fix)
+        learn = self.learning[live]
+        agents = live[learn]
+        population.update(
+            agents,
+            self.prev_states[agents],
+            self.prev_actions[agents],
+            reward[learn],
+            states[learn],
+            actions[learn]
+        )
+
+        self.prev_states[live] = states
+        self.prev_actions[live] = actions
+        self.learning[live] = True
+        lap('learn')
+
+        # 5. Early kills, after the last update so it is still learned from
+        if self.kill_rules is not None:
+            out = self.kill_rules.check(self, live)
+            if out is not None:
+                batch.alive[live[out]] = False
+                self.alive -= int(out.sum())
+            lap('kill')
+
+        if self.recorder is not None:
+            self.recorder.record(self, live, actions)
+            lap('record')
+
+    def fitness_scores(self):
+        """What evolution selects on this generation, per car."""
+        if self.fitness == 'progress':
+            return self.progress * self.track.length
+        return self.batch.distance
+
+    def run_generation(self):
+        """Step until every car is out or the step budget is spent."""
+        while not self.done:
+            self.step()
+
+    def next_generation(self, fitness=None):
+        """Evolve the population and reset the cars for the next generation.
+
+        fitness overrides fitness_scores() (e.g. with migrants' scores).
+        Returns the finished generation's log entry, or None after the first
+        generation (which, as before, is not evolved).
+        """
+        lap = lap_fn(self.profiler)
+        if self.recorder is not None:
+            self.recorder.end_generation(self)
+            lap('write_replay')
+
+        stats = None
+        if self.generation > 1:
+            if fitness is None:
+                fitness = self.fitness_scores()
+            best = int(np.argmax(fitness))
+            stats = {
+                'generation': self.generation,
+                'distance': float(self.batch.distance[best]),
+                'progress': float(self.progress[best]),
+                'epsilon': float(self.population.epsilon[best]),
+                'steps': self.steps,
+                'step_limit': self.step_limit,
+            }
+            if self.kill_rules is not None:
+                stats.update(self.kill_rules.summary(self.steps))
+
+            self.history.append(stats)
+
+            # Elitism & Mutation using top `elite` strategy (whole population at once)
+            params = self.params
+            self.population.evolve(fitness, elite=params['elite'], mutation_rate=params['mutation_rate'],
+                                   mutation_scale=params['mutation_scale'])
+            lap('evolve')
+
+        # Reset Cars
+        self.batch.reset()
+        self.alive = self.pop_size
+        self.steps = 0
+        self.generation += 1
+        if self.kill_rules is not None:
+            self.kill_rules.reset(self.pop_size)
+        if self.step_budget is not None:
+            self.step_limit = self.step_budget.limit(self)
+
+        # Reset Learning Buffers
+        self.learning.fill(False)
+        self.population.new_episode()
+        self.progress.fill(0)
+        self.lap_pos.fill(self.start_lap_pos)
+        return stats
@@ -0,0 +1,308 @@
+"""Hyperparameter sweeps over headless simulations.
+
+A sweep varies any of the Simulation's PARAMS (alpha, gamma, epsilon,
+elite, mutation_rate, mutation_scale), max_steps and the REWARDS weights
+(as reward_speed, reward_crash, ...). Every config is trained for some
+generations on each of --seeds seeds, the same seeds for every config, in
+a process pool. Search is one of:
+
+    grid      every combination of the listed values
+    random    --trials configs drawn from lists or {"low", "high"} ranges
+    halving   successive halving: --trials random configs get
+              --min-generations, the best 1/eta of them eta times as many,
+              and so on up to --generations
+
+    python sweep.py --out runs/grid --param alpha=0.05,0.1,0.2 --param mutation_rate=0.02,0.05
+    python sweep.py --out runs/search --spec sweep.json --workers 4
+
+where sweep.json holds the same settings, e.g.
+    {"search": "halving", "trials": 27, "generations": 81, "min_generations": 3,
+     "params": {"alpha": {"low": 0.02, "high": 0.5, "log": true}, "elite": [1, 3, 5]}}
+
+Each finished trial (config, seed, generations) is saved to
+<out>/trials/<key>.json and reused by later runs, so rerunning an
+interrupted sweep only runs what is missing. Runs are seeded, so a halving
+rung simply reruns a config from generation 1 with more generations.
+The summary (best distance of any generation, mean of the last 5, wall
+time) is printed and written to <out>/summary.csv.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+from simulation import FITNESS, LEARNERS, PARAMS, REWARDS, Simulation
+from tracks import load_track
+
+SEARCHES = ('grid', 'random', 'halving')
+METRICS = ('best', 'final')
+SETTINGS = dict(PARAMS, max_steps=1500, **{f"reward_{k}": v for k, v in REWARDS.items()})
+INTEGER = ('elite', 'max_steps')
+DEFAULTS = {'search': 'grid', 'params': {}, 'trials': 10, 'generations': 30, 'min_generations': 3, 'eta': 3,
+            'seeds': 2, 'seed': 0, 'pop': 20, 'track': 'stadium', 'fitness': 'distance', 'learner': 'tabular',
+            'metric': 'best'}
+FINAL_WINDOW = 5 # Generations averaged for the 'final' metric
+
+# Loaded once per worker process
+_tracks = {}
+
+def trial_seed(seed, repeat):
+    return int(np.random.SeedSequence([seed, repeat]).generate_state(1)[0])
+
+def trial_key(trial):
+    return hashlib.sha1(json.dumps(trial, sort_keys=True).encode()).hexdigest()[:16]
+
+def run_trial(trial):
+    """Train one config on one seed. Returns its scores and wall time."""
+    config = trial['config']
+    if trial['track'] not in _tracks:
+        _tracks[trial['track']] = load_track(trial['track'])
+    sim = Simulation(trial['pop'], seed=trial['seed'], max_steps=int(config.get('max_steps', SETTINGS['max_steps'])),
+                     track=_tracks[trial['track']], fitness=trial['fitness'], learner=trial['learner'],
+                     params={k: v for k, v in config.items() if k in PARAMS},
+                     rewards={k[len('reward_'):]: v for k, v in config.items() if k.startswith('reward_')})
+    start = time.perf_counter()
+    history = []
+    for _ in range(trial['generations']):
+        sim.run_generation()
+        stats = sim.next_generation()
+        if stats:
+            history.append(stats['distance'])
+    return {
+        'best': max(history, default=0.0),
+        'final': float(np.mean(history[-FINAL_WINDOW:])) if history else 0.0,
+        'seconds': time.perf_counter() - start,
+        'car_steps': sim.car_steps,
+    }
+
+
+def check_params(params):
+    """Validate a spec's params: name -> list of values or {"low", "high"[, "log"]} range."""
+    for name, values in params.items():
+        if name not in SETTINGS:
+            raise ValueError(f"Unknown setting {name!r}, expected one of {tuple(SETTINGS)}")
+        if isinstance(values, dict):
+            if 'low' not in values or 'high' not in values:
+                raise ValueError(f"Range for {name!r} needs low and high")
+        elif not isinstance(values, list) or not values:
+            raise ValueError(f"{name!r} needs a list of values or a low/high range")
+
+def parse_param(text):
+    """NAME=v1,v2,... or NAME=low:high (NAME=low:high:log for a log-uniform range)."""
+    name, _, values = text.partition('=')
+    if ':' in values:
+        low, high, *log = values.split(':')
+        return name, {'low': float(low), 'high': float(high), 'log': log == ['log']}
+    return name, [json.loads(v) for v in values.split(',')]
+
+def grid_configs(params):
+    configs = [{}]
+    for name, values in params.items():
+        if isinstance(values, dict):
+            raise ValueError(f"Grid search needs a list of values for {name!r}, not a range")
+        configs = [dict(config, **{name: v}) for config in configs for v in values]
+    return configs
+
+def random_configs(params, n, rng):
+    """n distinct configs drawn from the params' lists and ranges."""
+    configs = []
+    for _ in range(100 * n):
+        config = {}
+        for name, values in params.items():
+            if isinstance(values, list):
+                value = values[rng.integers(len(values))]
+            elif values.get('log'):
+                value = float(np.exp(rng.uniform(np.log(values['low']), np.log(values['high']))))
+            else:
+                value = float(rng.uniform(values['low'], values['high']))
+            if isinstance(value, float):
+                value = round(value) if name in INTEGER else float(f"{value:.4g}")
+            config[name] = value
+        if config not in configs:
+            configs.append(config)
+            if len(configs) == n:
+                break
+    return configs
+
+
+class Sweep:
+    """Runs configs on a process pool, caching every finished trial in out/trials."""
+    def __init__(self, out, spec, workers=1):
+        self.out = out
+        self.spec = spec
+        self.workers = max(1, workers)
+        self.trial_dir = os.path.join(out, 'trials')
+        os.makedirs(self.trial_dir, exist_ok=True)
+        self.seeds = [trial_seed(spec['seed'], r) for r in range(spec['seeds'])]
+        self.ran = 0
+        self.cached = 0
+
+    def _path(self, trial):
+        return os.path.join(self.trial_dir, trial_key(trial) + '.json')
+
+    def _load(self, trial):
+        try:
+            with open(self._path(trial)) as f:
+                return json.load(f)['result']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _save(self, trial, result):
+        path = self._path(trial)
+        with open(f"{path}.{os.getpid()}.tmp", 'w') as f:
+            json.dump({'trial': trial, 'result': result}, f)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+    def run(self, configs, generations):
+        """Train every config on every seed. Returns a summary row per config."""
+        spec = self.spec
+        trials = [{'config': config, 'seed': seed, 'generations': generations, 'pop': spec['pop'],
+                   'track': spec['track'], 'fitness': spec['fitness'], 'learner': spec['learner']}
+                  for config in configs for seed in self.seeds]
+        results = [self._load(trial) for trial in trials]
+        missing = [i for i, result in enumerate(results) if result is None]
+        self.cached += len(trials) - len(missing)
+        print(f"{len(configs)} configs x {len(self.seeds)} seeds, {generations} generations: "
+              f"{len(missing)} to run, {len(trials) - len(missing)} cached")
+
+        def finished(i, result):
+            self._save(trials[i], result)
+            results[i] = result
+            self.ran += 1
+            print(f"  [{self.ran}] {trials[i]['config']} seed {trials[i]['seed']}: "
+                  f"best {result['best']:.1f} ({result['seconds']:.1f}s)")
+
+        if self.workers > 1 and len(missing) > 1:
+            with multiprocessing.Pool(min(self.workers, len(missing))) as pool:
+                jobs = pool.imap_unordered(_indexed_trial, [(i, trials[i]) for i in missing])
+                for i, result in jobs:
+                    finished(i, result)
+        else:
+            for i in missing:
+                finished(i, run_trial(trials[i]))
+
+        rows = []
+        n = len(self.seeds)
+        for k, config in enumerate(configs):
+            own = results[k * n:(k + 1) * n]
+            rows.append({
+                'config': config,
+                'generations': generations,
+                'best': float(np.mean([r['best'] for r in own])),
+                'final': float(np.mean([r['final'] for r in own])),
+                'seconds': float(sum(r['seconds'] for r in own)),
+                'seeds': n,
+            })
+        return rows
+
+def _indexed_trial(job):
+    i, trial = job
+    return i, run_trial(trial)
+
+
+def search(sweep, spec):
+    """Run the spec's search. Returns the summary rows, the longest-trained first."""
+    params = spec['params']
+    rng = np.random.default_rng(spec['seed'])
+    if spec['search'] == 'grid':
+        return sweep.run(grid_configs(params), spec['generations'])
+    if spec['search'] == 'random':
+        return sweep.run(random_configs(params, spec['trials'], rng), spec['generations'])
+
+    configs = random_configs(params, spec['trials'], rng)
+    generations = min(spec['min_generations'], spec['generations'])
+    rungs = []
+    while True:
+        rows = sweep.run(configs, generations)
+        rungs.append(rows)
+        if len(configs) == 1 or generations >= spec['generations']:
+            break
+        rows = sorted(rows, key=lambda row: -row[spec['metric']])
+        configs = [row['config'] for row in rows[:max(1, len(rows) // spec['eta'])]]
+        generations = min(generations * spec['eta'], spec['generations'])
+    # Each config at the largest budget it reached
+    latest = {}
+    for rows in rungs:
+        for row in rows:
+            latest[json.dumps(row['config'], sort_keys=True)] = row
+    return list(latest.values())
+
+def write_summary(path, rows, names):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['rank'] + names + ['generations', 'seeds', 'best', 'final', 'seconds'])
+        for rank, row in enumerate(rows, 1):
+            writer.writerow([rank] + [row['config'].get(name, SETTINGS[name]) for name in names] +
+                            [row['generations'], row['seeds'], f"{row['best']:.1f}", f"{row['final']:.1f}",
+                             f"{row['seconds']:.1f}"])
+
+def print_summary(rows, names, metric, limit=20):
+    widths = [max(len(name), 8) for name in names]
+    print(f"{'rank':>4} " + " ".join(f"{name:>{w}}" for name, w in zip(names, widths)) +
+          f" {'gens':>5} {'best':>8} {'final':>8} {'seconds':>8}")
+    for rank, row in enumerate(rows[:limit], 1):
+        values = [row['config'].get(name, SETTINGS[name]) for name in names]
+        print(f"{rank:>4} " + " ".join(f"{v:>{w}g}" for v, w in zip(values, widths)) +
+              f" {row['generations']:>5} {row['best']:>8.1f} {row['final']:>8.1f} {row['seconds']:>8.1f}")
+    if len(rows) > limit:
+        print(f"... {len(rows) - limit} more in summary.csv")
+    print(f"Ranked by {metric}, averaged over seeds")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hyperparameter sweeps over headless RL Racecar runs")
+    parser.add_argument('--out', required=True, metavar='DIR', help="Trial cache and summary.csv (rerun to resume)")
+    parser.add_argument('--spec', metavar='FILE', help="JSON spec, the options below override it")
+    parser.add_argument('--param', action='append', default=[], metavar='NAME=VALUES',
+                        help=f"Values to try: a,b,c or low:high[:log]. One of: {', '.join(SETTINGS)}")
+    parser.add_argument('--search', choices=SEARCHES)
+    parser.add_argument('--trials', type=int, help="Configs drawn by random and halving search")
+    parser.add_argument('--generations', type=int, help="Generations per trial (the most for halving)")
+    parser.add_argument('--min-generations', type=int, help="Generations in the first halving rung")
+    parser.add_argument('--eta', type=int, help="Halving keeps 1/eta of the configs per rung")
+    parser.add_argument('--seeds', type=int, help="Seeds per config")
+    parser.add_argument('--seed', type=int, help="Base seed for the trials and the config draws")
+    parser.add_argument('--pop', type=int)
+    parser.add_argument('--track', help="stadium, a preset in tracks/, random:<seed> or a .json file")
+    parser.add_argument('--fitness', choices=FITNESS)
+    parser.add_argument('--learner', choices=LEARNERS)
+    parser.add_argument('--metric', choices=METRICS, help="Rank by the best generation or the last ones")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes")
+    args = parser.parse_args()
+
+    spec = dict(DEFAULTS)
+    if args.spec:
+        with open(args.spec) as f:
+            spec.update(json.load(f))
+    for key in DEFAULTS:
+        value = getattr(args, key, None)
+        if value is not None and key != 'params':
+            spec[key] = value
+    spec['params'] = dict(spec['params'], **dict(parse_param(p) for p in args.param))
+    try:
+        check_params(spec['params'])
+        if spec['search'] not in SEARCHES or spec['metric'] not in METRICS:
+            raise ValueError(f"search must be one of {SEARCHES} and metric one of {METRICS}")
+    except ValueError as e:
+        parser.error(str(e))
+
+    sweep = Sweep(args.out, spec, workers=args.workers)
+    start = time.perf_counter()
+    rows = search(sweep, spec)
+    rows.sort(key=lambda row: (-row['generations'], -row[spec['metric']]))
+    names = list(spec['params'])
+    write_summary(os.path.join(args.out, 'summary.csv'), rows, names)
+    print_summary(rows, names, spec['metric'])
+    print(f"{sweep.ran} trials run, {sweep.cached} cached, {time.perf_counter() - start:.1f}s. "
+          f"Summary in {os.path.join(args.out, 'summary.csv')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Early termination: stop cars (and generations) that only burn steps.
+
+KillRules takes cars out once they stop getting anywhere, checked for all
+live cars at once every few steps. StepBudget replaces the fixed max_steps with
+a limit that grows with the best progress any car has made, so early
+generations, which crash or stall long before 1500 steps, end sooner.
+
+    sim = Simulation(200, kill_rules=KillRules(), step_budget=StepBudget())
+
+Both are plain picklable objects, so shards built from them in other
+processes kill exactly the same cars.
+"""
+import numpy as np
+
+from car import MAX_SPEED
+
+RULES = ('stall', 'slow', 'revisit')
+
+
+class KillRules:
+    """Vectorized early-kill rules, checked every `every` steps. A rule set to 0 is off.
+
+    stall: no new best progress (by stall_progress laps) for stall_steps
+    slow: speed under min_speed at every check for slow_steps
+    revisit: back in a cell x cell square it already left, until
+             `revisits` of the last `window` cells it moved through are
+             that square: tight circles, which the odometer alone rewards
+    """
+    def __init__(self, stall_steps=200, stall_progress=0.005, min_speed=1.0, slow_steps=60,
+                 cell=40, revisits=4, window=40, every=5):
+        self.stall_steps = stall_steps
+        self.stall_progress = stall_progress
+        self.min_speed = min_speed
+        self.slow_steps = slow_steps
+        self.cell = cell
+        self.revisits = revisits
+        self.window = window
+        self.every = every
+        self.reset(0)
+
+    def reset(self, size):
+        """Clear the per-car state, at the start of every generation."""
+        self.best = np.zeros(size)
+        self.improved_at = np.zeros(size, dtype=np.int64)
+        self.slow_since = np.zeros(size, dtype=np.int64)
+        self.cells = np.full((size, max(self.window, 1)), -1, dtype=np.int64) # Ring of cells moved through
+        self.head = np.zeros(size, dtype=np.int64)
+        self.killed_by = np.full(size, -1, dtype=np.int8) # Index into RULES
+        self.kill_step = np.zeros(size, dtype=np.int64)
+
+    def check(self, sim, live):
+        """Mask over `live` of the cars to take out this step, None between checks."""
+        step = sim.steps
+        if step % self.every:
+            return None
+        batch = sim.batch
+        kill = np.full(live.size, -1, dtype=np.int8)
+
+        # 1. Stall: progress along the centerline, not the odometer
+        if self.stall_steps:
+            progress = sim.progress[live]
+            better = progress > self.best[live] + self.stall_progress
+            self.best[live[better]] = progress[better]
+            self.improved_at[live[better]] = step
+            kill[step - self.improved_at[live] >= self.stall_steps] = 0
+
+        # 2. Slow
+        if self.slow_steps:
+            fast = live[batch.speed[live] >= self.min_speed]
+            self.slow_since[fast] = step
+            kill[(kill < 0) & (step - self.slow_since[live] >= self.slow_steps)] = 1
+
+        # 3. Revisits of the same cell
+        if self.revisits:
+            cell = (batch.x[live] // self.cell).astype(np.int64) * 65536 + (batch.y[live] // self.cell).astype(np.int64)
+            # Only a change of cell is recorded, sitting still is the slow rule's job
+            moved = cell != self.cells[live, self.head[live]]
+            cars = live[moved]
+            self.head[cars] = (self.head[cars] + 1) % self.cells.shape[1]
+            self.cells[cars, self.head[cars]] = cell[moved]
+            visits = (self.cells[live] == cell[:, None]).sum(axis=1)
+            kill[(kill < 0) & (visits >= self.revisits)] = 2
+
+        out = (kill >= 0) & batch.alive[live] # Not the ones that crashed or finished this step
+        self.killed_by[live[out]] = kill[out]
+        self.kill_step[live[out]] = step
+        return out
+
+    def summary(self, end_step):
+        """Cars killed per rule, and the car-steps they would have run until end_step."""
+        killed = self.killed_by >= 0
+        stats = {f"killed_{name}": int((self.killed_by == i).sum()) for i, name in enumerate(RULES)}
+        stats['car_steps_saved'] = int((end_step - self.kill_step[killed]).sum())
+        return stats
+
+
+class StepBudget:
+    """A max_steps that grows with the population's best progress.
+
+    The limit is min_steps plus `factor` times the steps a car at top speed
+    needs to cover the best progress (in laps) seen so far, capped at the
+    simulation's max_steps. It never shrinks.
+    """
+    def __init__(self, min_steps=300, factor=2.0):
+        self.min_steps = min_steps
+        self.factor = factor
+        self.best_progress = 0.0
+
+    def limit(self, sim):
+        self.best_progress = max(self.best_progress, float(sim.progress.max(initial=0.0)))
+        steps = self.min_steps + self.factor * self.best_progress * sim.track.length / MAX_SPEED
+        return int(min(sim.max_steps, steps))
@@ -0,0 +1,56 @@
+"""Session limit and control checks of the asyncio server.
+
+Run from the repository root:
+    python -m unittest discover tests
+"""
+import asyncio
+import os
+import sys
+import unittest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import async_server
+
+
+class AsyncServerTest(unittest.TestCase):
+    def setUp(self):
+        self.max_sessions = async_server.MAX_SESSIONS
+        async_server.MAX_SESSIONS = 2
+
+    def tearDown(self):
+        for session in async_server.sessions.values():
+            session.stop()
+        async_server.sessions.clear()
+        async_server.client_sessions.clear()
+        async_server.MAX_SESSIONS = self.max_sessions
+
+    def test_session_limit(self):
+        async def run():
+            await async_server.get_session('default', {})
+            await async_server.get_session('a', {})
+            refused = await async_server.connect('sid-b', {'QUERY_STRING': 'session=b&pop=200'})
+            joined = await async_server.get_session('a', {}) # Existing sessions can still be joined
+            return refused, joined
+        refused, joined = asyncio.run(run())
+        self.assertIs(refused, False)
+        self.assertEqual(sorted(async_server.sessions), ['a', 'default'])
+        self.assertIs(joined, async_server.sessions['a'])
+
+    def test_bad_speed_ignored(self):
+        async def run():
+            session = await async_server.get_session('default', {})
+            async_server.client_sessions['sid'] = session
+            for speed in ('fast', None, [2], float('inf')):
+                await async_server.set_speed('sid', {'speed': speed})
+            await async_server.set_speed('sid', {'speed': '3'})
+            await async_server.set_speed('sid', {'speed': 'max'})
+            return [session.controls.get_nowait() for _ in range(session.controls.qsize())]
+        self.assertEqual(asyncio.run(run()), [('speed', 3), ('speed', 'max')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+"""Custom .json tracks in worker processes and checkpoints.
+
+Run from the repository root:
+    python -m unittest discover tests
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checkpoint import load_checkpoint, save_checkpoint
+from main import HeadlessRunner
+from tracks import load_track
+
+# Its name is not a preset, so only the file path brings it back
+LOOP = {'name': 'myloop', 'width': 90,
+        'points': [[400, 100], [650, 150], [700, 300], [650, 450], [400, 500], [150, 450], [100, 300], [150, 150]]}
+
+
+class JsonTrackTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'myloop.json')
+        with open(self.path, 'w') as f:
+            json.dump(LOOP, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_source(self):
+        self.assertEqual(load_track('stadium').source, 'stadium')
+        self.assertEqual(load_track('hairpin').source, 'hairpin')
+        track = load_track(self.path)
+        self.assertEqual(track.name, 'myloop')
+        self.assertEqual(load_track(track.source).params(), track.params())
+
+    def test_workers(self):
+        runner = HeadlessRunner(4, seed=1, max_steps=50, workers=2, track=self.path)
+        try:
+            runner.run(3, log_every=100)
+        finally:
+            runner.close()
+        single = HeadlessRunner(4, seed=1, max_steps=50, workers=1, track=self.path)
+        single.run(3, log_every=100)
+        self.assertEqual(runner.sim.generation, 4)
+        self.assertTrue(runner.sim.history)
+        self.assertEqual(runner.sim.history, single.sim.history)
+
+    def test_checkpoint_round_trip(self):
+        runner = HeadlessRunner(4, seed=2, max_steps=50, track=self.path)
+        runner.run(2, log_every=100)
+        save_checkpoint(os.path.join(self.dir, 'ckpt'), runner.sim)
+        sim = load_checkpoint(os.path.join(self.dir, 'ckpt'))
+        self.assertEqual(sim.track.name, 'myloop')
+        self.assertEqual(sim.track.params(), runner.sim.track.params())
+        self.assertEqual(sim.generation, runner.sim.generation)
+        self.assertEqual(sim.history, runner.sim.history)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,99 @@
 import pygame
+import hashlib
+import json
 import math
+import os
 import numpy as np
 
+from car import START_X, START_Y
+
+RADAR_RANGE = 200
+RADAR_STEP = 5
+SENSOR_ANGLES = [-1.2, -0.6, 0, 0.6, 1.2]
+RADAR_CHUNK = 16384 # Rays marched together in get_radars_batch
+# Finish line kinds of Track.finish_line(), for the compiled step in kernels.py
+FINISH_STADIUM = 0 # (x, y_min, y_max): crossed left to right between y_min and y_max
+FINISH_SEGMENT = 1 # (x, y, tangent x, tangent y, half width)
+
+# Precomputed track geometry (mask, clearance, offset and progress tables)
+# lives here, one .npz per set of track parameters
+CACHE_VERSION = 2
+OFFSET_MARGIN = 16 # px past the track edge the offset table is exact for
+CACHE_DIR = os.environ.get('RL_RACECAR_TRACK_CACHE',
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), '.track_cache'))
+
+def sensor_offsets(count=5, spread=1.2):
+    """Evenly spaced sensor angles, count=5 gives SENSOR_ANGLES."""
+    if count == 1:
+        return [0]
+    return [spread * (2 * i / (count - 1) - 1) for i in range(count)]
+
+def cached_geometry(params, build):
+    """Arrays from build(), cached on disk under a hash of params.
+
+    A missing, stale or unreadable cache entry is rebuilt. Failing to write
+    the cache (read-only checkout) is not an error.
+    """
+    key = json.dumps({'version': CACHE_VERSION, **params}, sort_keys=True)
+    digest = hashlib.sha1(key.encode()).hexdigest()[:16]
+    label = ''.join(c if c.isalnum() else '-' for c in params.get('name', 'track'))
+    path = os.path.join(CACHE_DIR, f"{label}-{digest}.npz")
+    try:
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+    except (OSError, ValueError, KeyError):
+        pass
+
+    arrays = build()
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+    return arrays
+
+def centerline_tables(centerline, width, height, far):
+    """Per-pixel distance to a closed centerline polyline and lap progress.
+
+    progress is the arc length of the nearest centerline point divided by
+    the lap length, 0 at centerline[0]. Only pixels within `far` of the
+    centerline are filled; beyond that offset is `far` and progress 0.
+    """
+    offset = np.full((height, width), far, dtype=np.float32)
+    progress = np.zeros((height, width), dtype=np.float32)
+    a = np.asarray(centerline, dtype=float)
+    b = np.roll(a, -1, axis=0)
+    seg = np.hypot(*(b - a).T)
+    arc = np.concatenate([[0], np.cumsum(seg)])
+    length = arc[-1]
+    reach = int(math.ceil(far))
+    for i, ((ax, ay), (bx, by)) in enumerate(zip(a, b)):
+        x0 = max(int(min(ax, bx)) - reach, 0)
+        x1 = min(int(max(ax, bx)) + reach + 1, width)
+        y0 = max(int(min(ay, by)) - reach, 0)
+        y1 = min(int(max(ay, by)) + reach + 1, height)
+        if x0 >= x1 or y0 >= y1:
+            continue
+        # Pixel centers against segment i
+        px = np.arange(x0, x1) + 0.5
+        py = (np.arange(y0, y1) + 0.5)[:, None]
+        dx, dy = bx - ax, by - ay
+        t = np.clip(((px - ax) * dx + (py - ay) * dy) / (dx * dx + dy * dy), 0, 1)
+        dist = np.hypot(px - (ax + t * dx), py - (ay + t * dy))
+        window = offset[y0:y1, x0:x1]
+        closer = dist < window
+        window[closer] = dist[closer]
+        progress[y0:y1, x0:x1][closer] = ((arc[i] + t * seg[i]) / length)[closer] % 1.0
+    return offset, progress, length
+
 class Track:
-    def __init__(self):
+    """The original stadium: two half circles joined by straights."""
+    name = 'stadium'
+    source = 'stadium' # What tracks.load_track rebuilds this track from
+
+    def __init__(self, exact_radar=False):
         self.width = 800
         self.height = 600
 
@@ -19,11 +109,14 @@ class Track:
         self.outer_radius = 200
         self.inner_radius = 100
         self.track_width = self.outer_radius - self.inner_radius # 100
+        self.half_width = self.track_width / 2
 
         # Start/Finish Line (Top Center)
         self.finish_x = 400
         self.finish_y = 150 # Top straight center
         self.finish_height = 100 # Track width
+        self.start = (START_X, START_Y, 0.0) # x, y, angle of a fresh car
+        self.centerline = self._stadium_centerline()
         
         # Barrier removed so cars can loop. 
         # We rely on the AI to learn direction from rewards.
@@ -33,6 +126,65 @@ class Track:
         self.track_surf.fill((0, 0, 0))
         self._draw_track_shape(self.track_surf, (255, 255, 255)) 
 
+        # Raycast acceleration structure, built once from the mask
+        self.exact_radar = exact_radar
+        self._set_geometry(cached_geometry(self.params(), self._build_geometry))
+
+    def _stadium_centerline(self, spacing=4):
+        """Clockwise centerline from the finish line, sampled about every `spacing` px."""
+        (lx, ly), (rx, ry) = self.center_left, self.center_right
+        r = (self.outer_radius + self.inner_radius) / 2
+        top = ly - r
+        arc_n = int(math.ceil(math.pi * r / spacing))
+        arc = np.arange(arc_n) / arc_n * math.pi
+
+        def straight(x0, x1, y):
+            n = int(math.ceil(abs(x1 - x0) / spacing))
+            return np.stack([x0 + (x1 - x0) * np.arange(n) / n, np.full(n, y)], axis=1)
+
+        def turn(cx, cy, start):
+            return np.stack([cx + r * np.cos(start + arc), cy + r * np.sin(start + arc)], axis=1)
+
+        return np.concatenate([
+            straight(self.finish_x, rx, top),
+            turn(rx, ry, -math.pi / 2),
+            straight(rx, lx, ry + r),
+            turn(lx, ly, math.pi / 2),
+            straight(lx, self.finish_x, top),
+        ])
+
+    def params(self):
+        """Everything the precomputed geometry depends on (the cache key)."""
+        return {'name': self.name, 'size': [self.width, self.height],
+                'centers': [self.center_left, self.center_right],
+                'radii': [self.outer_radius, self.inner_radius]}
+
+    def _build_geometry(self):
+        mask = pygame.surfarray.array_red(self.track_surf).T > 128
+        offset, progress, _ = centerline_tables(self.centerline, self.width, self.height,
+                                                self.half_width + OFFSET_MARGIN)
+        return {'mask': mask, 'clearance': self._chebyshev_clearance(mask), 'offset': offset, 'progress': progress}
+
+    def _set_geometry(self, geometry):
+        self.mask = geometry['mask']
+        self._mask_rows = self.mask.tolist()
+        self.clearance = geometry['clearance']
+        # Radar samples that can be skipped from each pixel, -1 when off track
+        skip = np.maximum(self.clearance - 2, 0) // RADAR_STEP
+        self._radar_skip = np.where(self.mask, skip, -1).tolist()
+
+        # (offset, progress) per pixel, one gather answers both
+        self.offset = geometry['offset']
+        self.progress = geometry['progress']
+        self._lookup = np.stack([self.offset, self.progress], axis=-1)
+        self._offset_rows = None # List copy for the scalar paths, made on first use
+        closed = np.vstack([self.centerline, self.centerline[:1]])
+        self.length = float(np.hypot(*np.diff(closed, axis=0).T).sum())
+
+    def describe(self):
+        """Geometry for the web frontend, which draws the stadium itself."""
+        return {'name': self.name}
+
     def _draw_track_shape(self, surface, color):
         """Helper to draw the defined stadium shape."""
         # 1. Left Turn (Outer)
@@ -51,35 +203,164 @@ class Track:
         pygame.draw.rect(surface, hole_color, (self.center_left[0], 300 - self.inner_radius, 
                                                self.center_right[0] - self.center_left[0], self.inner_radius * 2))
 
+    @staticmethod
+    def _chebyshev_clearance(mask):
+        """Chessboard distance from each pixel to the nearest off-track pixel.
+
+        Pixels outside the image count as off track. Chessboard distance never
+        exceeds the Euclidean one, so it is a safe bound for skipping samples.
+        """
+        clearance = mask.astype(np.int32)
+        core = mask.copy()
+        while core.any():
+            # 3x3 erosion, split into a row pass and a column pass
+            eroded = core.copy()
+            eroded[:, 1:] &= core[:, :-1]
+            eroded[:, :-1] &= core[:, 1:]
+            eroded[:, [0, -1]] = False
+            core = eroded.copy()
+            core[1:] &= eroded[:-1]
+            core[:-1] &= eroded[1:]
+            core[[0, -1]] = False
+            clearance += core
+        return clearance
+
     def on_track(self, x, y):
         if x < 0 or y < 0 or x >= self.width or y >= self.height:
             return False
         try:
-            return self.track_surf.get_at((int(x), int(y)))[0] > 128
+            return self._mask_rows[int(y)][int(x)]
         except:
             return False
 
-    def get_radar(self, x, y, angle):
+    def on_track_batch(self, xs, ys):
+        """Vectorized on_track for arrays of positions."""
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        inside = (xs >= 0) & (ys >= 0) & (xs < self.width) & (ys < self.height)
+        ix = np.where(inside, xs, 0).astype(np.intp)
+        iy = np.where(inside, ys, 0).astype(np.intp)
+        return inside & self.mask[iy, ix]
+
+    def get_radars_batch(self, xs, ys, angles, offsets=SENSOR_ANGLES, max_range=RADAR_RANGE):
+        """Radar readings for every car and sensor as an (N_cars, N_sensors) matrix.
+
+        Matches get_radar sample for sample: each ray is marched in 5px steps
+        against the NumPy mask, all rays and all samples at once.
+        """
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        ray_angles = (np.asarray(angles, dtype=float)[:, None] + np.asarray(offsets, dtype=float)[None, :]).ravel()
+        n_samples = -(-max_range // RADAR_STEP)
+        lengths = np.empty(ray_angles.size)
+
+        for start in range(0, ray_angles.size, RADAR_CHUNK):
+            chunk = slice(start, start + RADAR_CHUNK)
+            rays = ray_angles[chunk]
+            car = np.arange(start, start + rays.size) // len(offsets)
+
+            # Accumulate the step the same way the scalar loop does
+            px = np.empty((rays.size, n_samples + 1))
+            py = np.empty((rays.size, n_samples + 1))
+            px[:, 0] = xs[car]
+            py[:, 0] = ys[car]
+            px[:, 1:] = (np.cos(rays) * RADAR_STEP)[:, None]
+            py[:, 1:] = (np.sin(rays) * RADAR_STEP)[:, None]
+            np.cumsum(px, axis=1, out=px)
+            np.cumsum(py, axis=1, out=py)
+
+            off = ~self.on_track_batch(px[:, 1:], py[:, 1:])
+            first = np.argmax(off, axis=1)
+            lengths[chunk] = np.where(off.any(axis=1), (first + 1) * RADAR_STEP, max_range)
+
+        return lengths.reshape(xs.size, len(offsets))
+
+    def get_radar(self, x, y, angle, max_len=RADAR_RANGE):
+        if self.exact_radar:
+            return self.get_radar_exact(x, y, angle, max_len)
+
+        # Same 5px march as before, but samples the clearance field says are
+        # on track are stepped over without a mask lookup
         length = 0
-        max_len = 200
-        step = 5
+        step = RADAR_STEP
         dx = math.cos(angle) * step
         dy = math.sin(angle) * step
         curr_x, curr_y = x, y
+        radar_skip = self._radar_skip
+        skip = 0
 
         while length < max_len:
             curr_x += dx
             curr_y += dy
             length += step
-            if not self.on_track(curr_x, curr_y):
+            if skip:
+                skip -= 1
+                continue
+            if curr_x < 0 or curr_y < 0 or curr_x >= self.width or curr_y >= self.height:
+                return length
+            try:
+                skip = radar_skip[int(curr_y)][int(curr_x)]
+            except:
                 return length
+            if skip < 0:
+                return length
+        return max_len
+
+    def _inside_exact(self, x, y):
+        """Analytic point-in-track test against the stadium geometry."""
+        (lx, ly), (rx, ry) = self.center_left, self.center_right
+        in_straight = lx <= x <= rx
+
+        outer_sq = self.outer_radius ** 2
+        if not (in_straight and abs(y - ly) <= self.outer_radius
+                or (x - lx) ** 2 + (y - ly) ** 2 <= outer_sq
+                or (x - rx) ** 2 + (y - ry) ** 2 <= outer_sq):
+            return False
+
+        inner_sq = self.inner_radius ** 2
+        return not (in_straight and abs(y - ly) <= self.inner_radius
+                    or (x - lx) ** 2 + (y - ly) ** 2 <= inner_sq
+                    or (x - rx) ** 2 + (y - ry) ** 2 <= inner_sq)
+
+    def get_radar_exact(self, x, y, angle, max_len=RADAR_RANGE):
+        """Continuous distance to the track edge by ray/circle/segment intersection."""
+        ux = math.cos(angle)
+        uy = math.sin(angle)
+
+        # Every place the ray can cross a boundary of the stadium primitives
+        hits = []
+        for cx, cy in (self.center_left, self.center_right):
+            ox = x - cx
+            oy = y - cy
+            b = ux * ox + uy * oy
+            for radius in (self.outer_radius, self.inner_radius):
+                disc = b * b - (ox * ox + oy * oy - radius * radius)
+                if disc >= 0:
+                    root = math.sqrt(disc)
+                    hits.extend((-b - root, -b + root))
+        if uy:
+            for edge_y in (self.center_left[1] - self.outer_radius, self.center_left[1] - self.inner_radius,
+                           self.center_left[1] + self.inner_radius, self.center_left[1] + self.outer_radius):
+                hits.append((edge_y - y) / uy)
+        if ux:
+            for edge_x in (self.center_left[0], self.center_right[0]):
+                hits.append((edge_x - x) / ux)
+
+        # Walk the intervals between crossings, the first one whose midpoint
+        # is off track starts where the ray leaves the track
+        start = 0.0
+        for t in sorted(h for h in hits if 0 < h < max_len) + [max_len]:
+            mid = (start + t) / 2
+            if not self._inside_exact(x + ux * mid, y + uy * mid):
+                return start
+            start = t
         return max_len
 
     def hit_barrier(self, x, y):
         # No barrier
         return False
 
-    def crossed_finish(self, prev_x, x, y):
+    def crossed_finish(self, prev_x, x, y, prev_y=None):
         # Moving Right on Top Straight
         # Barrier is at X+20, so Finish is at X=400.
         # Check Y to be within top track section
@@ -89,27 +370,55 @@ class Track:
             
         return (prev_x < self.finish_x <= x)
 
+    def finish_line(self):
+        """(kind, parameters) of crossed_finish_batch for the compiled step (kernels.py)."""
+        return FINISH_STADIUM, np.array([self.finish_x, 100.0, 200.0])
+
     def get_offset_from_center(self, x, y):
         """Returns distance from the ideal center line of the track."""
-        # 1. Top Straight
-        if 200 <= x <= 600 and y < 300:
-            return abs(y - 150)
-            
-        # 2. Bottom Straight
-        elif 200 <= x <= 600 and y >= 300:
-            return abs(y - 450)
-            
-        # 3. Left Turn
-        elif x < 200:
-            dist = math.hypot(x - 200, y - 300)
-            return abs(dist - 150)
-            
-        # 4. Right Turn
-        elif x > 600:
-            dist = math.hypot(x - 600, y - 300)
-            return abs(dist - 150)
-            
-        return 0 # Should not happen if on track
+        if x < 0 or y < 0 or x >= self.width or y >= self.height:
+            return self.half_width + OFFSET_MARGIN
+        return self._offset_list()[int(y)][int(x)]
+
+    def _offset_list(self):
+        if self._offset_rows is None:
+            self._offset_rows = self.offset.tolist()
+        return self._offset_rows
+
+    def crossed_finish_batch(self, prev_xs, xs, ys, prev_ys=None):
+        """Vectorized crossed_finish."""
+        return (100 < ys) & (ys < 200) & (prev_xs < self.finish_x) & (self.finish_x <= xs)
+
+    def lookup(self, xs, ys):
+        """(offset from center, lap progress in [0, 1)) for arrays of positions.
+
+        One table gather per position. Positions off the image read as far
+        off center with progress 0.
+        """
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        inside = (xs >= 0) & (ys >= 0) & (xs < self.width) & (ys < self.height)
+        ix = np.where(inside, xs, 0).astype(np.intp)
+        iy = np.where(inside, ys, 0).astype(np.intp)
+        values = self._lookup[iy, ix]
+        offsets = np.where(inside, values[..., 0], self.half_width + OFFSET_MARGIN)
+        progress = np.where(inside, values[..., 1], 0)
+        return offsets.astype(float), progress.astype(float)
+
+    def lookup_table(self):
+        """(table, offset off the image) behind lookup, for the compiled step (kernels.py).
+
+        table is (height, width, 2): offset from center and lap progress per pixel.
+        """
+        return self._lookup, float(self.half_width + OFFSET_MARGIN)
+
+    def get_offsets_from_center(self, xs, ys):
+        """Vectorized get_offset_from_center."""
+        return self.lookup(xs, ys)[0]
+
+    def get_progress(self, xs, ys):
+        """Fraction of a lap from the finish line along the centerline."""
+        return self.lookup(xs, ys)[1]
 
     def draw(self, screen):
         screen.fill(self.bg_color)
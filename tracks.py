@@ -0,0 +1,207 @@
+"""Track library: centerline-spline tracks, procedural layouts and presets.
+
+A SplineTrack is a closed Catmull-Rom spline through control points plus a
+constant width. Its occupancy mask, clearance field and per-pixel distance
+to the centerline are computed once and cached on disk (see
+track.cached_geometry), so loading a known track is a few file reads.
+
+    load_track('stadium')       # the original Track
+    load_track('hairpin')       # tracks/hairpin.json
+    load_track('random:42')     # procedural, same layout for the same seed
+"""
+import glob
+import json
+import math
+import os
+
+import numpy as np
+import pygame
+
+from track import Track, FINISH_SEGMENT, RADAR_RANGE, OFFSET_MARGIN, cached_geometry, centerline_tables
+
+PRESET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tracks')
+SAMPLE_SPACING = 4 # px between centerline samples
+START_AHEAD = 50   # Cars start this far past the finish line, like the stadium
+
+def catmull_rom(points, spacing=SAMPLE_SPACING):
+    """Closed uniform Catmull-Rom curve through points, sampled about every `spacing` px."""
+    p = np.asarray(points, dtype=float)
+    n = len(p)
+    curve = []
+    for i in range(n):
+        p0, p1, p2, p3 = p[i - 1], p[i], p[(i + 1) % n], p[(i + 2) % n]
+        count = max(2, int(math.ceil(np.hypot(*(p2 - p1)) / spacing)))
+        t = np.arange(count)[:, None] / count
+        curve.append(0.5 * (2 * p1 + (p2 - p0) * t + (2 * p0 - 5 * p1 + 4 * p2 - p3) * t ** 2
+                            + (3 * p1 - p0 - 3 * p2 + p3) * t ** 3))
+    return np.concatenate(curve)
+
+
+class SplineTrack(Track):
+    """A closed track of constant width around a spline centerline.
+
+    Cars start just past the first control point heading along the spline.
+    The finish line is the track cross-section at the first control point.
+    """
+    def __init__(self, points, width=90, name='custom', exact_radar=False, size=(800, 600)):
+        self.name = name
+        self.source = name # Set by load_track to the preset name or .json path
+        self.width, self.height = size
+        self.points = [[float(x), float(y)] for x, y in points]
+        self.track_width = width
+        self.half_width = width / 2
+        self.exact_radar = exact_radar
+
+        # Colors
+        self.bg_color = (10, 10, 20)
+        self.track_color = (40, 40, 60)
+        self.border_color = (0, 255, 255)
+        self.finish_color = (255, 255, 255)
+
+        self.centerline = catmull_rom(self.points)
+        self._set_geometry(cached_geometry(self.params(), self._build_geometry))
+
+        # Finish line: cross-section at the first centerline sample
+        tangent = self.centerline[1] - self.centerline[0]
+        tangent /= np.hypot(*tangent)
+        self.finish_point = self.centerline[0]
+        self.finish_dir = tangent
+        self.finish_x, self.finish_y = (float(v) for v in self.finish_point)
+        self.finish_height = width
+        start = self.finish_point + tangent * START_AHEAD
+        self.start = (float(start[0]), float(start[1]), math.atan2(tangent[1], tangent[0]))
+
+    def params(self):
+        return {'name': self.name, 'kind': 'spline', 'size': [self.width, self.height],
+                'points': self.points, 'width': self.track_width, 'spacing': SAMPLE_SPACING}
+
+    def _build_geometry(self):
+        offset, progress, _ = centerline_tables(self.centerline, self.width, self.height,
+                                                self.half_width + OFFSET_MARGIN)
+        mask = offset <= self.half_width
+        return {'mask': mask, 'clearance': self._chebyshev_clearance(mask), 'offset': offset, 'progress': progress}
+
+    def describe(self):
+        step = max(1, len(self.centerline) // 400)
+        finish = [self.finish_point + self.half_width * np.array([-self.finish_dir[1], self.finish_dir[0]]) * side
+                  for side in (-1, 1)]
+        return {
+            'name': self.name,
+            'width': self.track_width,
+            'centerline': np.round(self.centerline[::step], 1).tolist(),
+            'finish': np.round(np.concatenate(finish), 1).tolist(),
+        }
+
+    def _inside_exact(self, x, y):
+        return self.on_track(x, y)
+
+    def get_radar_exact(self, x, y, angle, max_len=RADAR_RANGE):
+        """Sphere-traced distance to the edge using the offset field.
+
+        half_width - offset is a lower bound on the distance to the edge (the
+        offset field is 1-Lipschitz), so the ray can safely advance by it.
+        Accurate to about half a pixel.
+        """
+        ux = math.cos(angle)
+        uy = math.sin(angle)
+        rows = self._offset_list()
+        t = 0.0
+        while t < max_len:
+            cx = x + ux * t
+            cy = y + uy * t
+            if cx < 0 or cy < 0 or cx >= self.width or cy >= self.height:
+                return t
+            room = self.half_width - rows[int(cy)][int(cx)]
+            if room < 0:
+                return t
+            # -1 covers pixel quantization, near the edge crawl in half pixels
+            t += max(room - 1, 0.5)
+        return max_len
+
+    def crossed_finish(self, prev_x, x, y, prev_y=None):
+        return bool(self.crossed_finish_batch(np.array([prev_x]), np.array([x]), np.array([y]),
+                                              None if prev_y is None else np.array([prev_y]))[0])
+
+    def finish_line(self):
+        fx, fy = self.finish_point
+        tx, ty = self.finish_dir
+        return FINISH_SEGMENT, np.array([fx, fy, tx, ty, self.half_width], dtype=float)
+
+    def crossed_finish_batch(self, prev_xs, xs, ys, prev_ys=None):
+        """Cars that moved from behind the finish line to on or past it, within the track."""
+        if prev_ys is None:
+            prev_ys = ys
+        fx, fy = self.finish_point
+        tx, ty = self.finish_dir
+        before = (prev_xs - fx) * tx + (prev_ys - fy) * ty
+        after = (xs - fx) * tx + (ys - fy) * ty
+        lateral = np.abs((ys - fy) * tx - (xs - fx) * ty)
+        return (before < 0) & (after >= 0) & (lateral <= self.half_width)
+
+    def draw(self, screen):
+        screen.fill(self.bg_color)
+        colors = np.array(self.bg_color, dtype=np.uint8)[None, None].repeat(self.height, 0).repeat(self.width, 1)
+        colors[self.mask] = self.track_color
+        screen.blit(pygame.surfarray.make_surface(colors.transpose(1, 0, 2)), (0, 0))
+
+        normal = np.stack([-self.finish_dir[1], self.finish_dir[0]])
+        tangent = np.diff(np.vstack([self.centerline, self.centerline[:1]]), axis=0)
+        normals = np.stack([-tangent[:, 1], tangent[:, 0]], axis=1)
+        normals /= np.hypot(normals[:, 0], normals[:, 1])[:, None]
+        for side in (-1, 1):
+            edge = self.centerline + side * self.half_width * normals
+            pygame.draw.lines(screen, self.border_color, True, edge.tolist(), 3)
+        a = self.finish_point - normal * self.half_width
+        b = self.finish_point + normal * self.half_width
+        pygame.draw.line(screen, self.finish_color, a.tolist(), b.tolist(), 6)
+
+
+def random_track(seed, n_points=10, width=80, jitter=0.35, size=(800, 600)):
+    """Procedural loop: control points around an ellipse with radial jitter."""
+    rng = np.random.default_rng(seed)
+    w, h = size
+    margin = width / 2 + 20
+    rx = w / 2 - margin
+    ry = h / 2 - margin
+    angles = np.sort(rng.uniform(0, 2 * np.pi, n_points))
+    # Keep points from bunching up, which makes kinks
+    angles = np.linspace(0, 2 * np.pi, n_points, endpoint=False) * 0.5 + angles * 0.5
+    radius = 1 - jitter * rng.random(n_points)
+    points = np.stack([w / 2 + rx * radius * np.cos(angles), h / 2 + ry * radius * np.sin(angles)], axis=1)
+    return SplineTrack(points.round(1).tolist(), width=width, name=f"random:{seed}", size=size)
+
+
+def preset_names():
+    return sorted(os.path.splitext(os.path.basename(p))[0] for p in glob.glob(os.path.join(PRESET_DIR, '*.json')))
+
+def available_tracks():
+    return ['stadium'] + preset_names() + ['random:<seed>']
+
+def load_preset(path, exact_radar=False):
+    with open(path) as f:
+        spec = json.load(f)
+    return SplineTrack(spec['points'], width=spec.get('width', 90), name=spec.get('name', 'custom'),
+                       exact_radar=exact_radar, size=tuple(spec.get('size', (800, 600))))
+
+def load_track(name='stadium', exact_radar=False):
+    """Track by name: 'stadium', a preset in tracks/, 'random:<seed>' or a .json path.
+
+    The track's `source` is what to pass here to get it back, in another
+    process or from a checkpoint.
+    """
+    if name in (None, '', 'stadium'):
+        return Track(exact_radar=exact_radar)
+    if name.startswith('random:'):
+        track = random_track(int(name.split(':', 1)[1]))
+        track.exact_radar = exact_radar
+        return track
+    if name.endswith('.json'):
+        track = load_preset(name, exact_radar)
+        track.source = os.path.abspath(name)
+        return track
+    path = os.path.join(PRESET_DIR, name + '.json')
+    if not os.path.exists(path):
+        raise ValueError(f"Unknown track '{name}', available: {', '.join(available_tracks())}")
+    track = load_preset(path, exact_radar)
+    track.source = name
+    return track
@@ -1,17 +1,19 @@
-import threading
-import time
-import traceback
 import pygame
-import math
-import random
 import os
-from flask import Flask, render_template
-from flask_socketio import SocketIO, emit
+import argparse
+from flask import Flask, Response, render_template, request, jsonify
+from flask_socketio import SocketIO, emit, join_room, leave_room
 
 # Import existing game logic
 from track import Track
-from car import Car
-from agent import SarsaAgent, ACTIONS
+from tracks import load_track, preset_names
+from simulation import FITNESS, LEARNERS, Simulation
+from protocol import detail_settings, meta_frame
+from replay import Recorder
+from checkpoint import CheckpointWriter, load_checkpoint
+from profiler import Profiler
+from sessions import GENERATION_PAUSE, Session, SessionPool, gen_log_entry
+from termination import KillRules, StepBudget
 
 app = Flask(__name__, template_folder='web_viz/templates', static_folder='web_viz/static')
 # Use threading for Windows compatibility reliability
@@ -19,275 +21,275 @@ socketio = SocketIO(app, async_mode='threading')
 
 # Headless Pygame for Server
 os.environ["SDL_VIDEODRIVER"] = "dummy"
-pygame.init() 
+pygame.init()
 
 # --- Simulation State ---
 POP_SIZE = 5
+MAX_POP_SIZE = 200 # Largest population a client may ask for in a new session
+SEED = None # Random unless --seed is given
+FITNESS_MODE = 'distance' # What evolution selects on (--fitness)
+LEARNER = 'tabular' # Agent type for new sessions (--learner)
+EARLY_KILL = False # termination.KillRules for new sessions (--early-kill)
+ADAPTIVE_STEPS = False # termination.StepBudget for new sessions (--adaptive-steps)
+DEFAULT_SESSION = 'default'
 track = Track()
-agents = [SarsaAgent() for _ in range(POP_SIZE)]
-cars = [Car((0,0,0)) for _ in range(POP_SIZE)] # Colors handled by frontend
-generation = 1
-alive = POP_SIZE
-steps = 0
-max_steps = 1500
+tracks = {track.name: track} # Loaded tracks, shared by the sessions that drive on them
 
-sim_running = True
-steps_per_frame = 1 
-paused = False
-reset_signal = False # Thread-safe flag
+# Frames go out from a thread per session at a fixed rate, so slow clients
+# never hold up the physics
+FRAME_RATE = 30
 
-COLORS = [
-    "#FF0055", "#00FFFF", "#FFFF00", "#39FF14", "#FF00FF", "#FF8000",
-    "#8000FF", "#0080FF", "#FFFFFF", "#64FF64", "#FF6464", "#6464FF"
-]
+# Phase timers for the loop, off until a client asks (set_profiling or --profile)
+profiler = Profiler()
 
-@socketio.on('set_speed')
-def handle_set_speed(data):
-    global steps_per_frame
-    try:
-        steps_per_frame = int(data['speed'])
-        print(f"Speed set to {steps_per_frame}x")
-    except:
-        pass
+# Every session (one per experiment, joined with ?session=<name>) runs on
+# this pool. --record, --checkpoint and --resume apply to the default session.
+pool = SessionPool(workers=2)
+record_dir = None
+replay_dir = None
+client_sessions = {} # sid -> Session
 
-@socketio.on('toggle_pause')
-def handle_pause():
-    global paused
-    paused = not paused
-    print(f"Simulation Paused: {paused}")
-    socketio.emit('pause_state', {'paused': paused})
+def client_track(name):
+    """Track a client asked for by name: a preset or one the server already runs.
 
-@socketio.on('restart_sim')
-def handle_restart():
-    global reset_signal
-    reset_signal = True
-    print("Restart Signal Received")
+    Clients can't open files or make the server build random tracks.
+    """
+    if not name:
+        return track
+    if name not in tracks:
+        if name not in preset_names():
+            raise ValueError(f"Unknown track '{name}', available: {', '.join(sorted(set(tracks) | set(preset_names())))}")
+        tracks[name] = load_track(name)
+    return tracks[name]
 
-def perform_hard_reset():
-    global cars, alive, steps, generation, agents
-    print("Executing Hard Reset...")
-    
-    # 1. Reset Counters
-    generation = 1
-    steps = 0
-    
-    # 2. Reset Agents & Cars (Wipe Brains)
-    agents = [SarsaAgent() for _ in range(POP_SIZE)]
-    cars = [Car((0,0,0)) for _ in range(POP_SIZE)]
-    alive = POP_SIZE
-    
-    # 3. Notify Frontend
-    socketio.emit('hard_reset', {'generation': 1})
+def new_session(session_id, track_name=None, pop_size=None, fitness=None, seed=None, learner=None):
+    sim = Simulation(pop_size or POP_SIZE, seed=seed if seed is not None else SEED,
+                     track=client_track(track_name), fitness=fitness or FITNESS_MODE,
+                     learner=learner or LEARNER, kill_rules=KillRules() if EARLY_KILL else None,
+                     step_budget=StepBudget() if ADAPTIVE_STEPS else None)
+    session = Session(session_id, socketio, sim, frame_rate=FRAME_RATE, profiler=profiler,
+                      pinned=session_id == DEFAULT_SESSION)
+    session.replay_dir = replay_dir
+    session.generation_pause = GENERATION_PAUSE
+    return session
 
-def reset_generation():
-    global cars, alive, steps, generation, agents
-    
-    # Evolution
-    if generation > 1:
-        ranked = sorted(zip(agents, cars), key=lambda x: x[1].distance, reverse=True)
-        best_agent = ranked[0][0]
-        best_dist = ranked[0][1].distance
-        
-        print(f"Gen {generation} Complete. Best Dist: {best_dist:.1f}")
-        
-        # Emit Log Data
-        socketio.emit('gen_log', {
-            'generation': generation,
-            'distance': round(best_dist, 1),
-            'epsilon': round(best_agent.epsilon, 3)
-        })
-        
-        # Elitism & Mutation using top 3 strategy
-        new_agents = []
-        # 1. Elitism: Keep best exact
-        best_clone = best_agent.clone_mutate()
-        best_clone.epsilon = best_agent.epsilon
-        new_agents.append(best_clone)
-        
-        # 2. Selection from top 3
-        top_slice = ranked[:3]
-        top_agents = [r[0] for r in top_slice]
-        
-        for _ in range(POP_SIZE - 1):
-             if top_agents:
-                 parent = random.choice(top_agents)
-                 new_agents.append(parent.clone_mutate())
-             else:
-                 new_agents.append(best_agent.clone_mutate())
-             
-        agents = new_agents
+pool.add(new_session(DEFAULT_SESSION))
 
-    # Reset Cars
-    cars = [Car((0,0,0)) for _ in range(POP_SIZE)]
-    alive = POP_SIZE
-    steps = 0
-    generation += 1
-    
-    # Notify frontend of reset
-    socketio.emit('reset', {'generation': generation})
+def current_session():
+    return client_sessions.get(request.sid) or pool.get(DEFAULT_SESSION)
 
-# Threading Control
-sim_thread = None
-sim_instance_id = 0
+def session_args(args):
+    """Settings for a new session from the connect query, defaults for missing ones."""
+    pop_size = args.get('pop', type=int)
+    return {
+        'track_name': args.get('track') or None,
+        'pop_size': None if pop_size is None else min(max(pop_size, 1), MAX_POP_SIZE),
+        'fitness': args.get('fitness') if args.get('fitness') in FITNESS else None,
+        'seed': args.get('seed', type=int),
+        'learner': args.get('learner') if args.get('learner') in LEARNERS else None,
+    }
 
-def start_simulation_thread():
-    global sim_thread, sim_instance_id
-    
-    # Increment ID to invalidate old threads
-    sim_instance_id += 1
-    current_id = sim_instance_id
-    
-    if sim_thread and sim_thread.is_alive():
-        print("Stopping old simulation thread...")
-        # Old thread will die when it sees ID mismatch
-    
-    print(f"Starting Simulation Thread ID: {current_id}")
-    sim_thread = threading.Thread(target=run_simulation, args=(current_id,))
-    sim_thread.daemon = True
-    sim_thread.start()
+@socketio.on('connect')
+def handle_connect():
+    # ?session=<name> picks (or creates) the session, track/pop/fitness/seed/
+    # learner configure a new one
+    session_id = (request.args.get('session') or DEFAULT_SESSION)[:64]
+    session = pool.get(session_id)
+    if session is None:
+        try:
+            if pool.full():
+                raise RuntimeError(f"Session limit reached ({pool.max_sessions})") # Before building anything
+            session = pool.add(new_session(session_id, **session_args(request.args)))
+        except (RuntimeError, ValueError, KeyError, OSError) as e:
+            print(f"Refused session {session_id}: {e}")
+            return False
+        print(f"Created session {session_id}")
+    client_sessions[request.sid] = session
+    session.add_client(request.sid)
+    join_room(session.room)
+    emit('session', session.stats())
+    emit('track', session.sim.track.describe())
+    emit('pause_state', {'paused': session.paused})
+    emit('profiling_state', {'enabled': profiler.enabled})
+    # Rebuild the log and chart of a resumed run
+    for stats in session.sim.history[-200:]:
+        emit('gen_log', gen_log_entry(stats))
 
-def run_simulation(my_id):
-    global alive, steps, generation, reset_signal, sim_instance_id
-    print(f"Thread {my_id} Running")
-    
-    prev_states = [None] * POP_SIZE
-    prev_actions = [None] * POP_SIZE
+@socketio.on('disconnect')
+def handle_disconnect():
+    session = client_sessions.pop(request.sid, None)
+    if session is not None:
+        session.remove_client(request.sid)
+
+@socketio.on('set_protocol')
+def handle_set_protocol(data):
+    # Clients get JSON 'update' events unless they opt into binary 'frame' events
+    session = current_session()
+    binary = bool(data.get('binary')) if isinstance(data, dict) else False
+    if binary:
+        join_room(session.room + ':binary')
+    else:
+        leave_room(session.room + ':binary')
+    session.broadcaster.set_binary(request.sid, binary)
+    if binary:
+        emit('meta', meta_frame(session.sim))
+
+@socketio.on('set_detail')
+def handle_set_detail(data):
+    # Lower levels of detail send only what is worth drawing (protocol.lod_frame)
+    session = current_session()
+    try:
+        settings = detail_settings(data)
+    except (TypeError, ValueError):
+        settings = None
+    session.broadcaster.set_detail(request.sid, settings)
 
+@socketio.on('set_speed')
+def handle_set_speed(data):
+    session = current_session()
     try:
-        while True:
-            # --- ZOMBIE CHECK ---
-            if my_id != sim_instance_id:
-                print(f"Thread {my_id} stopping (Superceded by {sim_instance_id})")
-                return
+        session.set_speed(data['speed'])
+        print(f"[{session.id}] Speed set to {'max' if session.unthrottled else session.steps_per_frame}x")
+    except:
+        pass
+    pool.notify()
 
-            # --- Hard Reset Handling (Thread Safe) ---
-            if reset_signal:
-                perform_hard_reset()
-                prev_states = [None] * POP_SIZE
-                prev_actions = [None] * POP_SIZE
-                reset_signal = False
-                time.sleep(0.5)
-                continue
+@socketio.on('toggle_pause')
+def handle_pause():
+    session = current_session()
+    session.toggle_pause()
+    print(f"[{session.id}] Simulation Paused: {session.paused}")
+    pool.notify()
 
-            if not sim_running:
-                time.sleep(0.1)
-                continue
-                
-            if paused:
-                time.sleep(0.1)
-                continue
-            
-            # --- Multi-Step Physics Loop for Speed ---
-            for _ in range(steps_per_frame):
-                # Check for interrupt or Zombie
-                if reset_signal or my_id != sim_instance_id:
-                    break
-                    
-                if alive == 0 or steps >= max_steps:
-                    reset_generation()
-                    time.sleep(0.5)
-                    # Reset Learning Buffers
-                    prev_states = [None] * POP_SIZE
-                    prev_actions = [None] * POP_SIZE
-                    break 
-                
-                steps += 1
-                
-                for i, (car, agent) in enumerate(zip(cars, agents)):
-                    if not car.alive:
-                        continue
-                        
-                    # 1. Sensors
-                    car.radars = []
-                    sensor_angles = [-1.2, -0.6, 0, 0.6, 1.2] 
-                    for angle in sensor_angles:
-                        dist = track.get_radar(car.x, car.y, car.angle + angle)
-                        car.radars.append((dist, angle))
-                    
-                    # 2. Agent Action
-                    state = agent.get_state(car)
-                    action = agent.choose_action(state)
-                    steering, throttle = ACTIONS[action]
-                    
-                    prev_x = car.x
-                    car.step(steering, throttle)
-                    
-                    # 3. Rewards
-                    reward = car.speed * 0.5
-                    offset = track.get_offset_from_center(car.x, car.y)
-                    reward -= offset * 0.1
-                    
-                    # Correctly strip distance for min check (since radars are tuples)
-                    start_dists = [r[0] for r in car.radars]
-                    min_sensor = min(start_dists) if start_dists else 200
-                    if min_sensor < 15:
-                        reward -= 2.0
-                    
-                    hit = False
-                    if track.hit_barrier(car.x, car.y):
-                        hit = True
-                        reward -= 50
-                    elif not track.on_track(car.x, car.y):
-                        hit = True
-                        reward -= 50
-                    
-                    if hit:
-                        car.alive = False
-                        alive -= 1
-                        car.crashed_this_frame = True
-                    elif track.crossed_finish(prev_x, car.x, car.y):
-                        reward += 1000
-                        car.distance += 2000
-                        car.alive = False
-                        alive -= 1
+@socketio.on('set_profiling')
+def handle_set_profiling(data):
+    profiler.enabled = bool(data.get('enabled')) if isinstance(data, dict) else False
+    if isinstance(data, dict) and data.get('reset'):
+        profiler.reset()
+    print(f"Profiling {'on' if profiler.enabled else 'off'}")
+    socketio.emit('profiling_state', {'enabled': profiler.enabled})
 
-                    # 4. LEARN (Critical Fix)
-                    if prev_states[i] is not None:
-                         agent.update(
-                            prev_states[i], 
-                            prev_actions[i], 
-                            reward, 
-                            state, 
-                            action
-                         )
-                    
-                    prev_states[i] = state
-                    prev_actions[i] = action
-            
-            # --- Prepare Data for Frontend (Once per frame) ---
-            if my_id != sim_instance_id: return
+@socketio.on('play_replay')
+def handle_play_replay(data):
+    error = current_session().play_replay(data.get('generation') if isinstance(data, dict) else None)
+    if error:
+        emit('replay_state', {'playing': False, 'error': error})
 
-            sim_data = []
-            for i, car in enumerate(cars):
-                 crashed = getattr(car, 'crashed_this_frame', False)
-                 if crashed: 
-                     car.crashed_this_frame = False 
-                     
-                 sim_data.append({
-                    'id': i,
-                    'x': round(car.x, 1),
-                    'y': round(car.y, 1),
-                    'angle': round(car.angle, 2),
-                    'alive': int(car.alive), 
-                    'crashed': crashed,
-                    'sensors': car.radars, # Send sensor data for visualizer!
-                    'color': COLORS[i % len(COLORS)]
-                })
-            
-            socketio.emit('update', {'cars': sim_data, 'alive': alive, 'steps': steps})
-            
-            # Frame Delay
-            time.sleep(1/30) # 30 updates per second for visuals is enough
+@socketio.on('stop_replay')
+def handle_stop_replay():
+    current_session().stop_replay()
 
-    except Exception as e:
-        print(f"Simulation Error (Thread {my_id}): {e}")
-        traceback.print_exc()
+@socketio.on('restart_sim')
+def handle_restart():
+    # Carried out by the pool between steps of this session
+    session = current_session()
+    session.reset_signal = True
+    print(f"[{session.id}] Restart Signal Received")
+    pool.notify()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+@app.route('/stats')
+def stats():
+    # ?session=<name> for one session, the default session otherwise
+    session = pool.get(request.args.get('session', DEFAULT_SESSION))
+    if session is None:
+        return jsonify({'error': 'Unknown session'}), 404
+    data = session.broadcaster.metrics()
+    data.update(session.stats())
+    data['pool'] = pool.metrics()
+    data['sessions'] = [s.stats() for s in list(pool.sessions.values())]
+    data['profiling'] = profiler.enabled
+    data['phases'] = profiler.summary()
+    return jsonify(data)
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus text format: phase timings plus the pool's and broadcasters' numbers
+    gauges = {}
+    sessions = list(pool.sessions.values())
+    for session in sessions:
+        for key, value in session.broadcaster.metrics().items():
+            if isinstance(value, (int, float)) and key != 'broadcast_rate':
+                gauges[key] = gauges.get(key, 0) + value
+    gauges.update({key: value for key, value in pool.metrics().items() if isinstance(value, (int, float))})
+    gauges['clients'] = sum(len(s.clients) for s in sessions)
+    gauges['alive'] = sum(s.sim.alive for s in sessions)
+    return Response(profiler.prometheus(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/profile')
+def profile():
+    # Sample the pool workers' stacks over the next N steps
+    frames = min(max(request.args.get('frames', 300, type=int), 1), 100000)
+    threads = pool.thread_ids()
+    if not threads or all(s.paused for s in list(pool.sessions.values())):
+        return Response("Simulation is not running\n", status=503, mimetype='text/plain')
+    return Response(profiler.sample(threads, frames), mimetype='text/plain')
+
 if __name__ == '__main__':
-    start_simulation_thread()
+    parser = argparse.ArgumentParser(description="RL Racecar web server")
+    parser.add_argument('--seed', type=int, default=None, help="Seed for a reproducible run")
+    parser.add_argument('--frame-rate', type=int, default=FRAME_RATE, help="Broadcast frames per second")
+    parser.add_argument('--unthrottled', action='store_true', help="Run physics as fast as possible")
+    parser.add_argument('--record', metavar='DIR', help="Record every generation to DIR for replay")
+    parser.add_argument('--replay', metavar='DIR', help="Replay generations from DIR (defaults to --record)")
+    parser.add_argument('--checkpoint', metavar='DIR', help="Save the population to DIR periodically")
+    parser.add_argument('--checkpoint-every', type=int, default=10, help="Generations between checkpoints")
+    parser.add_argument('--resume', action='store_true', help="Continue from the latest checkpoint in --checkpoint")
+    parser.add_argument('--track', default=None, help="stadium, a preset in tracks/, random:<seed> or a .json file")
+    parser.add_argument('--fitness', choices=FITNESS, default=FITNESS_MODE, help="What evolution selects on")
+    parser.add_argument('--learner', choices=LEARNERS, default=LEARNER, help="Tabular SARSA or tile-coded SARSA(lambda)")
+    parser.add_argument('--early-kill', action='store_true', help="Take out stalled, slow and circling cars early")
+    parser.add_argument('--adaptive-steps', action='store_true', help="Grow the step limit with the best progress")
+    parser.add_argument('--generation-pause', type=float, default=GENERATION_PAUSE,
+                        help="Seconds between generations when paced")
+    parser.add_argument('--profile', action='store_true', help="Start with the phase timers on")
+    parser.add_argument('--workers', type=int, default=pool.workers, help="Threads shared by all sessions")
+    parser.add_argument('--max-steps-per-sec', type=float, default=None, help="Cap on physics steps/s over all sessions")
+    parser.add_argument('--max-sessions', type=int, default=pool.max_sessions, help="Sessions hosted at once")
+    parser.add_argument('--idle-timeout', type=float, default=pool.idle_timeout,
+                        help="Seconds before a session without clients is evicted")
+    args = parser.parse_args()
+    if args.resume and not args.checkpoint:
+        parser.error("--resume needs --checkpoint DIR")
+    FRAME_RATE = args.frame_rate
+    if args.track:
+        track = load_track(args.track)
+        tracks[track.name] = track
+    FITNESS_MODE = args.fitness
+    LEARNER = args.learner
+    EARLY_KILL = args.early_kill
+    ADAPTIVE_STEPS = args.adaptive_steps
+    GENERATION_PAUSE = max(0.0, args.generation_pause)
+    SEED = args.seed
+    pool = SessionPool(workers=max(1, args.workers), max_steps_per_sec=args.max_steps_per_sec,
+                       max_sessions=max(1, args.max_sessions), idle_timeout=args.idle_timeout)
+    replay_dir = args.replay or args.record
+    session = new_session(DEFAULT_SESSION)
+    if args.checkpoint:
+        session.checkpoints = CheckpointWriter(args.checkpoint)
+        session.checkpoint_every = max(1, args.checkpoint_every)
+        if args.resume and os.path.exists(os.path.join(args.checkpoint, 'LATEST')):
+            # Same track as the checkpoint unless --track picks another
+            session.sim = load_checkpoint(args.checkpoint, track=track if args.track else None,
+                                          kill_rules=session.sim.kill_rules, step_budget=session.sim.step_budget)
+            session.sim.profiler = profiler
+            track = session.sim.track
+            tracks[track.name] = track
+            SEED = session.sim.seed
+            FITNESS_MODE = session.sim.fitness
+            LEARNER = session.sim.learner
+            POP_SIZE = session.sim.pop_size
+            print(f"Resumed generation {session.sim.generation} from {args.checkpoint}")
+    if args.record:
+        record_dir = args.record
+        session.sim.recorder = Recorder(record_dir, session.sim)
+    session.unthrottled = args.unthrottled
+    pool.add(session)
+    profiler.enabled = args.profile
+
+    pool.start()
     print("Starting Web Server on port 5001...")
     socketio.run(app, debug=True, host='0.0.0.0', port=5001, allow_unsafe_werkzeug=True)
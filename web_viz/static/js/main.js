@@ -1,64 +1,212 @@
 const canvas = document.getElementById('raceCanvas');
-const ctx = canvas.getContext('2d');
-const socket = io();
+// ?session=<name> joins (or starts) a separate simulation; track, pop,
+// fitness and seed configure a new one
+const pageParams = new URLSearchParams(window.location.search);
+const sessionQuery = {};
+for (const key of ['session', 'track', 'pop', 'fitness', 'seed']) {
+    if (pageParams.has(key)) sessionQuery[key] = pageParams.get(key);
+}
+const socket = io({query: sessionQuery});
 
 // UI Elements
 const genEl = document.getElementById('gen-count');
 const aliveEl = document.getElementById('alive-count');
+const sessionEl = document.getElementById('session-name');
 const speedRange = document.getElementById('speedRange');
 const speedVal = document.getElementById('speedVal');
 const pauseBtn = document.getElementById('pauseBtn');
 const restartBtn = document.getElementById('restartBtn');
 const logBody = document.getElementById('logBody');
+const replayGen = document.getElementById('replayGen');
+const replayBtn = document.getElementById('replayBtn');
+const detailSelect = document.getElementById('detailSelect');
+const profileToggle = document.getElementById('profileToggle');
+const profileBody = document.getElementById('profileBody');
+const sampleBtn = document.getElementById('sampleBtn');
+const profileSample = document.getElementById('profileSample');
+const fpsOverlay = document.getElementById('fpsOverlay');
+let replaying = false;
 
-let cars = [];
 let generation = 1;
-const trails = {}; // Store paths: {id: [{x,y}, ...]}
-let particles = []; // Explosion particles
+
+// Opt into the binary frame stream with ?binary in the page URL
+const useBinary = pageParams.has('binary');
+let meta = {colors: [], sensor_angles: [], pos_scale: 4, angle_units: 4096};
+let frameState = null; // Last decoded quantized state, deltas apply to it
+
+// --- RENDERER (render.js) ---
+// ?render=worker draws on an OffscreenCanvas in a Web Worker, ?render=events
+// is the old renderer (everything redrawn on every server frame) to compare
+// against. The default draws on requestAnimationFrame on this thread.
+let renderMode = pageParams.get('render') || 'raf';
+if (renderMode === 'worker' && !(canvas.transferControlToOffscreen && window.Worker)) {
+    console.warn('OffscreenCanvas is not supported, rendering on the main thread');
+    renderMode = 'raf';
+}
+let renderer;
+if (renderMode === 'worker') {
+    // Same interface as RaceRenderer, forwarded to the worker
+    const worker = new Worker('/static/js/render_worker.js');
+    const offscreen = canvas.transferControlToOffscreen();
+    worker.postMessage({type: 'init', canvas: offscreen}, [offscreen]);
+    worker.onmessage = (e) => showStats(e.data.stats);
+    renderer = {
+        push: (data) => worker.postMessage({type: 'frame', data: data}),
+        setTrack: (shape) => worker.postMessage({type: 'track', shape: shape}),
+        reset: () => worker.postMessage({type: 'reset'}),
+        clearTrails: () => worker.postMessage({type: 'clear_trails'})
+    };
+} else {
+    renderer = new RaceRenderer(canvas, renderMode);
+    if (renderMode !== 'events') {
+        const loop = (now) => {
+            renderer.render(now);
+            requestAnimationFrame(loop);
+        };
+        requestAnimationFrame(loop);
+    }
+    setInterval(() => showStats(renderer.stats(performance.now())), 1000);
+}
+
+function showStats(s) {
+    fpsOverlay.innerText = `${s.fps.toFixed(0)} fps | ${s.frame_ms.toFixed(2)} ms/frame (max ${s.max_ms.toFixed(1)})` +
+        ` | ${s.server_fps.toFixed(0)} server fps | ${s.cars} cars | ${s.mode}`;
+}
 
 // --- SOCKET EVENTS ---
 socket.on('connect', () => {
     console.log('Connected');
     document.title = "Connected - Race Sim Pro";
+    if (useBinary) socket.emit('set_protocol', {binary: true});
+    if (detailSelect.value !== 'full') socket.emit('set_detail', {level: detailSelect.value});
 });
 
-socket.on('update', (data) => {
-    cars = data.cars;
-    aliveEl.innerText = data.alive;
-    
-    // Process Updates (Trails & FX)
-    cars.forEach(car => {
-        // 1. Trails
-        if (!trails[car.id]) trails[car.id] = [];
-        
-        if (car.alive) {
-            trails[car.id].push({x: car.x, y: car.y});
-            if (trails[car.id].length > 100) trails[car.id].shift(); // Limit trail length
+socket.on('session', (data) => {
+    sessionEl.innerText = data.session;
+});
+
+socket.on('track', (data) => {
+    renderer.setTrack(data.centerline ? data : null);
+});
+
+socket.on('meta', (data) => {
+    meta = data;
+});
+
+// Frames are acked so the server can skip frames for a client that falls behind
+socket.on('frame', (buf, ack) => {
+    const data = decodeFrame(buf);
+    if (data) handleUpdate(data);
+    if (ack) ack();
+});
+
+// Binary frame layout is documented in protocol.py
+function decodeFrame(buf) {
+    const view = new DataView(buf);
+    const kind = view.getUint8(1);
+    const n = view.getUint16(2, true);
+    const steps = view.getUint32(8, true);
+    const alive = view.getUint16(12, true);
+    const nSensors = view.getUint8(14);
+    let off = 16;
+
+    const ids = new Uint16Array(buf, off, n); off += 2 * n;
+    if (kind === 0) {
+        const xs = new Uint16Array(buf, off, n); off += 2 * n;
+        const ys = new Uint16Array(buf, off, n); off += 2 * n;
+        const as = new Uint16Array(buf, off, n); off += 2 * n;
+        frameState = {
+            x: Int32Array.from(xs),
+            y: Int32Array.from(ys),
+            angle: Int32Array.from(as),
+            flags: new Uint8Array(buf.slice(off, off + n)),
+            sensors: new Uint8Array(buf.slice(off + n, off + n + n * nSensors)),
+            nSensors: nSensors
+        };
+    } else {
+        if (!frameState || frameState.nSensors !== nSensors) return null; // Wait for a keyframe
+        const dx = new Int8Array(buf, off, n); off += n;
+        const dy = new Int8Array(buf, off, n); off += n;
+        const da = new Int8Array(buf, off, n); off += n;
+        const flags = new Uint8Array(buf, off, n); off += n;
+        const sensors = new Uint8Array(buf, off, n * nSensors);
+        for (let k = 0; k < n; k++) {
+            const id = ids[k];
+            frameState.x[id] += dx[k];
+            frameState.y[id] += dy[k];
+            frameState.angle[id] = (frameState.angle[id] + da[k] + meta.angle_units) % meta.angle_units;
+            frameState.flags[id] = flags[k];
+            frameState.sensors.set(sensors.subarray(k * nSensors, (k + 1) * nSensors), id * nSensors);
         }
-        
-        // 2. Explosions
-        if (car.crashed) {
-            spawnExplosion(car.x, car.y, car.color);
+    }
+
+    // Rebuild the same car objects the JSON stream produces
+    const turn = 2 * Math.PI / meta.angle_units;
+    const decoded = [];
+    for (let id = 0; id < frameState.x.length; id++) {
+        const sensors = [];
+        for (let j = 0; j < frameState.nSensors; j++) {
+            sensors.push([frameState.sensors[id * frameState.nSensors + j], meta.sensor_angles[j]]);
         }
-    });
+        let angle = frameState.angle[id] * turn;
+        if (angle > Math.PI) angle -= 2 * Math.PI;
+        decoded.push({
+            id: id,
+            x: frameState.x[id] / meta.pos_scale,
+            y: frameState.y[id] / meta.pos_scale,
+            angle: angle,
+            alive: frameState.flags[id] & 1,
+            crashed: (frameState.flags[id] & 2) !== 0,
+            sensors: sensors,
+            color: meta.colors[id] || '#FFFFFF'
+        });
+    }
+    return {cars: decoded, alive: alive, steps: steps};
+}
+
+socket.on('update', (data, ack) => {
+    handleUpdate(data);
+    if (ack) ack();
+});
 
-    draw();
+// Level-of-detail frames: columns for the cars worth drawing, sensors and
+// trails for the top cars only (protocol.lod_frame)
+socket.on('lod', (data, ack) => {
+    const lodCars = [];
+    for (let k = 0; k < data.ids.length; k++) {
+        const id = data.ids[k];
+        const radars = data.sensors[id] || [];
+        lodCars.push({
+            id: id,
+            x: data.x[k],
+            y: data.y[k],
+            angle: data.angle[k],
+            alive: data.live[k],
+            crashed: data.crashed.includes(id),
+            sensors: radars.map((dist, j) => [dist, data.sensor_angles[j]]),
+            color: data.palette[id % data.palette.length]
+        });
+    }
+    handleUpdate({cars: lodCars, alive: data.alive, steps: data.steps, serverTrails: data.trails});
+    if (ack) ack();
 });
 
+function handleUpdate(data) {
+    aliveEl.innerText = data.alive;
+    // Trails and explosions are the renderer's, drawing happens on its own clock
+    renderer.push({cars: data.cars, serverTrails: data.serverTrails});
+}
+
 socket.on('reset', (data) => {
     generation = data.generation;
     genEl.innerText = generation;
-    // Clear trails on new gen
-    for (let key in trails) trails[key] = [];
-    particles = [];
+    renderer.reset();
 });
 
 socket.on('hard_reset', (data) => {
     generation = data.generation;
     genEl.innerText = generation;
-    // Clear trails
-    for (let key in trails) trails[key] = [];
-    particles = [];
+    renderer.reset();
     // Clear Log
     logBody.innerHTML = ''; 
 });
@@ -73,6 +221,42 @@ socket.on('pause_state', (data) => {
     }
 });
 
+socket.on('replay_state', (data) => {
+    replaying = data.playing;
+    replayBtn.classList.toggle('paused', replaying);
+    replayBtn.innerText = replaying ? '■' : '⏵';
+    if (data.error) console.warn('Replay:', data.error);
+});
+
+// --- FRAME PROFILE ---
+let profileTimer = null;
+
+function refreshProfile() {
+    fetch('/stats').then(r => r.json()).then(data => {
+        profileBody.innerHTML = '';
+        for (const [phase, p] of Object.entries(data.phases || {})) {
+            const row = document.createElement('tr');
+            row.innerHTML = `
+                <td>${phase}</td>
+                <td>${p.mean_ms.toFixed(3)}</td>
+                <td>${p.p50_ms.toFixed(3)}</td>
+                <td>${p.p90_ms.toFixed(3)}</td>
+                <td>${p.p99_ms.toFixed(3)}</td>
+                <td>${p.max_ms.toFixed(3)}</td>
+                <td>${p.count}</td>
+            `;
+            profileBody.appendChild(row);
+        }
+    }).catch(() => {});
+}
+
+socket.on('profiling_state', (data) => {
+    profileToggle.checked = data.enabled;
+    clearInterval(profileTimer);
+    profileTimer = data.enabled ? setInterval(refreshProfile, 1000) : null;
+    refreshProfile();
+});
+
 socket.on('gen_log', (data) => {
     // 1. Update Table
     const row = document.createElement('tr');
@@ -95,9 +279,7 @@ socket.on('gen_log', (data) => {
 socket.on('hard_reset', (data) => {
     generation = data.generation;
     genEl.innerText = generation;
-    // Clear trails
-    for (let key in trails) trails[key] = [];
-    particles = [];
+    renderer.reset();
     // Clear Log
     logBody.innerHTML = ''; 
     // Clear Chart
@@ -167,307 +349,38 @@ restartBtn.addEventListener('click', () => {
     }
 });
 
-speedRange.addEventListener('input', (e) => {
-    const val = e.target.value;
-    speedVal.innerText = val + 'x';
-    socket.emit('set_speed', {speed: val});
+detailSelect.value = pageParams.get('detail') || 'full';
+detailSelect.addEventListener('change', () => {
+    renderer.clearTrails();
+    socket.emit('set_detail', {level: detailSelect.value});
 });
 
-// --- 3D / ISO CONSTANTS ---
-const WALL_HEIGHT = 12; // Slightly lower for clean look
-const CAR_HEIGHT = 6;
-const CENTER_L = {x: 200, y: 300};
-const CENTER_R = {x: 600, y: 300};
-const R_OUT = 200;
-const R_IN = 100;
-
-function drawPseudo3DTrack() {
-    // 1. Draw "Walls" (Extrusion)
-    // We draw bottom-up
-    
-    for (let h = 0; h < WALL_HEIGHT; h++) {
-        let isTop = (h === WALL_HEIGHT - 1);
-        let yOffset = -h; 
-        
-        ctx.lineCap = 'round';
-        
-        if (isTop) {
-            ctx.shadowBlur = 0;
-            ctx.strokeStyle = '#b2bec3'; // Light Grey Top
-        } else {
-            // Side of wall (Darker gradient)
-            let shade = 100 + (h * 5); 
-            ctx.strokeStyle = `rgb(${shade}, ${shade}, ${shade})`;
-        }
-        
-        ctx.lineWidth = 2; // Thinner, crisper lines
-        
-        // Outer Path
-        ctx.beginPath();
-        ctx.arc(CENTER_R.x, CENTER_R.y + yOffset, R_OUT, -Math.PI/2, Math.PI/2); 
-        ctx.arc(CENTER_L.x, CENTER_L.y + yOffset, R_OUT, Math.PI/2, 3*Math.PI/2);
-        ctx.closePath();
-        ctx.stroke();
-
-        // Inner Path
-        ctx.beginPath();
-        ctx.arc(CENTER_R.x, CENTER_R.y + yOffset, R_IN, -Math.PI/2, Math.PI/2);
-        ctx.arc(CENTER_L.x, CENTER_L.y + yOffset, R_IN, Math.PI/2, 3*Math.PI/2);
-        ctx.closePath();
-        ctx.stroke();
-    }
-    
-    // Fill the Track Surface (Ground) at Base Level
-    ctx.globalCompositeOperation = 'destination-over'; 
-    
-    // Outer Fill (Asphalt)
-    ctx.fillStyle = '#2d3436'; // Dark Asphalt
-    ctx.beginPath();
-    ctx.arc(CENTER_R.x, CENTER_R.y, R_OUT, -Math.PI/2, Math.PI/2);
-    ctx.arc(CENTER_L.x, CENTER_L.y, R_OUT, Math.PI/2, 3*Math.PI/2);
-    ctx.closePath();
-    ctx.fill();
-
-    // -- TRACK MARKINGS (Lane Lines) --
-    // We draw a dashed line in the center (Radius = 150)
-    ctx.globalCompositeOperation = 'source-over'; // Draw ON TOP of asphalt
-    
-    ctx.beginPath();
-    ctx.arc(CENTER_R.x, CENTER_R.y, 150, -Math.PI/2, Math.PI/2);
-    ctx.arc(CENTER_L.x, CENTER_L.y, 150, Math.PI/2, 3*Math.PI/2);
-    ctx.closePath();
-    ctx.strokeStyle = 'rgba(255, 255, 255, 0.5)';
-    ctx.lineWidth = 2;
-    ctx.setLineDash([15, 15]); // Dashed line
-    ctx.stroke();
-    ctx.setLineDash([]); // Reset
-    
-    // -- SOLID EDGES (White Lines) --
-    // Outer Edge (White Line)
-    ctx.beginPath();
-    ctx.arc(CENTER_R.x, CENTER_R.y, R_OUT - 5, -Math.PI/2, Math.PI/2);
-    ctx.arc(CENTER_L.x, CENTER_L.y, R_OUT - 5, Math.PI/2, 3*Math.PI/2);
-    ctx.closePath();
-    ctx.strokeStyle = '#ffffff';
-    ctx.lineWidth = 2;
-    ctx.stroke();
-    
-    // Inner Edge (White Line)
-    ctx.beginPath();
-    ctx.arc(CENTER_R.x, CENTER_R.y, R_IN + 5, -Math.PI/2, Math.PI/2);
-    ctx.arc(CENTER_L.x, CENTER_L.y, R_IN + 5, Math.PI/2, 3*Math.PI/2);
-    ctx.closePath();
-    ctx.stroke();
-
-    // Inner Hole (Clear/Bg) - Fill with Canvas BG
-    ctx.globalCompositeOperation = 'source-over'; 
-    ctx.fillStyle = '#e0e5ec'; // Match page background
-    
-    ctx.beginPath();
-    ctx.arc(CENTER_R.x, CENTER_R.y, R_IN, -Math.PI/2, Math.PI/2);
-    ctx.arc(CENTER_L.x, CENTER_L.y, R_IN, Math.PI/2, 3*Math.PI/2);
-    ctx.closePath();
-    ctx.fill();
-    
-    // Finish Line (Checkerboard)
-    let fx = 400;
-    let fy_start = 100; // Top Straight Y range: 100-200 (Center 150)
-    
-    // Draw 3 rows of checks
-    for(let r=0; r<3; r++) {
-         for(let i=0; i<10; i++) { // 100px width / 10px = 10 cols
-             let y = fy_start + i*10;
-             let x = fx + r*6 - 9; // Width of line
-             let isWhite = (i+r)%2===0;
-             ctx.fillStyle = isWhite ? '#fff' : '#000';
-             ctx.fillRect(x, y, 6, 10);
-         }
-    }
-}
-
-function drawPseudo3DCar(car) {
-    if (!car.alive) return;
-
-    // --- SENSOR FOV (Active RADAR) ---
-    // Remove fake cone, draw functional beams
-    
-    if (car.sensors && car.sensors.length > 0) {
-        ctx.save();
-        ctx.translate(car.x, car.y);
-        ctx.rotate(car.angle);
-        
-        car.sensors.forEach(sensor => {
-           let dist = sensor[0];
-           let angle = sensor[1];
-           let maxDist = 200;
-           
-           let endX = Math.cos(angle) * dist;
-           let endY = Math.sin(angle) * dist;
-           
-           // Color Logic: HSL transition
-           // 100% (200px) = 120 (Green)
-           // 0% (0px) = 0 (Red)
-           let normalized = Math.max(0, Math.min(1, dist / maxDist));
-           let hue = normalized * 120; 
-           let color = `hsla(${hue}, 100%, 50%, 0.8)`;
-           
-           // Ray (Gradient)
-           let grd = ctx.createLinearGradient(0, 0, endX, endY);
-           grd.addColorStop(0, `hsla(${hue}, 100%, 50%, 0.1)`); // Faint at car
-           grd.addColorStop(1, color); // Bright at wall
-           
-           ctx.beginPath();
-           ctx.moveTo(0,0);
-           ctx.lineTo(endX, endY);
-           ctx.strokeStyle = grd;
-           ctx.lineWidth = 1.5;
-           ctx.stroke();
-           
-           // Hit Marker (If hit wall)
-           if (dist < maxDist - 5) {
-                // Glow
-                ctx.shadowBlur = 10;
-                ctx.shadowColor = color;
-                
-                // Outer Ring
-                ctx.beginPath();
-                ctx.arc(endX, endY, 3, 0, Math.PI*2);
-                ctx.strokeStyle = color;
-                ctx.stroke();
-                
-                // Inner Dot
-                ctx.fillStyle = '#fff';
-                ctx.beginPath();
-                ctx.arc(endX, endY, 1.5, 0, Math.PI*2);
-                ctx.fill();
-                
-                ctx.shadowBlur = 0; // Reset
-           }
-        });
-        
-        ctx.restore();
-    }
-
-    // --- 3D CAR BODY ---
-    // Minimalist, Clean Shading
-    
-    let carColor = car.color;
-    
-    ctx.save();
-    ctx.translate(car.x, car.y);
-    ctx.rotate(car.angle);
-
-    // Casting Shadow (Drop shadow on ground)
-    ctx.fillStyle = 'rgba(0,0,0,0.2)';
-    ctx.beginPath();
-    ctx.moveTo(12, 0); ctx.lineTo(-10, 8); ctx.lineTo(-10, -8);
-    ctx.closePath();
-    ctx.fill();
-
-    // Car Layers
-    for(let h=0; h<CAR_HEIGHT; h++) {
-        let isTop = (h === CAR_HEIGHT - 1);
-        let scale = 1.0 - (h*0.03); 
-        
-        ctx.save();
-        ctx.translate(0, -h); 
-        ctx.scale(scale, scale);
-        
-        ctx.fillStyle = carColor;
-        
-        if (!isTop) {
-            // Darken sides
-            ctx.filter = 'brightness(70%)';
-        } else {
-             ctx.filter = 'brightness(110%)'; // Highlight top
-        }
-
-        ctx.beginPath();
-        // Slightly more distinct F1 shape
-        ctx.moveTo(14, 0); // Nose
-        ctx.lineTo(-6, 8); // Rear R
-        ctx.lineTo(-6, -8); // Rear L
-        ctx.closePath();
-        ctx.fill();
-        
-        ctx.restore();
-    }
-    
-    // Cockpit
-    ctx.translate(0, -CAR_HEIGHT);
-    ctx.fillStyle = '#2d3436';
-    ctx.beginPath();
-    ctx.moveTo(4, 0); ctx.lineTo(-2, 3); ctx.lineTo(-2, -3);
-    ctx.fill();
-    
-    ctx.restore();
-}
-
-function spawnExplosion(x, y, color) {
-    for (let i = 0; i < 20; i++) {
-        particles.push({
-            x: x,
-            y: y,
-            vx: (Math.random() - 0.5) * 8, // Random velocity
-            vy: (Math.random() - 0.5) * 8,
-            life: 1.0,
-            color: color
-        });
-    }
-}
-
-function drawParticles() {
-    for (let i = particles.length - 1; i >= 0; i--) {
-        let p = particles[i];
-        p.x += p.vx;
-        p.y += p.vy;
-        p.life -= 0.05; // Fade out
-        
-        if (p.life <= 0) {
-            particles.splice(i, 1);
-            continue;
-        }
-        
-        ctx.globalAlpha = p.life;
-        ctx.fillStyle = p.color;
-        ctx.beginPath();
-        ctx.arc(p.x, p.y, 4 * p.life, 0, Math.PI * 2);
-        ctx.fill();
-        ctx.globalAlpha = 1.0;
-    }
-}
+replayBtn.addEventListener('click', () => {
+    if (replaying) socket.emit('stop_replay');
+    else socket.emit('play_replay', {generation: replayGen.value});
+});
 
-function drawTrail(carId, color) {
-    const path = trails[carId];
-    if (!path || path.length < 2) return;
-    
-    ctx.beginPath();
-    ctx.moveTo(path[0].x, path[0].y);
-    for (let i = 1; i < path.length; i++) {
-       ctx.lineTo(path[i].x, path[i].y);
-    }
-    
-    ctx.strokeStyle = color;
-    ctx.lineWidth = 1;
-    ctx.globalAlpha = 0.5; // Transparent trails
-    ctx.stroke();
-    ctx.globalAlpha = 1.0;
-}
+profileToggle.addEventListener('change', () => {
+    socket.emit('set_profiling', {enabled: profileToggle.checked});
+});
 
-function draw() {
-    ctx.clearRect(0, 0, canvas.width, canvas.height);
-    
-    drawPseudo3DTrack();
-    
-    // Draw Trails (Below cars)
-    cars.forEach(car => {
-        drawTrail(car.id, car.color);
+sampleBtn.addEventListener('click', () => {
+    sampleBtn.disabled = true;
+    profileSample.innerText = 'Sampling...';
+    fetch('/profile?frames=300').then(r => r.text()).then(text => {
+        // Collapsed stacks, show the hottest ones by their innermost frames
+        profileSample.innerText = text.trim().split('\n').slice(0, 15)
+            .map(line => line.split(';').slice(-3).reverse().join(' ← '))
+            .join('\n');
+    }).catch(e => {
+        profileSample.innerText = String(e);
+    }).finally(() => {
+        sampleBtn.disabled = false;
     });
-    
-    // Sort cars for Z-order
-    let sortedCars = [...cars].sort((a,b) => a.y - b.y);
-    sortedCars.forEach(drawPseudo3DCar);
-    
-    // Draw Explosions (Top layer)
-    drawParticles();
-}
+});
+
+speedRange.addEventListener('input', (e) => {
+    const val = e.target.value;
+    speedVal.innerText = val + 'x';
+    socket.emit('set_speed', {speed: val});
+});
@@ -0,0 +1,504 @@
+// Canvas renderer, shared by the page and the render worker (?render=worker).
+// Server frames are buffered as they arrive and drawn one frame interval
+// behind the newest, interpolating cars between the two frames around that
+// time, so drawing runs at the display's rate however the frames arrive.
+// The track is drawn once to a cached layer and copied in every frame.
+
+// --- 3D / ISO CONSTANTS ---
+const WALL_HEIGHT = 12; // Slightly lower for clean look
+const CAR_HEIGHT = 6;
+const CENTER_L = {x: 200, y: 300};
+const CENTER_R = {x: 600, y: 300};
+const R_OUT = 200;
+const R_IN = 100;
+const TRAIL_LENGTH = 100;
+const TELEPORT = 50; // A car that moved further between frames was reset, don't interpolate
+
+function makeLayer(width, height) {
+    if (typeof OffscreenCanvas !== 'undefined') return new OffscreenCanvas(width, height);
+    const layer = document.createElement('canvas');
+    layer.width = width;
+    layer.height = height;
+    return layer;
+}
+
+class RaceRenderer {
+    // mode: 'raf' (interpolated, cached track), 'worker' (the same, in a
+    // Web Worker) or 'events' (the old renderer: everything redrawn on
+    // every server frame)
+    constructor(canvas, mode) {
+        this.canvas = canvas;
+        this.ctx = canvas.getContext('2d');
+        this.mode = mode || 'raf';
+        this.trackShape = null; // Centerline of a spline track, null for the built-in stadium
+        this.trackLayer = null; // Cached track drawing, cleared when the track changes
+        this.frames = []; // {time, cars}, oldest first
+        this.interval = 1000 / 30; // Smoothed ms between server frames
+        this.trails = {}; // Store paths: {id: [{x,y}, ...]}
+        this.particles = []; // Explosion particles
+        this.lastRender = 0;
+
+        // FPS overlay numbers, counted over the last second
+        this.windowStart = 0;
+        this.drawn = 0;
+        this.received = 0;
+        this.drawMs = 0;
+        this.maxMs = 0;
+        this.latest = {fps: 0, frame_ms: 0, max_ms: 0, server_fps: 0, cars: 0, mode: this.mode};
+    }
+
+    setTrack(shape) {
+        this.trackShape = shape;
+        this.trackLayer = null;
+    }
+
+    reset() {
+        // Clear trails on new gen
+        for (let key in this.trails) this.trails[key] = [];
+        this.particles = [];
+    }
+
+    clearTrails() {
+        for (let key in this.trails) delete this.trails[key];
+    }
+
+    // data: {cars, serverTrails} from any of the three frame streams.
+    // serverTrails ({id: [x0, y0, x1, y1, ...]}) replaces the local trails.
+    push(data) {
+        const now = performance.now();
+        const cars = data.cars;
+        const trails = this.trails;
+
+        if (data.serverTrails) {
+            this.clearTrails();
+            for (const id in data.serverTrails) {
+                const flat = data.serverTrails[id];
+                const path = [];
+                for (let i = 0; i + 1 < flat.length; i += 2) path.push({x: flat[i], y: flat[i + 1]});
+                trails[id] = path;
+            }
+        }
+
+        // Process Updates (Trails & FX)
+        cars.forEach(car => {
+            // 1. Trails
+            if (!data.serverTrails) {
+                if (!trails[car.id]) trails[car.id] = [];
+                if (car.alive) {
+                    trails[car.id].push({x: car.x, y: car.y});
+                    if (trails[car.id].length > TRAIL_LENGTH) trails[car.id].shift(); // Limit trail length
+                }
+            }
+
+            // 2. Explosions
+            if (car.crashed) {
+                this.spawnExplosion(car.x, car.y, car.color);
+            }
+        });
+
+        const last = this.frames[this.frames.length - 1];
+        if (last) this.interval = 0.8 * this.interval + 0.2 * Math.min(now - last.time, 250);
+        this.frames.push({time: now, cars: cars});
+        if (this.frames.length > 4) this.frames.shift();
+        this.received++;
+
+        if (this.mode === 'events') this.render(now);
+    }
+
+    // Cars as they were at `time`, between the two buffered frames around it
+    carsAt(time) {
+        const frames = this.frames;
+        let k = frames.length - 1;
+        while (k > 0 && frames[k - 1].time > time) k--;
+        const next = frames[k];
+        const prev = frames[k - 1];
+        if (!prev || time >= next.time) return next.cars;
+
+        const alpha = Math.max(0, (time - prev.time) / (next.time - prev.time));
+        const before = [];
+        prev.cars.forEach(car => { before[car.id] = car; });
+        return next.cars.map(car => {
+            const p = before[car.id];
+            if (!p || !p.alive || !car.alive) return car;
+            const dx = car.x - p.x;
+            const dy = car.y - p.y;
+            if (Math.abs(dx) > TELEPORT || Math.abs(dy) > TELEPORT) return car;
+            let da = car.angle - p.angle;
+            if (da > Math.PI) da -= 2 * Math.PI;
+            else if (da < -Math.PI) da += 2 * Math.PI;
+            return Object.assign({}, car, {
+                x: p.x + dx * alpha,
+                y: p.y + dy * alpha,
+                angle: p.angle + da * alpha
+            });
+        });
+    }
+
+    render(now) {
+        const started = performance.now();
+        const step = this.lastRender ? Math.min((now - this.lastRender) / (1000 / 60), 4) : 1;
+        this.lastRender = now;
+        const ctx = this.ctx;
+        if (!this.frames.length) return;
+
+        let cars;
+        if (this.mode === 'events') {
+            cars = this.frames[this.frames.length - 1].cars;
+            ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
+            if (this.trackShape) drawSplineTrack(ctx, this.trackShape);
+            else drawPseudo3DTrack(ctx);
+        } else {
+            cars = this.carsAt(now - this.interval);
+            if (!this.trackLayer) {
+                this.trackLayer = makeLayer(this.canvas.width, this.canvas.height);
+                const layerCtx = this.trackLayer.getContext('2d');
+                if (this.trackShape) drawSplineTrack(layerCtx, this.trackShape);
+                else drawPseudo3DTrack(layerCtx);
+            }
+            ctx.clearRect(0, 0, this.canvas.width, this.canvas.height);
+            ctx.drawImage(this.trackLayer, 0, 0);
+        }
+
+        // Draw Trails (Below cars)
+        cars.forEach(car => {
+            drawTrail(ctx, this.trails[car.id], car.color);
+        });
+
+        // Sort cars for Z-order
+        let sortedCars = [...cars].sort((a,b) => a.y - b.y);
+        sortedCars.forEach(car => drawPseudo3DCar(ctx, car));
+
+        // Draw Explosions (Top layer)
+        this.drawParticles(step);
+
+        const ms = performance.now() - started;
+        this.drawn++;
+        this.drawMs += ms;
+        this.maxMs = Math.max(this.maxMs, ms);
+        this.latest.cars = cars.length;
+    }
+
+    // Overlay numbers, rolled over once a second
+    stats(now) {
+        if (now - this.windowStart >= 1000) {
+            const seconds = (now - this.windowStart) / 1000;
+            Object.assign(this.latest, {
+                fps: this.drawn / seconds,
+                frame_ms: this.drawn ? this.drawMs / this.drawn : 0,
+                max_ms: this.maxMs,
+                server_fps: this.received / seconds
+            });
+            this.windowStart = now;
+            this.drawn = this.received = this.drawMs = this.maxMs = 0;
+        }
+        return this.latest;
+    }
+
+    spawnExplosion(x, y, color) {
+        for (let i = 0; i < 20; i++) {
+            this.particles.push({
+                x: x,
+                y: y,
+                vx: (Math.random() - 0.5) * 8, // Random velocity
+                vy: (Math.random() - 0.5) * 8,
+                life: 1.0,
+                color: color
+            });
+        }
+    }
+
+    // step: elapsed time in 60 Hz frames, so particles age the same at any frame rate
+    drawParticles(step) {
+        const ctx = this.ctx;
+        const particles = this.particles;
+        for (let i = particles.length - 1; i >= 0; i--) {
+            let p = particles[i];
+            p.x += p.vx * step;
+            p.y += p.vy * step;
+            p.life -= 0.05 * step; // Fade out
+
+            if (p.life <= 0) {
+                particles.splice(i, 1);
+                continue;
+            }
+
+            ctx.globalAlpha = p.life;
+            ctx.fillStyle = p.color;
+            ctx.beginPath();
+            ctx.arc(p.x, p.y, 4 * p.life, 0, Math.PI * 2);
+            ctx.fill();
+            ctx.globalAlpha = 1.0;
+        }
+    }
+}
+
+function drawPseudo3DTrack(ctx) {
+    // 1. Draw "Walls" (Extrusion)
+    // We draw bottom-up
+
+    for (let h = 0; h < WALL_HEIGHT; h++) {
+        let isTop = (h === WALL_HEIGHT - 1);
+        let yOffset = -h;
+
+        ctx.lineCap = 'round';
+
+        if (isTop) {
+            ctx.shadowBlur = 0;
+            ctx.strokeStyle = '#b2bec3'; // Light Grey Top
+        } else {
+            // Side of wall (Darker gradient)
+            let shade = 100 + (h * 5);
+            ctx.strokeStyle = `rgb(${shade}, ${shade}, ${shade})`;
+        }
+
+        ctx.lineWidth = 2; // Thinner, crisper lines
+
+        // Outer Path
+        ctx.beginPath();
+        ctx.arc(CENTER_R.x, CENTER_R.y + yOffset, R_OUT, -Math.PI/2, Math.PI/2);
+        ctx.arc(CENTER_L.x, CENTER_L.y + yOffset, R_OUT, Math.PI/2, 3*Math.PI/2);
+        ctx.closePath();
+        ctx.stroke();
+
+        // Inner Path
+        ctx.beginPath();
+        ctx.arc(CENTER_R.x, CENTER_R.y + yOffset, R_IN, -Math.PI/2, Math.PI/2);
+        ctx.arc(CENTER_L.x, CENTER_L.y + yOffset, R_IN, Math.PI/2, 3*Math.PI/2);
+        ctx.closePath();
+        ctx.stroke();
+    }
+
+    // Fill the Track Surface (Ground) at Base Level
+    ctx.globalCompositeOperation = 'destination-over';
+
+    // Outer Fill (Asphalt)
+    ctx.fillStyle = '#2d3436'; // Dark Asphalt
+    ctx.beginPath();
+    ctx.arc(CENTER_R.x, CENTER_R.y, R_OUT, -Math.PI/2, Math.PI/2);
+    ctx.arc(CENTER_L.x, CENTER_L.y, R_OUT, Math.PI/2, 3*Math.PI/2);
+    ctx.closePath();
+    ctx.fill();
+
+    // -- TRACK MARKINGS (Lane Lines) --
+    // We draw a dashed line in the center (Radius = 150)
+    ctx.globalCompositeOperation = 'source-over'; // Draw ON TOP of asphalt
+
+    ctx.beginPath();
+    ctx.arc(CENTER_R.x, CENTER_R.y, 150, -Math.PI/2, Math.PI/2);
+    ctx.arc(CENTER_L.x, CENTER_L.y, 150, Math.PI/2, 3*Math.PI/2);
+    ctx.closePath();
+    ctx.strokeStyle = 'rgba(255, 255, 255, 0.5)';
+    ctx.lineWidth = 2;
+    ctx.setLineDash([15, 15]); // Dashed line
+    ctx.stroke();
+    ctx.setLineDash([]); // Reset
+
+    // -- SOLID EDGES (White Lines) --
+    // Outer Edge (White Line)
+    ctx.beginPath();
+    ctx.arc(CENTER_R.x, CENTER_R.y, R_OUT - 5, -Math.PI/2, Math.PI/2);
+    ctx.arc(CENTER_L.x, CENTER_L.y, R_OUT - 5, Math.PI/2, 3*Math.PI/2);
+    ctx.closePath();
+    ctx.strokeStyle = '#ffffff';
+    ctx.lineWidth = 2;
+    ctx.stroke();
+
+    // Inner Edge (White Line)
+    ctx.beginPath();
+    ctx.arc(CENTER_R.x, CENTER_R.y, R_IN + 5, -Math.PI/2, Math.PI/2);
+    ctx.arc(CENTER_L.x, CENTER_L.y, R_IN + 5, Math.PI/2, 3*Math.PI/2);
+    ctx.closePath();
+    ctx.stroke();
+
+    // Inner Hole (Clear/Bg) - Fill with Canvas BG
+    ctx.globalCompositeOperation = 'source-over';
+    ctx.fillStyle = '#e0e5ec'; // Match page background
+
+    ctx.beginPath();
+    ctx.arc(CENTER_R.x, CENTER_R.y, R_IN, -Math.PI/2, Math.PI/2);
+    ctx.arc(CENTER_L.x, CENTER_L.y, R_IN, Math.PI/2, 3*Math.PI/2);
+    ctx.closePath();
+    ctx.fill();
+
+    // Finish Line (Checkerboard)
+    let fx = 400;
+    let fy_start = 100; // Top Straight Y range: 100-200 (Center 150)
+
+    // Draw 3 rows of checks
+    for(let r=0; r<3; r++) {
+         for(let i=0; i<10; i++) { // 100px width / 10px = 10 cols
+             let y = fy_start + i*10;
+             let x = fx + r*6 - 9; // Width of line
+             let isWhite = (i+r)%2===0;
+             ctx.fillStyle = isWhite ? '#fff' : '#000';
+             ctx.fillRect(x, y, 6, 10);
+         }
+    }
+}
+
+function drawSplineTrack(ctx, shape) {
+    // Tracks other than the stadium: stroke the centerline at track width
+    const tracePath = () => {
+        ctx.beginPath();
+        shape.centerline.forEach(([x, y], i) => i ? ctx.lineTo(x, y) : ctx.moveTo(x, y));
+        ctx.closePath();
+    };
+    ctx.lineJoin = 'round';
+    tracePath();
+    ctx.strokeStyle = '#b2bec3'; // Walls
+    ctx.lineWidth = shape.width + 4;
+    ctx.stroke();
+    ctx.strokeStyle = '#2d3436'; // Asphalt
+    ctx.lineWidth = shape.width;
+    ctx.stroke();
+
+    // Dashed center line
+    ctx.strokeStyle = 'rgba(255, 255, 255, 0.5)';
+    ctx.lineWidth = 2;
+    ctx.setLineDash([15, 15]);
+    ctx.stroke();
+    ctx.setLineDash([]);
+
+    // Finish Line
+    const [x1, y1, x2, y2] = shape.finish;
+    ctx.beginPath();
+    ctx.moveTo(x1, y1);
+    ctx.lineTo(x2, y2);
+    ctx.strokeStyle = '#ffffff';
+    ctx.lineWidth = 6;
+    ctx.stroke();
+}
+
+function drawPseudo3DCar(ctx, car) {
+    if (!car.alive) return;
+
+    // --- SENSOR FOV (Active RADAR) ---
+    // Remove fake cone, draw functional beams
+
+    if (car.sensors && car.sensors.length > 0) {
+        ctx.save();
+        ctx.translate(car.x, car.y);
+        ctx.rotate(car.angle);
+
+        car.sensors.forEach(sensor => {
+           let dist = sensor[0];
+           let angle = sensor[1];
+           let maxDist = 200;
+
+           let endX = Math.cos(angle) * dist;
+           let endY = Math.sin(angle) * dist;
+
+           // Color Logic: HSL transition
+           // 100% (200px) = 120 (Green)
+           // 0% (0px) = 0 (Red)
+           let normalized = Math.max(0, Math.min(1, dist / maxDist));
+           let hue = normalized * 120;
+           let color = `hsla(${hue}, 100%, 50%, 0.8)`;
+
+           // Ray (Gradient)
+           let grd = ctx.createLinearGradient(0, 0, endX, endY);
+           grd.addColorStop(0, `hsla(${hue}, 100%, 50%, 0.1)`); // Faint at car
+           grd.addColorStop(1, color); // Bright at wall
+
+           ctx.beginPath();
+           ctx.moveTo(0,0);
+           ctx.lineTo(endX, endY);
+           ctx.strokeStyle = grd;
+           ctx.lineWidth = 1.5;
+           ctx.stroke();
+
+           // Hit Marker (If hit wall)
+           if (dist < maxDist - 5) {
+                // Glow
+                ctx.shadowBlur = 10;
+                ctx.shadowColor = color;
+
+                // Outer Ring
+                ctx.beginPath();
+                ctx.arc(endX, endY, 3, 0, Math.PI*2);
+                ctx.strokeStyle = color;
+                ctx.stroke();
+
+                // Inner Dot
+                ctx.fillStyle = '#fff';
+                ctx.beginPath();
+                ctx.arc(endX, endY, 1.5, 0, Math.PI*2);
+                ctx.fill();
+
+                ctx.shadowBlur = 0; // Reset
+           }
+        });
+
+        ctx.restore();
+    }
+
+    // --- 3D CAR BODY ---
+    // Minimalist, Clean Shading
+
+    let carColor = car.color;
+
+    ctx.save();
+    ctx.translate(car.x, car.y);
+    ctx.rotate(car.angle);
+
+    // Casting Shadow (Drop shadow on ground)
+    ctx.fillStyle = 'rgba(0,0,0,0.2)';
+    ctx.beginPath();
+    ctx.moveTo(12, 0); ctx.lineTo(-10, 8); ctx.lineTo(-10, -8);
+    ctx.closePath();
+    ctx.fill();
+
+    // Car Layers
+    for(let h=0; h<CAR_HEIGHT; h++) {
+        let isTop = (h === CAR_HEIGHT - 1);
+        let scale = 1.0 - (h*0.03);
+
+        ctx.save();
+        ctx.translate(0, -h);
+        ctx.scale(scale, scale);
+
+        ctx.fillStyle = carColor;
+
+        if (!isTop) {
+            // Darken sides
+            ctx.filter = 'brightness(70%)';
+        } else {
+             ctx.filter = 'brightness(110%)'; // Highlight top
+        }
+
+        ctx.beginPath();
+        // Slightly more distinct F1 shape
+        ctx.moveTo(14, 0); // Nose
+        ctx.lineTo(-6, 8); // Rear R
+        ctx.lineTo(-6, -8); // Rear L
+        ctx.closePath();
+        ctx.fill();
+
+        ctx.restore();
+    }
+
+    // Cockpit
+    ctx.translate(0, -CAR_HEIGHT);
+    ctx.fillStyle = '#2d3436';
+    ctx.beginPath();
+    ctx.moveTo(4, 0); ctx.lineTo(-2, 3); ctx.lineTo(-2, -3);
+    ctx.fill();
+
+    ctx.restore();
+}
+
+function drawTrail(ctx, path, color) {
+    if (!path || path.length < 2) return;
+
+    ctx.beginPath();
+    ctx.moveTo(path[0].x, path[0].y);
+    for (let i = 1; i < path.length; i++) {
+       ctx.lineTo(path[i].x, path[i].y);
+    }
+
+    ctx.strokeStyle = color;
+    ctx.lineWidth = 1;
+    ctx.globalAlpha = 0.5; // Transparent trails
+    ctx.stroke();
+    ctx.globalAlpha = 1.0;
+}
@@ -0,0 +1,38 @@
+// Draws the race on an OffscreenCanvas handed over by the page (?render=worker),
+// so drawing never competes with socket handling and the charts on the main thread.
+importScripts('render.js');
+
+let renderer = null;
+
+const nextFrame = self.requestAnimationFrame
+    ? (fn) => self.requestAnimationFrame(fn)
+    : (fn) => setTimeout(() => fn(performance.now()), 1000 / 60);
+
+function loop(now) {
+    renderer.render(now);
+    nextFrame(loop);
+}
+
+self.onmessage = (e) => {
+    const msg = e.data;
+    switch (msg.type) {
+        case 'init':
+            renderer = new RaceRenderer(msg.canvas, 'worker');
+            nextFrame(loop);
+            // The overlay lives on the page, send it the numbers
+            setInterval(() => self.postMessage({type: 'stats', stats: renderer.stats(performance.now())}), 1000);
+            break;
+        case 'frame':
+            renderer.push(msg.data);
+            break;
+        case 'track':
+            renderer.setTrack(msg.shape);
+            break;
+        case 'reset':
+            renderer.reset();
+            break;
+        case 'clear_trails':
+            renderer.clearTrails();
+            break;
+    }
+};